@@ -0,0 +1,180 @@
+"""
+Benchmark del serializador de checkpoints (common.checkpoint_serde) contra el JSON del saver.
+
+Toma los objetos que LangGraph serializa (valores de canal, writes, metadata) de hilos reales
+de loans e investment y mide, por formato, bytes totales y µs de encode/decode por objeto:
+
+- por defecto reproduce los escenarios de bench.replay de esos servicios (LLM fake, core falso);
+- con --redis muestrea checkpoints y writes ya guardados en REDIS_URL (documentos RedisJSON).
+
+Antes de medir chequea la compatibilidad con los hilos ya guardados: lo que escribió el saver
+de langgraph-checkpoint-redis (JsonPlusRedisSerializer: writes, y canales inline en el
+documento) se lee igual con CompactSerializer.loads_typed y con CompactAsyncRedisSaver, y
+lo escrito en modo compacto se lee con CHECKPOINT_SERDE=json. Sale con código 1 si algún objeto
+no vuelve igual (p. ej. tras actualizar langgraph-checkpoint-redis, cuyos métodos privados
+pisa el saver compacto).
+
+    python -m bench.checkpoint_bench [--scenarios bench/scenarios/sample.jsonl] [--redis --sample 500]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+
+from langgraph.checkpoint.redis import AsyncRedisSaver
+from langgraph.checkpoint.redis.jsonplus_redis import JsonPlusRedisSerializer
+
+from bench.replay import DEFAULT_SCENARIOS, DEFAULT_SCRIPT, load_scenarios, run_scenarios
+from common.checkpoint_serde import CHECKPOINT_COMPRESS_MIN_BYTES, CompactAsyncRedisSaver, CompactSerializer, codec
+
+_SERVICES = ("loans", "investment")
+
+
+def from_replay(path: str, script: str) -> list:
+    scenarios = [s for s in load_scenarios(path) if s["service"] in _SERVICES]
+    captured: list = []
+    asyncio.run(run_scenarios(scenarios, "recorded", script, capture=captured))
+    return captured
+
+
+def from_redis(sample: int) -> list:
+    """Valores de canal y writes de los documentos guardados (se revive con el saver compacto)."""
+    from common.redis_config import REDIS_URL, get_redis_sync
+
+    saver = CompactAsyncRedisSaver(redis_url=REDIS_URL)
+    client = get_redis_sync()
+    objs: list = []
+    for pattern in ("checkpoint:*", "checkpoint_write:*"):
+        taken = 0
+        for key in client.scan_iter(match=pattern, count=500):
+            if taken >= sample:
+                break
+            doc = client.json().get(key)
+            if not isinstance(doc, dict):
+                continue
+            taken += 1
+            if "blob" in doc and "type" in doc:
+                objs.append(saver.serde.loads_typed((doc["type"], saver._decode_blob(doc["blob"]))))
+            elif isinstance(doc.get("checkpoint"), dict):
+                values = doc["checkpoint"].get("channel_values") or {}
+                objs.extend(saver._recursive_deserialize(values).values())
+    return [o for o in objs if o is not None]
+
+
+def _document(saver, objs: list) -> dict:
+    """Documento del checkpoint como lo guarda `saver`, con un canal por objeto."""
+    checkpoint = {
+        "v": 1,
+        "id": "compat",
+        "ts": "",
+        "channel_values": {f"c{i}": obj for i, obj in enumerate(objs)},
+        "channel_versions": {},
+        "versions_seen": {},
+    }
+    return saver._dump_checkpoint(checkpoint)["channel_values"]
+
+
+def _plain(obj):
+    """JSON y msgpack devuelven las tuplas (p. ej. los Interrupt pendientes) como listas."""
+    if isinstance(obj, (list, tuple)):
+        return [_plain(o) for o in obj]
+    if isinstance(obj, dict):
+        return {k: _plain(v) for k, v in obj.items()}
+    return obj
+
+
+def check_compat(objs: list) -> list[str]:
+    """Formatos que tienen que seguir leyéndose; retorna los que fallaron."""
+    from common.redis_config import REDIS_URL
+
+    legacy, legacy_saver = JsonPlusRedisSerializer(), AsyncRedisSaver(redis_url=REDIS_URL)
+    compact, json_mode = CompactSerializer(compact=True), CompactSerializer(compact=False)
+    saver = CompactAsyncRedisSaver(redis_url=REDIS_URL)
+    old_doc = _document(legacy_saver, objs)
+    # (leído, esperado). Los canales inline se comparan con lo que lee el saver original: el
+    # documento JSON no revive todo (p. ej. Interrupt, que en la práctica va en los writes).
+    cases = {
+        "writes json → loads_typed compacto": ([compact.loads_typed(legacy.dumps_typed(o)) for o in objs], objs),
+        "writes compactos → loads_typed json": ([json_mode.loads_typed(compact.dumps_typed(o)) for o in objs], objs),
+        "canales inline → saver compacto": (
+            list(saver._recursive_deserialize(old_doc).values()),
+            list(legacy_saver._recursive_deserialize(old_doc).values()),
+        ),
+    }
+    failed = []
+    for name, (loaded, expected) in cases.items():
+        bad = sum(1 for got, want in zip(loaded, expected) if _plain(got) != _plain(want))
+        bad += abs(len(loaded) - len(expected))
+        print(f"{'ok  ' if not bad else 'FAIL'} {name}: {len(expected) - bad}/{len(expected)}")
+        if bad:
+            failed.append(name)
+    return failed
+
+
+def measure(objs: list, name: str, dumps, loads) -> dict:
+    encoded = []
+    started = time.perf_counter()
+    for obj in objs:
+        encoded.append(dumps(obj))
+    enc_s = time.perf_counter() - started
+    started = time.perf_counter()
+    for item in encoded:
+        loads(item)
+    dec_s = time.perf_counter() - started
+    return {
+        "formato": name,
+        "bytes": sum(len(data) for _, data in encoded),
+        "enc_us": enc_s / len(objs) * 1e6,
+        "dec_us": dec_s / len(objs) * 1e6,
+    }
+
+
+def run(objs: list, min_bytes: int) -> list[dict]:
+    baseline = CompactSerializer(compact=False)
+    rows = [measure(objs, "json", baseline.dumps_typed, baseline.loads_typed)]
+    for compression in ("none", "zstd", "lz4"):
+        if compression != "none" and codec(compression) is None:
+            print(f"({compression} no instalado: se omite)")
+            continue
+        serde = CompactSerializer(compact=True, compression=compression, min_bytes=min_bytes)
+        label = "msgpack" if compression == "none" else f"msgpack+{compression}"
+        rows.append(measure(objs, label, serde.dumps_typed, serde.loads_typed))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bytes y tiempos del serializador de checkpoints")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS)
+    parser.add_argument("--script", default=DEFAULT_SCRIPT)
+    parser.add_argument("--redis", action="store_true", help="muestrear checkpoints guardados en Redis")
+    parser.add_argument("--sample", type=int, default=500, help="documentos por tipo con --redis")
+    parser.add_argument("--min-bytes", type=int, default=CHECKPOINT_COMPRESS_MIN_BYTES)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    objs = from_redis(args.sample) if args.redis else from_replay(args.scenarios, args.script)
+    if not objs:
+        print("sin objetos para medir")
+        return
+    failed = check_compat(objs)
+    print()
+    objs = objs * args.rounds
+    print(f"{len(objs)} objetos ({args.rounds} rondas), umbral de compresión {args.min_bytes} B\n")
+
+    rows = run(objs, args.min_bytes)
+    json_bytes = rows[0]["bytes"]
+    print(f"{'formato':14} {'KB':>10} {'vs json':>8} {'enc µs':>8} {'dec µs':>8}")
+    for r in rows:
+        print(
+            f"{r['formato']:14} {r['bytes'] / 1024:>10.1f} {r['bytes'] / json_bytes * 100:>7.1f}% "
+            f"{r['enc_us']:>8.1f} {r['dec_us']:>8.1f}"
+        )
+    if failed:
+        print(f"\nlectura incompatible: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Bedrock Converse falso por HTTP, para pruebas de carga sin AWS.
+
+Implementa POST /model/{modelId}/converse con el formato de la API real, así los servicios
+usan ChatBedrockConverse de verdad (botocore, serialización, reintentos) apuntando acá:
+
+    BEDROCK_ENDPOINT_URL=http://localhost:8788 AWS_ACCESS_KEY_ID=x AWS_SECRET_ACCESS_KEY=x
+
+Las respuestas salen de un script de reglas (services.llms.fake.ScriptedResponder).
+Latencia = base + jitter + tokens_entrada / prefill_tps + tokens_salida / output_tps.
+
+    python -m bench.fake_bedrock --port 8788 --latency 0.3 --output-tps 80
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from services.llms.fake import ScriptedResponder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_PATH = re.compile(r"^/model/(?P<model>[^/]+)/converse$")
+DEFAULT_SCRIPT = "bench/scripts/default.json"
+
+
+def _blocks_text(blocks: list) -> str:
+    parts = []
+    for b in blocks or []:
+        if "text" in b:
+            parts.append(b["text"])
+        elif "toolResult" in b:
+            for c in b["toolResult"].get("content", []):
+                parts.append(c["text"] if "text" in c else json.dumps(c.get("json", c), ensure_ascii=False))
+        elif "toolUse" in b:
+            parts.append(json.dumps(b["toolUse"].get("input", {}), ensure_ascii=False))
+    return "\n".join(parts)
+
+
+def _turns(messages: list) -> list[tuple[str, str]]:
+    turns = []
+    for m in messages:
+        content = m.get("content", [])
+        if m.get("role") == "user" and any("toolResult" in b for b in content):
+            turns.append(("tool", _blocks_text(content)))
+        else:
+            turns.append(("user" if m.get("role") == "user" else "assistant", _blocks_text(content)))
+    return turns
+
+
+class FakeBedrock:
+    def __init__(self, responder: ScriptedResponder, *, latency_s: float, jitter_s: float,
+                 prefill_tps: float, output_tps: float, throttle_prob: float, seed: int | None):
+        self.responder = responder
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.prefill_tps = prefill_tps
+        self.output_tps = output_tps
+        self.throttle_prob = throttle_prob
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+
+    def converse(self, model_id: str, body: dict) -> tuple[int, dict, dict]:
+        """Retorna (status, headers, json)."""
+        with self._lock:
+            self.calls += 1
+            throttle = self._rng.random() < self.throttle_prob
+            jitter = self._rng.uniform(0, self.jitter_s)
+        if throttle:
+            with self._lock:
+                self.throttled += 1
+            return 400, {"x-amzn-ErrorType": "ThrottlingException"}, {"message": "Too many requests (fake)"}
+
+        system = _blocks_text(body.get("system", []))
+        turns = _turns(body.get("messages", []))
+        tools = [t.get("toolSpec", {}).get("name", "") for t in (body.get("toolConfig") or {}).get("tools", [])]
+        out = self.responder.respond(system, turns, tools)
+
+        content = []
+        if out["text"]:
+            content.append({"text": out["text"]})
+        if out["tool_call"]:
+            content.append(
+                {
+                    "toolUse": {
+                        "toolUseId": f"tooluse_{uuid.uuid4().hex[:16]}",
+                        "name": out["tool_call"]["name"],
+                        "input": out["tool_call"].get("args", {}),
+                    }
+                }
+            )
+        input_tokens = max(1, (len(system) + sum(len(t) for _, t in turns)) // 4)
+        output_tokens = max(1, len(json.dumps(content, ensure_ascii=False)) // 4)
+        latency = out["latency_s"] if out["latency_s"] is not None else (
+            self.latency_s
+            + jitter
+            + (input_tokens / self.prefill_tps if self.prefill_tps else 0)
+            + (output_tokens / self.output_tps if self.output_tps else 0)
+        )
+        time.sleep(latency)
+        return 200, {}, {
+            "output": {"message": {"role": "assistant", "content": content}},
+            "stopReason": "tool_use" if out["tool_call"] else "end_turn",
+            "usage": {
+                "inputTokens": input_tokens,
+                "outputTokens": output_tokens,
+                "totalTokens": input_tokens + output_tokens,
+            },
+            "metrics": {"latencyMs": int(latency * 1000)},
+        }
+
+
+def make_handler(backend: FakeBedrock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_POST(self):
+            m = _PATH.match(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b"{}"
+            if not m:
+                self._send(404, {}, {"message": f"ruta no soportada: {self.path}"})
+                return
+            status, headers, body = backend.converse(unquote(m.group("model")), json.loads(raw or b"{}"))
+            self._send(status, headers, body)
+
+        def _send(self, status: int, headers: dict, body: dict) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("x-amzn-RequestId", uuid.uuid4().hex)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def serve(port: int, backend: FakeBedrock) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("0.0.0.0", port), make_handler(backend))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-bedrock", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bedrock Converse falso")
+    parser.add_argument("--port", type=int, default=8788)
+    parser.add_argument("--script", default=DEFAULT_SCRIPT)
+    parser.add_argument("--latency", type=float, default=0.3, help="latencia base (seg)")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--prefill-tps", type=float, default=4000, help="tokens de entrada/seg (0 = sin costo)")
+    parser.add_argument("--output-tps", type=float, default=80, help="tokens de salida/seg (0 = sin costo)")
+    parser.add_argument("--throttle-prob", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    backend = FakeBedrock(
+        ScriptedResponder.from_file(args.script),
+        latency_s=args.latency,
+        jitter_s=args.jitter,
+        prefill_tps=args.prefill_tps,
+        output_tps=args.output_tps,
+        throttle_prob=args.throttle_prob,
+        seed=args.seed,
+    )
+    server = serve(args.port, backend)
+    logger.info("Bedrock falso en :%s (script %s)", args.port, args.script)
+    try:
+        while True:
+            time.sleep(10)
+            logger.info("[fake-bedrock] calls=%s throttled=%s", backend.calls, backend.throttled)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
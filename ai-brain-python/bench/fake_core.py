@@ -0,0 +1,219 @@
+"""
+Core bancario falso (mismas rutas y DTOs que ClaimController del core Java).
+
+Datos sintéticos deterministas por customerId (préstamos, refinanciables, ofertas) y
+perfil inversor en memoria. Sirve para pruebas de carga y replay sin Postgres ni Java.
+
+    python -m bench.fake_core --port 8089 --latency 0.02
+    CORE_API_URL=http://localhost:8089/api/v1/bank-ia
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PREFIX = "/api/v1/bank-ia"
+
+_ROUTES = [
+    ("GET", re.compile(r"^/loans/(?P<cid>[^/]+)/to-cancel$"), "to_cancel"),
+    ("GET", re.compile(r"^/loans/(?P<cid>[^/]+)$"), "loans"),
+    ("GET", re.compile(r"^/(?P<cid>[^/]+)/available-offer$"), "offers"),
+    ("POST", re.compile(r"^/refinance$"), "refinance"),
+    ("POST", re.compile(r"^/new-loan/(?P<cid>[^/]+)$"), "new_loan"),
+    ("GET", re.compile(r"^/profile-investor/(?P<cid>[^/]+)$"), "get_profile"),
+    ("DELETE", re.compile(r"^/profile-investor/(?P<cid>[^/]+)$"), "delete_profile"),
+    ("POST", re.compile(r"^/new-profile-investor/(?P<cid>[^/]+)$"), "save_profile"),
+]
+
+
+def _api_ok(data, message: str = "Operación exitosa") -> dict:
+    return {"success": True, "data": data, "message": message, "timestamp": datetime.now().isoformat()}
+
+
+class FakeCore:
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self._lock = threading.Lock()
+        self._profiles: dict[str, dict] = {}
+        self.calls: dict[str, int] = {}
+
+    def customer_loans(self, cid: str) -> list[dict]:
+        rng = random.Random(f"loans:{cid}")
+        prefix = rng.randint(1000, 9999)
+        loans = []
+        for i in range(rng.randint(1, 3)):
+            total_quotas = rng.choice([12, 18, 24, 36])
+            paid = rng.randint(1, total_quotas - 1)
+            total = rng.choice([300_000, 500_000, 800_000, 1_200_000])
+            tna = rng.choice([85, 95, 110, 120])
+            quota = round(total * (1 + tna / 100 * total_quotas / 12) / total_quotas, 2)
+            loans.append(
+                {
+                    "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                    "loanNumber": f"LOAN-{prefix}-{i + 1}",
+                    "totalAmount": total,
+                    "remainingAmount": round(total * (total_quotas - paid) / total_quotas, 2),
+                    "quotaAmount": quota,
+                    "paidQuotas": paid,
+                    "totalQuotas": total_quotas,
+                    "status": "ACTIVE",
+                    "startDate": (date.today() - timedelta(days=30 * paid)).isoformat(),
+                    "isEligibleForRefinance": paid >= total_quotas // 3,
+                    "nominalAnnualRate": tna,
+                }
+            )
+        return loans
+
+    def offers(self, cid: str) -> list[dict]:
+        rng = random.Random(f"offers:{cid}")
+        cap = rng.choice([1_000_000, 1_200_000, 2_000_000])
+        return [
+            {
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "maxAmount": cap,
+                "maxQuotas": quotas,
+                "monthlyRate": round(tna / 12, 4),
+                "annualNominalRate": tna,
+                "minDTI": 0.35,
+            }
+            for quotas, tna in ((12, 60), (24, 70), (36, 80))
+        ]
+
+    def handle(self, method: str, path: str, body: dict | None) -> tuple[int, object]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if not path.startswith(PREFIX):
+            return 404, {"message": "not found"}
+        sub = path[len(PREFIX):]
+        for m, pattern, name in _ROUTES:
+            match = pattern.match(sub)
+            if m == method and match:
+                with self._lock:
+                    self.calls[name] = self.calls.get(name, 0) + 1
+                return getattr(self, f"_{name}")(match.groupdict().get("cid"), body or {})
+        return 404, {"message": f"ruta no soportada: {method} {sub}"}
+
+    def _loans(self, cid, body):
+        return 200, self.customer_loans(cid)
+
+    def _to_cancel(self, cid, body):
+        return 200, [l for l in self.customer_loans(cid) if l["isEligibleForRefinance"]]
+
+    def _offers(self, cid, body):
+        return 200, self.offers(cid)
+
+    def _refinance(self, cid, body):
+        cid = body.get("customerId", "")
+        ids = {str(i) for i in body.get("sourceLoanIds") or []}
+        debt = sum(l["remainingAmount"] for l in self.customer_loans(cid) if l["id"] in ids)
+        amount = float(body.get("offeredAmount") or 0)
+        if not ids or amount <= 0:
+            return 400, {"success": False, "data": None, "message": "Solicitud inválida"}
+        return 200, _api_ok(
+            {
+                "message": "Refinanciación exitosa",
+                "customerId": cid,
+                "newLoanId": str(uuid.uuid4()),
+                "newLoanNumber": f"REF-{int(time.time())}",
+                "totalDebtCanceled": round(debt, 2),
+                "cashOut": round(max(0.0, amount - debt), 2),
+                "appliedNominalAnnualRate": body.get("appliedRate"),
+                "timestamp": datetime.now().isoformat(),
+            }
+        )
+
+    def _new_loan(self, cid, body):
+        loan = {
+            "customerId": cid,
+            "amount": body.get("amount"),
+            "quotas": body.get("quotas"),
+            "rate": body.get("rate"),
+        }
+        return 201, _api_ok(loan)
+
+    def _get_profile(self, cid, body):
+        with self._lock:
+            return 200, self._profiles.get(
+                cid,
+                {"customerId": cid, "riskLevel": None, "hasProfile": False, "maxLossPercent": None, "horizon": None},
+            )
+
+    def _delete_profile(self, cid, body):
+        with self._lock:
+            self._profiles.pop(cid, None)
+        return 204, None
+
+    def _save_profile(self, cid, body):
+        profile = {**body, "customerId": cid}
+        with self._lock:
+            self._profiles[cid] = profile
+        return 200, profile
+
+
+def make_handler(core: FakeCore):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _dispatch(self, method: str) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            status, payload = core.handle(method, self.path.split("?", 1)[0], body)
+            data = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if data:
+                self.wfile.write(data)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+    return Handler
+
+
+def serve(port: int, core: FakeCore) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("0.0.0.0", port), make_handler(core))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-core", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Core bancario falso")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.02, help="latencia por request (seg)")
+    args = parser.parse_args()
+    core = FakeCore(args.latency)
+    server = serve(args.port, core)
+    logger.info("Core falso en :%s%s", args.port, PREFIX)
+    try:
+        while True:
+            time.sleep(10)
+            logger.info("[fake-core] %s", core.calls)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Chequeo de services.llms.hedging con el backend falso (services.llms.fake): latencias y
+errores inyectados por candidato, y qué modelo terminó contestando.
+
+- primario rápido: contesta él y no se cubre;
+- primario lento: a los HEDGE_DELAY_S sale la cobertura, gana el secundario y la llamada
+  del primario se cancela;
+- primario con error: pasa al siguiente sin esperar el delay (fallback);
+- cadena de tres con dos errores: contesta el tercero; todos con error: sale la excepción;
+- camino sync: fallback secuencial.
+
+Sale con código 1 si algún caso falla.
+
+    python -m bench.hedging_check
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+
+from services.llms.fake import FakeChatModel, FakeThrottlingError
+from services.llms.hedging import HedgedChatModel
+
+HEDGE_DELAY_S = 0.1
+
+
+class _FixedDelay:
+    """Tracker con delay de cobertura fijo (el real usa el p95 y arranca en segundos)."""
+
+    def observe(self, seconds: float) -> None:
+        pass
+
+    def hedge_delay(self) -> float:
+        return HEDGE_DELAY_S
+
+
+class _Probe:
+    """Candidato que registra si su llamada terminó, falló o la cancelaron."""
+
+    def __init__(self, model_id: str, **fake):
+        self.model_id = model_id
+        self._model = FakeChatModel(model_id=model_id, jitter_s=0.0, seed=0, **fake)
+        self.outcome = None
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        try:
+            result = await self._model.ainvoke(input, config, **kwargs)
+        except asyncio.CancelledError:
+            self.outcome = "cancelled"
+            raise
+        except Exception:
+            self.outcome = "error"
+            raise
+        self.outcome = "ok"
+        return result
+
+    def invoke(self, input, config=None, **kwargs):
+        try:
+            result = self._model.invoke(input, config, **kwargs)
+        except Exception:
+            self.outcome = "error"
+            raise
+        self.outcome = "ok"
+        return result
+
+
+def _chain(*probes: _Probe) -> HedgedChatModel:
+    return HedgedChatModel(list(probes), "check", tracker=_FixedDelay())
+
+
+def _answered_by(msg) -> str:
+    return msg.response_metadata.get("model_id", "")
+
+
+async def _fast_primary(failures: list) -> None:
+    a, b = _Probe("primary", latency_s=0.01), _Probe("secondary", latency_s=0.01)
+    model = _chain(a, b)
+    msg = await model.ainvoke("hola")
+    _expect(failures, "primario rápido: contesta", _answered_by(msg), "primary")
+    _expect(failures, "primario rápido: sin cobertura", model.stats()["hedges"], 0)
+    _expect(failures, "primario rápido: secundario sin llamar", b.outcome, None)
+
+
+async def _slow_primary(failures: list) -> None:
+    a, b = _Probe("primary", latency_s=1.0), _Probe("secondary", latency_s=0.01)
+    model = _chain(a, b)
+    started = time.monotonic()
+    msg = await model.ainvoke("hola")
+    elapsed = time.monotonic() - started
+    # La cancelación del perdedor se procesa en la próxima vuelta del loop.
+    await asyncio.sleep(0.01)
+    stats = model.stats()
+    _expect(failures, "primario lento: contesta", _answered_by(msg), "secondary")
+    _expect(failures, "primario lento: coberturas", stats["hedges"], 1)
+    _expect(failures, "primario lento: la cobertura gana", stats["hedge_wins"], 1)
+    _expect(failures, "primario lento: perdedor cancelado", a.outcome, "cancelled")
+    _expect(failures, "primario lento: cancelaciones", stats["cancelled"], 1)
+    _expect(failures, "primario lento: no espera al primario", elapsed < 0.5, True)
+
+
+async def _failing_primary(failures: list) -> None:
+    a, b = _Probe("primary", latency_s=0.01, error_prob=1.0), _Probe("secondary", latency_s=0.01)
+    model = _chain(a, b)
+    started = time.monotonic()
+    msg = await model.ainvoke("hola")
+    elapsed = time.monotonic() - started
+    stats = model.stats()
+    _expect(failures, "primario con error: contesta", _answered_by(msg), "secondary")
+    _expect(failures, "primario con error: fallbacks", stats["fallbacks"], 1)
+    _expect(failures, "primario con error: sin cobertura", stats["hedges"], 0)
+    _expect(failures, "primario con error: no espera el delay", elapsed < HEDGE_DELAY_S, True)
+
+
+async def _chain_of_three(failures: list) -> None:
+    probes = (
+        _Probe("us-east-1", latency_s=0.01, error_prob=1.0),
+        _Probe("us-west-2", latency_s=0.01, error_prob=1.0),
+        _Probe("haiku", latency_s=0.01),
+    )
+    model = _chain(*probes)
+    msg = await model.ainvoke("hola")
+    stats = model.stats()
+    _expect(failures, "cadena de tres: contesta", _answered_by(msg), "haiku")
+    _expect(failures, "cadena de tres: errores", stats["errors"], 2)
+    _expect(failures, "cadena de tres: fallbacks", stats["fallbacks"], 2)
+
+
+async def _all_failing(failures: list) -> None:
+    model = _chain(
+        _Probe("primary", latency_s=0.01, error_prob=1.0),
+        _Probe("secondary", latency_s=0.01, error_prob=1.0),
+    )
+    try:
+        await model.ainvoke("hola")
+    except FakeThrottlingError:
+        raised = "FakeThrottlingError"
+    else:
+        raised = None
+    _expect(failures, "todos con error: sale la excepción", raised, "FakeThrottlingError")
+
+
+def _sync_fallback(failures: list) -> None:
+    a, b = _Probe("primary", latency_s=0.01, error_prob=1.0), _Probe("secondary", latency_s=0.01)
+    model = _chain(a, b)
+    msg = model.invoke("hola")
+    _expect(failures, "sync: contesta", _answered_by(msg), "secondary")
+    _expect(failures, "sync: fallbacks", model.stats()["fallbacks"], 1)
+
+
+def _expect(failures: list, name: str, got, want) -> None:
+    ok = got == want
+    print(f"{'ok  ' if ok else 'FAIL'} {name}: {got!r}" + ("" if ok else f" (esperado {want!r})"))
+    if not ok:
+        failures.append(name)
+
+
+async def _run() -> list:
+    failures: list = []
+    for case in (_fast_primary, _slow_primary, _failing_primary, _chain_of_three, _all_failing):
+        await case(failures)
+    _sync_fallback(failures)
+    return failures
+
+
+def main() -> None:
+    failures = asyncio.run(_run())
+    if failures:
+        print(f"\n{len(failures)} chequeos fallaron")
+        sys.exit(1)
+    print("\nhedging ok")
+
+
+if __name__ == "__main__":
+    main()
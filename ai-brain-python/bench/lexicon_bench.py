@@ -0,0 +1,156 @@
+"""
+Benchmark del léxico compartido (common.lexicon) contra las regex anteriores de los routers.
+
+Sobre un corpus etiquetado (y opcionalmente los turnos de usuario de un archivo de escenarios
+de bench.replay) reporta:
+- cobertura heurística: % de mensajes que el router del brain resuelve sin llamar a Haiku;
+- aciertos sobre los etiquetados y chequeos de normalize / prefijos / difuso / `only()`
+  (sale con código 1 si el léxico erra alguno);
+- throughput (mensajes/s) de cada implementación (y del `scan` con caché).
+
+    python -m bench.lexicon_bench [--scenarios bench/scenarios/local.jsonl] [--rounds 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+import time
+
+from common.lexicon import CLOSE, INVESTMENT, LOANS, LEXICON, normalize, scan
+
+# Regex de los routers antes del léxico (referencia).
+_LEGACY_INVEST = re.compile(
+    r"(\binversiones?\b|\binversión\b|\binvertir\b|perfil inversor|test de idoneidad|idoneidad|"
+    r"mercado de capitales|fci|cedear|dónde invertir|donde invertir|mep|bonos?|letras del tesoro|"
+    r"armar cartera|activos financieros|fondo común|módulo de inversion|ahora inversi|tema inversi)",
+    re.I,
+)
+_LEGACY_LOANS = re.compile(
+    r"(\bpréstamo|\bprestamo|refinanc|refi\b|nuevo crédito|plata en mano|"
+    r"efectivo en mano|mi préstamo|solicit(ar|o) (un )?préstamo|loan|mill[oó]n (de )?plata|tope 1[,.]?2)",
+    re.I,
+)
+
+# (mensaje, workflow esperado por heurística; None = ambiguo, debe ir al LLM)
+LABELED = [
+    ("Quiero un préstamo", LOANS),
+    ("quiero un prestamo", LOANS),
+    ("QUIERO UN PRESTAMO YA", LOANS),
+    ("necesito un prestmo", LOANS),
+    ("me pasás info de préstamos personales?", LOANS),
+    ("quiero refinanciar", LOANS),
+    ("quiero refinaciar mis deudas", LOANS),
+    ("cuánto me dan de plata en mano?", LOANS),
+    ("Me interesa un crédito nuevo", LOANS),
+    ("tope 1,2 millones?", LOANS),
+    ("quiero invertir", INVESTMENT),
+    ("Quiero invertir en FCI", INVESTMENT),
+    ("quiero hacer el test de idoneidad", INVESTMENT),
+    ("cual es mi perfil inversor", INVESTMENT),
+    ("inversion en bonos", INVESTMENT),
+    ("me interesan las inversiónes", INVESTMENT),
+    ("quiero invetir", INVESTMENT),
+    ("dónde invierto mis ahorros", INVESTMENT),
+    ("cedears o dolar mep?", INVESTMENT),
+    ("fondos comunes de inversión", INVESTMENT),
+    ("quiero refinanciar y despues invertir lo que sobra", None),
+    ("hola", None),
+    ("si", None),
+    ("B", None),
+    ("siempre pago a tiempo", None),
+    ("es eficiente la app?", None),
+    ("la inversa no aplica", None),
+    ("me lo prestado", None),
+    ("a la inversa, lo inverso", None),
+]
+
+
+def _hits(text: str) -> list[tuple[str, str]]:
+    return sorted((intent, phrase) for intent, phrase, _ in LEXICON.scan(text).hits)
+
+
+# (nombre, obtenido, esperado): piezas del léxico por separado.
+def _unit_checks() -> list[tuple[str, object, object]]:
+    return [
+        ("normalize tildes/ñ/mayúsculas", normalize("  ¡Quiero un PRÉSTAMO, año!  "), "quiero un prestamo ano"),
+        ("normalize puntuación y _", normalize("tope 1,2_millones..."), "tope 1 2 millones"),
+        ("prefijo plural", _hits("préstamos"), [(LOANS, "prestamo*")]),
+        ("prefijo verbo", _hits("refinanciamos"), [(LOANS, "refinanc*")]),
+        ("prefijo no matchea a mitad de palabra", _hits("superprestamo"), []),
+        ("exacta con límites de palabra", _hits("bonos y bonobon"), [(INVESTMENT, "bonos")]),
+        ("frase más larga gana", _hits("muchas gracias"), [(CLOSE, "muchas gracias")]),
+        ("difuso: letra de menos", _hits("prestmo"), [(LOANS, "~prestamo")]),
+        ("difuso: transposición", _hits("invesrion"), [(INVESTMENT, "~inversion")]),
+        ("difuso: medio peso", LEXICON.scan("refinaciar").score(LOANS), 1.0),
+        ("difuso: dos errores no", _hits("prstmo"), []),
+        ("difuso: palabra corta no", _hits("bono bonu"), [(INVESTMENT, "bono")]),
+        ("participio no es préstamo", LEXICON.scan("me lo prestado").score(LOANS), 0.0),
+        ("only: una sola intención", LEXICON.scan("quiero un prestamo").only(LOANS, INVESTMENT), True),
+        ("only: con otra intención", LEXICON.scan("prestamo o inversion").only(LOANS, INVESTMENT), False),
+        ("only: sin la intención", LEXICON.scan("hola").only(LOANS), False),
+        ("only: sin others", LEXICON.scan("prestamo y gracias").only(LOANS), True),
+    ]
+
+
+def legacy_route(text: str):
+    inv, loans = bool(_LEGACY_INVEST.search(text)), bool(_LEGACY_LOANS.search(text))
+    return INVESTMENT if inv and not loans else LOANS if loans and not inv else None
+
+
+def lexicon_route(text: str):
+    hits = LEXICON.scan(text)
+    return INVESTMENT if hits.only(INVESTMENT, LOANS) else LOANS if hits.only(LOANS, INVESTMENT) else None
+
+
+def _load_user_turns(path: str) -> list[str]:
+    turns = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                turns.extend(json.loads(line).get("turns", []))
+    return turns
+
+
+def _throughput(fn, corpus: list[str], rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in corpus:
+            fn(text)
+    return rounds * len(corpus) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark del léxico de intenciones")
+    parser.add_argument("--scenarios", help="jsonl de bench.replay para sumar turnos reales")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = [t for t, _ in LABELED]
+    if args.scenarios:
+        corpus += _load_user_turns(args.scenarios)
+
+    errors = []
+    for name, fn in (("legacy", legacy_route), ("lexicon", lexicon_route)):
+        routed = sum(1 for t in corpus if fn(t) is not None)
+        ok = sum(1 for t, expected in LABELED if fn(t) == expected)
+        rate = _throughput(fn, corpus, args.rounds)
+        print(
+            f"{name:8} heurística={routed / len(corpus) * 100:5.1f}% (fallback LLM {100 - routed / len(corpus) * 100:5.1f}%) "
+            f"etiquetados={ok}/{len(LABELED)} {rate:,.0f} msgs/s"
+        )
+        if name == "lexicon":
+            errors = [(t, expected, fn(t)) for t, expected in LABELED if fn(t) != expected]
+
+    print(f"{'cached':8} {_throughput(lambda t: scan(t), corpus, args.rounds):,.0f} msgs/s (lru_cache de common.lexicon.scan)")
+    for text, expected, got in errors:
+        print(f"  ✗ {text!r}: esperado {expected}, léxico {got}")
+    failed = [(name, got, want) for name, got, want in _unit_checks() if got != want]
+    for name, got, want in failed:
+        print(f"  ✗ {name}: esperado {want!r}, léxico {got!r}")
+    sys.exit(1 if errors or failed else 0)
+
+
+if __name__ == "__main__":
+    main()
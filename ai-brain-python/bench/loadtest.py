@@ -0,0 +1,290 @@
+"""
+Prueba de carga del pipeline chat-queries → classifier → master/brain → workflows → chat-response.
+
+Cada cliente sintético conversa en lazo cerrado (manda, espera la respuesta, piensa) con un
+guion según su tipo (master / loans / investment). Corre contra Kafka y Redis locales con
+los servicios levantados apuntando a bench.fake_bedrock y bench.fake_core, y TRACE_EXPORT=file
+para medir cada salto.
+
+Reporta mensajes/s, latencia punta a punta, p50/p95/p99 por salto (spans de las trazas que
+generó la prueba) y profundidad de cola por stream (lag y pendientes del consumer group) y del
+topic chat-queries.
+
+Cada cliente respeta la cuota por cliente del clasificador (QUOTA_BURST / QUOTA_REFILL_PER_MIN,
+leídos del mismo .env): el guion de inversiones manda 11 mensajes seguidos y, sin ritmo, la
+prueba mediría sobre todo QUOTA_REPLY. --no-pace lo desactiva (para probar la cuota misma).
+
+    python -m bench.loadtest --customers 2000 --concurrency 200 --duration 120
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import secrets
+import time
+from collections import defaultdict
+
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka.admin import AIOKafkaAdminClient
+
+from bench.stats import hop_latencies, load_spans, print_table, summarize
+from common.admission import BUSY_REPLY, QUOTA_BURST, QUOTA_REFILL_PER_MIN, QUOTA_REPLY
+from common.kafka_config import BOOTSTRAP_SERVERS
+from common.redis_config import get_redis
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STREAMS = [
+    ("to-master", "master-group"),
+    ("to-brain", "brain-group"),
+    ("workflow_loans", "loans-group"),
+    ("workflow_investment", "investment-group"),
+]
+
+SCRIPTS = {
+    "master": [
+        "Hola, ¿qué es un plazo fijo?",
+        "¿Y cómo se calcula lo que rinde?",
+        "Buenísimo, gracias",
+    ],
+    "loans": [
+        "Quiero refinanciar mis préstamos",
+        "¿Cuánto me quedaría en mano a 24 cuotas?",
+        "ok gracias",
+    ],
+    "investment": [
+        "Quiero invertir, ¿qué me recomendás?",
+        "A", "B", "C", "B", "A", "C", "B", "D", "A",
+        "gracias",
+    ],
+}
+
+
+def _parse_mix(raw: str) -> dict[str, float]:
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() in SCRIPTS:
+            mix[name.strip()] = float(weight or 1)
+    return mix or {"master": 1.0}
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.mix = _parse_mix(args.mix)
+        self.pending: dict[str, asyncio.Future] = {}
+        self.trace_ids: set[str] = set()
+        self.e2e_ms: dict[str, list[float]] = defaultdict(list)
+        self.counts: dict[str, int] = defaultdict(int)
+        self.depth: dict[str, list[int]] = defaultdict(list)
+        self._rng = random.Random(args.seed)
+        # customer_id → (fichas, monotonic): copia local del token bucket de admission.
+        self._quota: dict[str, tuple[float, float]] = {}
+
+    async def _pace(self, customer_id: str) -> None:
+        """Espera a tener cuota en el clasificador antes de mandar (salvo --no-pace)."""
+        if self.args.no_pace:
+            return
+        rate = QUOTA_REFILL_PER_MIN / 60.0
+        now = time.monotonic()
+        tokens, ts = self._quota.get(customer_id, (float(QUOTA_BURST), now))
+        tokens = min(float(QUOTA_BURST), tokens + (now - ts) * rate)
+        if tokens < 1:
+            wait = (1 - tokens) / rate
+            self.counts["paced"] += 1
+            await asyncio.sleep(wait)
+            now, tokens = now + wait, 1.0
+        self._quota[customer_id] = (tokens - 1, now)
+
+    async def _send(self, producer, customer_id: str, text: str) -> str:
+        trace_id = secrets.token_hex(16)
+        self.trace_ids.add(trace_id)
+        payload = {"contenido": text, "contexto": "", "customerId": customer_id}
+        await producer.send_and_wait(
+            "chat-queries",
+            json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            key=customer_id.encode(),
+            headers=[("traceparent", f"00-{trace_id}-{secrets.token_hex(8)}-01".encode())],
+        )
+        return trace_id
+
+    async def _customer(self, producer, customer_id: str, kind: str, deadline: float) -> None:
+        for text in SCRIPTS[kind]:
+            if time.monotonic() > deadline:
+                return
+            await self._pace(customer_id)
+            if time.monotonic() > deadline:
+                return
+            fut = asyncio.get_running_loop().create_future()
+            self.pending[customer_id] = fut
+            started = time.monotonic()
+            await self._send(producer, customer_id, text)
+            self.counts["sent"] += 1
+            try:
+                reply = await asyncio.wait_for(fut, self.args.timeout)
+            except asyncio.TimeoutError:
+                self.counts["timeouts"] += 1
+                return
+            finally:
+                self.pending.pop(customer_id, None)
+            self.e2e_ms[kind].append((time.monotonic() - started) * 1000)
+            self.counts["replies"] += 1
+            if reply == QUOTA_REPLY:
+                self.counts["throttled"] += 1
+                return
+            if reply == BUSY_REPLY:
+                self.counts["rejected"] += 1
+                return
+            await asyncio.sleep(self._rng.expovariate(1 / self.args.think) if self.args.think else 0)
+
+    async def _worker(self, producer, idle: asyncio.Queue, deadline: float) -> None:
+        kinds, weights = zip(*self.mix.items())
+        while time.monotonic() < deadline:
+            customer_id = await idle.get()
+            kind = self._rng.choices(kinds, weights)[0]
+            try:
+                await self._customer(producer, customer_id, kind, deadline)
+            except Exception:
+                logger.exception("cliente %s", customer_id)
+            finally:
+                idle.put_nowait(customer_id)
+
+    async def _replies(self, consumer) -> None:
+        async for msg in consumer:
+            try:
+                data = json.loads(msg.value)
+            except (TypeError, ValueError):
+                continue
+            fut = self.pending.get(data.get("customerId", ""))
+            if fut is not None and not fut.done():
+                fut.set_result(data.get("reply", ""))
+
+    async def _kafka_lag(self, admin, consumer) -> int | None:
+        try:
+            committed = await admin.list_consumer_group_offsets("classifier-group")
+            parts = [tp for tp in committed if tp.topic == "chat-queries"]
+            if not parts:
+                return None
+            ends = await consumer.end_offsets(parts)
+            return sum(max(0, ends[tp] - committed[tp].offset) for tp in parts)
+        except Exception as e:
+            logger.debug("lag de kafka no disponible: %s", e)
+            return None
+
+    async def _sampler(self, redis, admin, consumer) -> None:
+        while True:
+            for stream, group in STREAMS:
+                try:
+                    groups = await redis.xinfo_groups(stream)
+                except Exception:
+                    continue
+                for g in groups:
+                    name = g.get("name")
+                    if (name.decode() if isinstance(name, bytes) else name) == group:
+                        self.depth[f"{stream} lag"].append(int(g.get("lag") or 0))
+                        self.depth[f"{stream} pending"].append(int(g.get("pending") or 0))
+            lag = await self._kafka_lag(admin, consumer)
+            if lag is not None:
+                self.depth["chat-queries lag"].append(lag)
+            await asyncio.sleep(self.args.sample_interval)
+
+    async def run(self) -> dict:
+        a = self.args
+        producer = AIOKafkaProducer(bootstrap_servers=BOOTSTRAP_SERVERS, linger_ms=5)
+        consumer = AIOKafkaConsumer(
+            "chat-response",
+            bootstrap_servers=BOOTSTRAP_SERVERS,
+            group_id=f"loadtest-{secrets.token_hex(4)}",
+            auto_offset_reset="latest",
+        )
+        admin = AIOKafkaAdminClient(bootstrap_servers=BOOTSTRAP_SERVERS)
+        redis = get_redis()
+        await producer.start()
+        await consumer.start()
+        await admin.start()
+
+        idle: asyncio.Queue = asyncio.Queue()
+        for i in range(a.customers):
+            idle.put_nowait(f"{a.prefix}-{i:05d}")
+
+        started = time.monotonic()
+        deadline = started + a.duration
+        background = [
+            asyncio.create_task(self._replies(consumer)),
+            asyncio.create_task(self._sampler(redis, admin, consumer)),
+        ]
+        try:
+            workers = min(a.concurrency, a.customers)
+            await asyncio.gather(*(self._worker(producer, idle, deadline) for _ in range(workers)))
+        finally:
+            elapsed = time.monotonic() - started
+            for t in background:
+                t.cancel()
+            await producer.stop()
+            await consumer.stop()
+            await admin.close()
+            await redis.aclose()
+
+        # Los servicios exportan spans por lotes (~1 s): margen antes de leer el archivo.
+        await asyncio.sleep(2)
+        hops = hop_latencies(load_spans(a.trace_file, self.trace_ids))
+        return {
+            "elapsed_s": elapsed,
+            "counts": dict(self.counts),
+            "msgs_per_s": self.counts["replies"] / elapsed if elapsed else 0.0,
+            "e2e_ms": {k: summarize(v) for k, v in self.e2e_ms.items()},
+            "hops_ms": {k: summarize(v) for k, v in sorted(hops.items())},
+            "queue_depth": {
+                k: {"max": max(v), "avg": sum(v) / len(v)} for k, v in sorted(self.depth.items()) if v
+            },
+        }
+
+
+def _print(report: dict) -> None:
+    c = report["counts"]
+    print(
+        f"\nduración={report['elapsed_s']:.1f}s enviados={c.get('sent', 0)} respuestas={c.get('replies', 0)} "
+        f"timeouts={c.get('timeouts', 0)} rechazados={c.get('rejected', 0)} sin_cuota={c.get('throttled', 0)} "
+        f"esperas_de_cuota={c.get('paced', 0)} → {report['msgs_per_s']:.1f} msgs/s"
+    )
+    print_table("Punta a punta por tipo de cliente", report["e2e_ms"])
+    if report["hops_ms"]:
+        print_table("Por salto (spans)", report["hops_ms"])
+    else:
+        print("\n(sin spans: levantá los servicios con TRACE_EXPORT=file y el mismo TRACE_FILE)")
+    print("\n== Profundidad de cola ==")
+    for name, d in report["queue_depth"].items():
+        print(f"{name:34} max={d['max']:<6} avg={d['avg']:.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prueba de carga de punta a punta")
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="clientes conversando a la vez")
+    parser.add_argument("--duration", type=float, default=120)
+    parser.add_argument("--think", type=float, default=1.0, help="tiempo medio entre mensajes (seg)")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--mix", default="master=0.5,loans=0.3,investment=0.2")
+    parser.add_argument("--prefix", default="lt")
+    parser.add_argument("--sample-interval", type=float, default=2.0)
+    parser.add_argument("--trace-file", default=os.getenv("TRACE_FILE", "/tmp/moustro-traces.jsonl"))
+    parser.add_argument("--json", help="guardar el reporte en este archivo")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--no-pace", action="store_true", help="no esperar la cuota por cliente")
+    args = parser.parse_args()
+
+    report = asyncio.run(LoadTest(args).run())
+    _print(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Replay de conversaciones guardadas como benchmark determinista de los grafos.
+
+1) export: arma escenarios desde la tabla `conversations` (última fila por cliente y servicio,
+   cliente anonimizado). El archivo queda local: trae texto real de usuarios.
+
+    python -m bench.replay export --out bench/scenarios/local.jsonl --limit 200
+
+2) run: maneja cada escenario turno a turno contra el grafo de master, loans o investment con
+   LLM fake en proceso (respuestas grabadas o guion) y el core falso. Por turno mide tiempo,
+   pasos del grafo (nodos ejecutados), bytes de checkpoint serializados y tokens de prompt.
+   Compara contra el baseline y sale con código 1 si hay regresión.
+
+    python -m bench.replay run [--scenarios …] [--llm recorded|scripted] [--update-baseline]
+
+Los bytes de checkpoint se miden con el serde del saver (lo que se escribiría en Redis por turno).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+
+from bench.stats import percentile
+
+SERVICES = ("master", "loans", "investment")
+DEFAULT_SCENARIOS = "bench/scenarios/sample.jsonl"
+DEFAULT_BASELINE = "bench/replay_baseline.json"
+DEFAULT_SCRIPT = "bench/scripts/default.json"
+_CONTEXT_PREFIX = "Contexto previo:"
+
+
+async def export_scenarios(out: str, limit: int) -> int:
+    import asyncpg
+
+    from common.conversation_store import POSTGRES_URL
+
+    conn = await asyncpg.connect(POSTGRES_URL)
+    try:
+        rows = await conn.fetch(
+            """
+            SELECT DISTINCT ON (customer_id, service) id, customer_id, service, messages
+            FROM conversations
+            WHERE service = ANY($1::text[])
+            ORDER BY customer_id, service, id DESC
+            """,
+            list(SERVICES),
+        )
+    finally:
+        await conn.close()
+
+    rows = sorted(rows, key=lambda r: r["id"], reverse=True)[:limit]
+    with open(out, "w", encoding="utf-8") as f:
+        for r in rows:
+            messages = r["messages"]
+            if isinstance(messages, str):
+                messages = json.loads(messages)
+            contexto, turns, recorded = "", [], []
+            for m in messages:
+                content = m.get("content") if isinstance(m.get("content"), str) else json.dumps(m.get("content"))
+                if m.get("role") == "user" and content.startswith(_CONTEXT_PREFIX) and not turns:
+                    contexto = content[len(_CONTEXT_PREFIX):].strip()
+                elif m.get("role") == "user":
+                    turns.append(content)
+                elif m.get("role") == "assistant":
+                    recorded.append(content)
+            if not turns:
+                continue
+            anon = hashlib.sha1(r["customer_id"].encode()).hexdigest()[:10]
+            scenario = {
+                "id": f"{r['service']}-{r['id']}",
+                "service": r["service"],
+                "customer_id": f"rp-{anon}",
+                "contexto": contexto,
+                "turns": turns,
+                "recorded": recorded,
+            }
+            f.write(json.dumps(scenario, ensure_ascii=False) + "\n")
+    return len(rows)
+
+
+def load_scenarios(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class CountingSerde:
+    """Envuelve el serde del checkpointer y cuenta los bytes serializados (y opcionalmente
+    guarda los objetos, para bench.checkpoint_bench)."""
+
+    def __init__(self, inner, capture: list | None = None):
+        self._inner = inner
+        self.bytes = 0
+        self._capture = capture
+
+    def dumps_typed(self, obj):
+        type_, data = self._inner.dumps_typed(obj)
+        self.bytes += len(data or b"")
+        if self._capture is not None and obj is not None:
+            self._capture.append(obj)
+        return type_, data
+
+    def loads_typed(self, data):
+        return self._inner.loads_typed(data)
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+class ReplayResponder:
+    """Modo recorded: devuelve en orden las respuestas grabadas; agotadas, sigue con el guion."""
+
+    def __init__(self, scripted, mode: str):
+        self._scripted = scripted
+        self._mode = mode
+        self._replies: list[str] = []
+
+    def start(self, scenario: dict) -> None:
+        self._replies = list(scenario.get("recorded") or []) if self._mode == "recorded" else []
+
+    def __call__(self, messages, tools):
+        from langchain_core.messages import AIMessage
+
+        if self._replies:
+            return AIMessage(content=self._replies.pop(0))
+        return self._scripted(messages, tools)
+
+
+def _prepare_env(core_url: str) -> None:
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_S"] = "0"
+    os.environ["FAKE_LLM_JITTER_S"] = "0"
+    os.environ["LLM_USAGE_ENABLED"] = "1"
+    os.environ["CORE_API_URL"] = core_url
+    # Sin Redis: la caché de FAQ del master se apaga (cada turno se mide generado).
+    os.environ["FAQ_CACHE"] = "0"
+
+
+async def run_scenarios(
+    scenarios: list[dict], llm_mode: str, script: str, capture: list | None = None
+) -> dict:
+    from bench.fake_core import FakeCore, PREFIX, serve
+
+    server = serve(0, FakeCore())
+    _prepare_env(f"http://127.0.0.1:{server.server_address[1]}{PREFIX}")
+
+    # Los módulos de grafos crean sus modelos al importarse: el responder va antes.
+    from services.llms import models
+    from services.llms.fake import ScriptedResponder
+
+    responder = ReplayResponder(ScriptedResponder.from_file(script), llm_mode)
+    models.FAKE_RESPONDER = responder
+
+    from common import refdata
+
+    refdata.MEMORY_ONLY = True
+
+    from langchain_core.messages import HumanMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from langgraph.types import Command
+
+    from services.brain.workflows.investment.graph import build_graph as build_investment
+    from services.brain.workflows.loans.graph import build_graph as build_loans
+    from services.llms import usage
+    from services.master.graph import build_graph as build_master
+
+    saver = InMemorySaver()
+    serde = CountingSerde(saver.serde, capture)
+    saver.serde = serde
+    graphs = {
+        "master": build_master().compile(checkpointer=saver),
+        "loans": build_loans(saver),
+        "investment": build_investment(saver),
+    }
+
+    async def turn_input(graph, service, scenario, idx, text, config):
+        if service == "master":
+            return {"messages": [HumanMessage(content=text)]}
+        snap = await graph.aget_state(config)
+        if snap.interrupts:
+            return Command(resume=text)
+        messages = []
+        if idx == 0 and scenario.get("contexto"):
+            messages.append(HumanMessage(content=f"{_CONTEXT_PREFIX} {scenario['contexto']}"))
+        messages.append(HumanMessage(content=text))
+        base = {"messages": messages, "customer_id": scenario["customer_id"]}
+        if service == "loans":
+            base.update({"data_ref": "", "confirmed": False})
+        return base
+
+    results = {}
+    try:
+        for scenario in scenarios:
+            service = scenario["service"]
+            if service not in graphs:
+                continue
+            graph = graphs[service]
+            responder.start(scenario)
+            config = {"configurable": {"thread_id": scenario["customer_id"]}}
+            turns = []
+            for idx, text in enumerate(scenario["turns"]):
+                inp = await turn_input(graph, service, scenario, idx, text, config)
+                before = serde.bytes
+                steps = 0
+                with usage.recording(f"replay-{service}", scenario["customer_id"]) as rec:
+                    started = time.perf_counter()
+                    async for chunk in graph.astream(inp, config, stream_mode="updates"):
+                        steps += sum(1 for k in chunk if k != "__interrupt__")
+                    wall_ms = (time.perf_counter() - started) * 1000
+                turns.append(
+                    {
+                        "wall_ms": wall_ms,
+                        "steps": steps,
+                        "checkpoint_bytes": serde.bytes - before,
+                        "prompt_tokens": sum(c["input_tokens"] for c in rec.calls),
+                        "llm_calls": len(rec.calls),
+                    }
+                )
+            results[scenario["id"]] = {
+                "service": service,
+                "turns": turns,
+                "steps": sum(t["steps"] for t in turns),
+                "checkpoint_bytes": sum(t["checkpoint_bytes"] for t in turns),
+                "prompt_tokens": sum(t["prompt_tokens"] for t in turns),
+                "llm_calls": sum(t["llm_calls"] for t in turns),
+                "wall_ms": sum(t["wall_ms"] for t in turns),
+                "turn_p50_ms": percentile([t["wall_ms"] for t in turns], 0.5),
+                "turn_p95_ms": percentile([t["wall_ms"] for t in turns], 0.95),
+            }
+    finally:
+        server.shutdown()
+    return results
+
+
+def compare(results: dict, baseline: dict, tol: dict, check_time: bool) -> list[str]:
+    """Lista de regresiones (vacía si todo está dentro de tolerancia)."""
+    failures = []
+    for sid, r in results.items():
+        b = baseline.get(sid)
+        if b is None:
+            continue
+        if r["steps"] > b["steps"]:
+            failures.append(f"{sid}: pasos del grafo {b['steps']} → {r['steps']}")
+        for key, label in (("prompt_tokens", "tokens de prompt"), ("checkpoint_bytes", "bytes de checkpoint")):
+            if b[key] and r[key] > b[key] * (1 + tol[key]):
+                failures.append(f"{sid}: {label} {b[key]} → {r[key]} (+{(r[key] / b[key] - 1) * 100:.1f}%)")
+        if check_time and b["wall_ms"] and r["wall_ms"] > b["wall_ms"] * (1 + tol["wall_ms"]):
+            failures.append(f"{sid}: tiempo {b['wall_ms']:.0f}ms → {r['wall_ms']:.0f}ms")
+    return failures
+
+
+def _print(results: dict) -> None:
+    print(f"{'escenario':32} {'turnos':>6} {'pasos':>6} {'llm':>4} {'ckpt KB':>9} {'tokens':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for sid, r in results.items():
+        print(
+            f"{sid[:32]:32} {len(r['turns']):>6} {r['steps']:>6} {r['llm_calls']:>4} "
+            f"{r['checkpoint_bytes'] / 1024:>9.1f} {r['prompt_tokens']:>8} "
+            f"{r['turn_p50_ms']:>8.1f} {r['turn_p95_ms']:>8.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay de conversaciones como benchmark")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    exp = sub.add_parser("export", help="escenarios desde la tabla conversations")
+    exp.add_argument("--out", required=True)
+    exp.add_argument("--limit", type=int, default=200)
+
+    run = sub.add_parser("run", help="replay + comparación con baseline")
+    run.add_argument("--scenarios", default=DEFAULT_SCENARIOS)
+    run.add_argument("--baseline", default=DEFAULT_BASELINE)
+    run.add_argument("--llm", choices=("recorded", "scripted"), default="recorded")
+    run.add_argument("--script", default=DEFAULT_SCRIPT)
+    run.add_argument("--update-baseline", action="store_true")
+    run.add_argument("--tol-tokens", type=float, default=0.05)
+    run.add_argument("--tol-bytes", type=float, default=0.10)
+    run.add_argument("--tol-time", type=float, default=0.50)
+    run.add_argument("--check-time", action="store_true", help="también falla por tiempo (ruidoso)")
+    run.add_argument("--json", help="guardar resultados por turno en este archivo")
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        n = asyncio.run(export_scenarios(args.out, args.limit))
+        print(f"{n} escenarios → {args.out}")
+        return
+
+    results = asyncio.run(run_scenarios(load_scenarios(args.scenarios), args.llm, args.script))
+    _print(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    summary = {
+        sid: {k: r[k] for k in ("steps", "checkpoint_bytes", "prompt_tokens", "wall_ms")}
+        for sid, r in results.items()
+    }
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"\nbaseline actualizado → {args.baseline}")
+        return
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"\nsin baseline en {args.baseline}: correr con --update-baseline para crearlo")
+        return
+
+    tol = {"prompt_tokens": args.tol_tokens, "checkpoint_bytes": args.tol_bytes, "wall_ms": args.tol_time}
+    failures = compare(summary, baseline, tol, args.check_time)
+    if failures:
+        print("\nREGRESIONES:")
+        for line in failures:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("\nsin regresiones contra el baseline")
+
+
+if __name__ == "__main__":
+    main()
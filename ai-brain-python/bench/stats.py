@@ -0,0 +1,69 @@
+"""Percentiles y lectura de spans exportados por common.tracing (modo file)."""
+from __future__ import annotations
+
+import json
+from collections import defaultdict
+from typing import Iterable, Optional
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "n": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def load_spans(path: str, trace_ids: Optional[set] = None) -> Iterable[dict]:
+    """Spans OTLP/JSON (una línea por lote); filtra por trace id si se pasa el set."""
+    try:
+        f = open(path, encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                batch = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            for rs in batch.get("resourceSpans", []):
+                service = next(
+                    (
+                        a["value"].get("stringValue")
+                        for a in rs.get("resource", {}).get("attributes", [])
+                        if a.get("key") == "service.name"
+                    ),
+                    "",
+                )
+                for ss in rs.get("scopeSpans", []):
+                    for span in ss.get("spans", []):
+                        if trace_ids is None or span.get("traceId") in trace_ids:
+                            span["service"] = service
+                            yield span
+
+
+def hop_latencies(spans: Iterable[dict]) -> dict[str, list[float]]:
+    """Duración (ms) por "servicio: nombre de span"."""
+    out: dict[str, list[float]] = defaultdict(list)
+    for s in spans:
+        ms = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+        out[f"{s['service']}: {s['name']}"].append(ms)
+    return out
+
+
+def print_table(title: str, rows: dict[str, dict], unit: str = "ms") -> None:
+    print(f"\n== {title} ==")
+    print(f"{'':48} {'n':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  ({unit})")
+    for name, s in rows.items():
+        print(
+            f"{name[:48]:48} {s['n']:>7} {s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f} {s['max']:>9.1f}"
+        )
@@ -0,0 +1,104 @@
+"""
+Microbenchmarks del codec compartido (common.wire) contra el JSON armado a mano que había en
+cada servicio, sobre los caminos calientes:
+
+- chat-response: payload de send_chat_response (kafka_config);
+- chat-queries: value_deserializer del consumer del clasificador (kafka_config);
+- campos de stream: XADD del clasificador;
+- conversations: JSONB de save_conversation (conversation_store), al final de cada turno de
+  master y de los workflows.
+
+Antes de medir verifica que los dos caminos den lo mismo (sale con código 1 si no).
+
+    python -m bench.wire_bench [--rounds 200000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+
+from common import wire
+
+_REPLY = (
+    "¡Perfecto, Facundo! Con la oferta de 36 cuotas a TNA 78% podés refinanciar los dos préstamos "
+    "(saldo total $1.000.000) y te quedan $200.000 de efectivo en mano. La cuota nueva sería de "
+    "$48.512,33 contra los $61.200 que pagás hoy: ahorrás $12.687,67 por mes. ¿Confirmás la operación? "
+) * 2
+_QUERY = {
+    "customerId": "facuvega-001",
+    "contenido": "quiero refinanciar los dos préstamos y sacar 200 mil en mano, ¿cuánto me queda la cuota?",
+    "contexto": _REPLY,
+}
+_CONVERSATION = [
+    {"role": "user" if i % 2 == 0 else "assistant", "content": _QUERY["contenido"] if i % 2 == 0 else _REPLY}
+    for i in range(20)
+]
+
+
+def _legacy_reply(customer_id, reply):
+    return json.dumps({"customerId": customer_id, "reply": reply}, ensure_ascii=False).encode("utf-8")
+
+
+def _legacy_fields(data):
+    return {k: str(v) if v is not None else "" for k, v in data.items()}
+
+
+_QUERY_RAW = json.dumps(_QUERY, ensure_ascii=False).encode()
+
+CASES = [
+    (
+        "chat-response encode",
+        lambda: _legacy_reply("facuvega-001", _REPLY),
+        lambda: wire.chat_reply("facuvega-001", _REPLY),
+        lambda a, b: json.loads(a) == json.loads(b),
+    ),
+    (
+        "chat-queries decode",
+        lambda: json.loads(_QUERY_RAW.decode("utf-8")),
+        lambda: wire.loads(_QUERY_RAW),
+        lambda a, b: a == b,
+    ),
+    (
+        "stream fields encode",
+        lambda: _legacy_fields(_QUERY),
+        lambda: wire.encode_fields(_QUERY),
+        lambda a, b: a == b,
+    ),
+    (
+        "conversations jsonb",
+        lambda: json.dumps(_CONVERSATION),
+        lambda: wire.dumps_str(_CONVERSATION),
+        lambda a, b: json.loads(a) == json.loads(b),
+    ),
+]
+
+
+def _time(fn, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmarks del codec de cableado")
+    parser.add_argument("--rounds", type=int, default=200_000)
+    args = parser.parse_args()
+
+    failed = [name for name, legacy, new, same in CASES if not same(legacy(), new())]
+    if failed:
+        print(f"resultado distinto al anterior: {', '.join(failed)}")
+        sys.exit(1)
+
+    print(f"backend: {wire.BACKEND}, {args.rounds} rondas\n")
+    print(f"{'camino':24} {'antes µs':>9} {'wire µs':>9} {'×':>6}")
+    for name, legacy, new, _ in CASES:
+        before = _time(legacy, args.rounds)
+        after = _time(new, args.rounds)
+        print(f"{name:24} {before:>9.2f} {after:>9.2f} {before / after:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Control de admisión en el ingreso (clasificador).
+
+Tres piezas:
+- profundidad de los streams destino (pendientes + sin entregar) y turnos LLM en curso;
+- cuota por cliente con token bucket en Redis;
+- ante sobrecarga: respuesta "ocupado" inmediata o diferir el trabajo de baja prioridad
+  (to-master, consultas genéricas) en vez de encolar sin límite.
+"""
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Cuota por cliente: ráfaga máxima y reposición (mensajes por minuto).
+QUOTA_BURST = int(os.getenv("QUOTA_BURST", "6"))
+QUOTA_REFILL_PER_MIN = float(os.getenv("QUOTA_REFILL_PER_MIN", "12"))
+
+# Backlog (pendientes + lag) a partir del cual se responde "ocupado".
+ADMISSION_MAX_BACKLOG = int(os.getenv("ADMISSION_MAX_BACKLOG", "200"))
+# Backlog a partir del cual se difiere el trabajo de baja prioridad.
+ADMISSION_SOFT_BACKLOG = int(os.getenv("ADMISSION_SOFT_BACKLOG", "80"))
+# Turnos con LLM en vuelo (todos los workers) antes de rechazar.
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "32"))
+# Cada cuánto se vuelve a medir Redis (seg); entre mediciones se usa la última foto.
+ADMISSION_PROBE_INTERVAL_S = float(os.getenv("ADMISSION_PROBE_INTERVAL_S", "1.0"))
+
+# Diferidos: si esperan más que esto, se contesta "ocupado" y se descartan.
+DEFER_MAX_AGE_S = int(os.getenv("DEFER_MAX_AGE_S", "60"))
+DEFER_MAX_QUEUE = int(os.getenv("DEFER_MAX_QUEUE", "500"))
+
+# Un turno que no liberó su lugar (worker caído) deja de contar pasado este tiempo.
+INFLIGHT_LEASE_S = 120
+INFLIGHT_KEY = "llm_inflight"
+
+BUSY_REPLY = (
+    "Estamos con mucha demanda en este momento. Probá de nuevo en unos segundos, por favor."
+)
+QUOTA_REPLY = (
+    "Recibimos varios mensajes seguidos tuyos. Esperá unos segundos y volvé a escribir, "
+    "así te respondemos en orden."
+)
+
+# Qué streams cargan con el trabajo de cada destino del clasificador.
+DOWNSTREAM = {
+    "to-master": ("to-master",),
+    "to-brain": ("to-brain", "workflow_loans", "workflow_investment"),
+}
+# Trabajo genérico (sin operar en la cuenta): es lo primero que se difiere.
+LOW_PRIORITY = {"to-master"}
+
+ADMIT = "admit"
+BUSY = "busy"
+DEFER = "defer"
+
+# Token bucket atómico: KEYS[1]=quota:{customerId}; ARGV = capacidad, reposición/seg, ahora (ms), costo.
+_TOKEN_BUCKET_LUA = """
+local cap = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1])
+local ts = tonumber(b[2])
+if tokens == nil then
+  tokens = cap
+  ts = now
+end
+tokens = math.min(cap, tokens + (math.max(0, now - ts) / 1000.0) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+local ttl = math.ceil(((cap - tokens) / math.max(rate, 0.001)) * 1000) + 1000
+redis.call('PEXPIRE', KEYS[1], ttl)
+return allowed
+"""
+
+_scripts: dict = {}
+_snapshot = {"ts": 0.0, "backlog": {}, "inflight": 0}
+
+
+def _bucket(redis):
+    key = id(redis)
+    if key not in _scripts:
+        _scripts[key] = redis.register_script(_TOKEN_BUCKET_LUA)
+    return _scripts[key]
+
+
+async def take_quota(redis, customer_id: str, cost: int = 1) -> bool:
+    """Consume `cost` fichas del bucket del cliente; False si se quedó sin cuota."""
+    if not customer_id:
+        return True
+    allowed = await _bucket(redis)(
+        keys=[f"quota:{customer_id}"],
+        args=[QUOTA_BURST, QUOTA_REFILL_PER_MIN / 60.0, int(time.time() * 1000), cost],
+    )
+    return bool(int(allowed))
+
+
+async def quota_notice(redis, customer_id: str) -> bool:
+    """True la primera vez que el cliente se queda sin cuota en la ventana: un solo QUOTA_REPLY."""
+    # La ventana es lo que tarda el bucket en llenarse de nuevo.
+    window_s = max(1, math.ceil(QUOTA_BURST * 60 / max(QUOTA_REFILL_PER_MIN, 0.001)))
+    return bool(await redis.set(f"quota_notice:{customer_id}", "1", nx=True, ex=window_s))
+
+
+async def stream_backlog(redis, stream: str) -> int:
+    """Entradas sin terminar en el stream: pendientes (sin ack) + lag (sin entregar) del grupo más atrasado."""
+    try:
+        groups = await redis.xinfo_groups(stream)
+    except Exception:
+        # Stream aún no creado (o Redis sin XINFO): no hay backlog medible.
+        return 0
+    worst = 0
+    for g in groups:
+        pending = int(g.get("pending") or 0)
+        lag = g.get("lag")
+        worst = max(worst, pending + (int(lag) if lag is not None else 0))
+    return worst
+
+
+async def llm_inflight(redis) -> int:
+    """Turnos con LLM en curso en todo el cluster (descarta leases vencidos)."""
+    await redis.zremrangebyscore(INFLIGHT_KEY, "-inf", time.time() - INFLIGHT_LEASE_S)
+    return int(await redis.zcard(INFLIGHT_KEY))
+
+
+@asynccontextmanager
+async def track_llm_turn(redis, member: str):
+    """Marca un turno con LLM en vuelo mientras dura el bloque (lo ve el control de admisión)."""
+    await redis.zadd(INFLIGHT_KEY, {member: time.time()})
+    try:
+        yield
+    finally:
+        try:
+            await redis.zrem(INFLIGHT_KEY, member)
+        except Exception:
+            logger.warning("admission: no se pudo liberar %s de %s", member, INFLIGHT_KEY)
+
+
+async def _load_snapshot(redis) -> dict:
+    now = time.monotonic()
+    if now - _snapshot["ts"] < ADMISSION_PROBE_INTERVAL_S:
+        return _snapshot
+    streams = {s for group in DOWNSTREAM.values() for s in group}
+    backlog = {s: await stream_backlog(redis, s) for s in streams}
+    _snapshot.update(ts=now, backlog=backlog, inflight=await llm_inflight(redis))
+    return _snapshot
+
+
+async def admit(redis, target_stream: str) -> str:
+    """
+    Decide si un mensaje ya enrutado entra al pipeline.
+    Retorna ADMIT | BUSY | DEFER (la cuota por cliente se chequea antes con take_quota).
+    """
+    snap = await _load_snapshot(redis)
+    backlog = sum(snap["backlog"].get(s, 0) for s in DOWNSTREAM.get(target_stream, (target_stream,)))
+    if snap["inflight"] >= ADMISSION_MAX_INFLIGHT or backlog >= ADMISSION_MAX_BACKLOG:
+        logger.warning(
+            "admission: BUSY target=%s backlog=%s inflight=%s",
+            target_stream,
+            backlog,
+            snap["inflight"],
+        )
+        return BUSY
+    if target_stream in LOW_PRIORITY and backlog >= ADMISSION_SOFT_BACKLOG:
+        return DEFER
+    return ADMIT
+
+
+async def defer(redis, target_stream: str, fields: dict) -> bool:
+    """Encola en deferred:{stream}; False si esa cola también está llena (responder ocupado)."""
+    key = f"deferred:{target_stream}"
+    if await redis.xlen(key) >= DEFER_MAX_QUEUE:
+        return False
+    await redis.xadd(key, {**fields, "deferredAt": str(time.time())})
+    return True
+
+
+async def drain_deferred(redis, on_expired, *, batch: int = 20) -> int:
+    """
+    Reinyecta diferidos cuando el destino bajó del umbral blando. Los que esperaron
+    más de DEFER_MAX_AGE_S se descartan llamando on_expired(customer_id).
+    Retorna cuántos movió.
+    """
+    moved = 0
+    for target in LOW_PRIORITY:
+        key = f"deferred:{target}"
+        entries = await redis.xrange(key, count=batch)
+        if not entries:
+            continue
+        backlog = sum([await stream_backlog(redis, s) for s in DOWNSTREAM[target]])
+        now = time.time()
+        for entry_id, data in entries:
+            deferred_at = float(data.pop(b"deferredAt", b"0") or 0)
+            if now - deferred_at > DEFER_MAX_AGE_S:
+                await on_expired(data.get(b"customerId", b"").decode())
+            elif backlog < ADMISSION_SOFT_BACKLOG:
+                await redis.xadd(target, data)
+                backlog += 1
+                moved += 1
+            else:
+                break
+            await redis.xdel(key, entry_id)
+    return moved
@@ -0,0 +1,132 @@
+"""
+Motor de amortización (sistema francés con TNA anual: tasa mensual i = TNA / 100 / 12).
+
+Cuota, costo total e intereses de todas las combinaciones oferta × cuotas × monto en una
+sola pasada vectorizada (NumPy), y el cronograma cuota a cuota de un préstamo. El agente
+lee estos números en vez de aproximar la cuota "de cabeza".
+
+Todo lo que se devuelve son tipos de Python (float/int), listos para JSON y checkpoints.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+# Montos de referencia que se simulan siempre (además de topes de ofertas y saldos).
+DEFAULT_AMOUNTS = (100_000.0, 500_000.0, 1_000_000.0)
+
+
+def monthly_rate(tna_pct) -> np.ndarray:
+    return np.asarray(tna_pct, dtype=float) / 100.0 / 12.0
+
+
+def installment(principal, tna_pct, quotas) -> np.ndarray:
+    """Cuota fija mensual. Los tres argumentos se combinan por broadcasting."""
+    p = np.asarray(principal, dtype=float)
+    i = monthly_rate(tna_pct)
+    n = np.asarray(quotas, dtype=float)
+    growth = np.power(1.0 + i, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        french = p * i * growth / (growth - 1.0)
+        flat = p / n
+    return np.where(i == 0.0, flat, french)
+
+
+def _offer_arrays(offers: list[dict]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    tna = np.array([float(o.get("tnaAnualPorciento") or 0.0) for o in offers])
+    quotas = np.array([int(o.get("maxQuotas") or 0) for o in offers])
+    caps = np.array([float(o.get("maxAmount") or np.inf) for o in offers])
+    return tna, quotas, caps
+
+
+def simulate_offers(
+    offers: list[dict], amounts: list[float], quotas: list[int] | None = None
+) -> list[dict]:
+    """
+    Filas (oferta × cuotas × monto) con cuota, costo total e intereses.
+
+    Sin `quotas` cada oferta se simula con su propio plazo (`maxQuotas`); con `quotas` se
+    prueban esas cantidades, hasta el plazo de la oferta. Los montos sobre el tope
+    (`maxAmount`) de una oferta se descartan.
+    """
+    offers = [o for o in offers or [] if o.get("tnaAnualPorciento") is not None]
+    if not offers or not amounts:
+        return []
+    tna, max_quotas, caps = _offer_arrays(offers)
+    amt = np.asarray(sorted(set(float(a) for a in amounts)), dtype=float)
+
+    if quotas:
+        q = np.asarray(sorted(set(int(x) for x in quotas)), dtype=float)[None, :]
+        q = np.broadcast_to(q, (len(offers), q.shape[1]))
+    else:
+        q = max_quotas.astype(float)[:, None]
+
+    # Ejes: oferta × cuotas × monto.
+    cuota = installment(amt[None, None, :], tna[:, None, None], q[:, :, None])
+    total = cuota * q[:, :, None]
+    valid = (
+        (q[:, :, None] > 0)
+        & (q[:, :, None] <= max_quotas[:, None, None])
+        & (amt[None, None, :] <= caps[:, None, None] + 0.01)
+    )
+
+    rows = []
+    for o, k, a in zip(*np.nonzero(valid)):
+        rows.append(
+            {
+                "tna": float(tna[o]),
+                "cuotas": int(q[o, k]),
+                "monto": float(amt[a]),
+                "cuota": round(float(cuota[o, k, a]), 2),
+                "costoTotal": round(float(total[o, k, a]), 2),
+                "intereses": round(float(total[o, k, a] - amt[a]), 2),
+                "maxAmount": None if np.isinf(caps[o]) else float(caps[o]),
+                "plazoOferta": int(max_quotas[o]),
+            }
+        )
+    return rows
+
+
+def schedule(principal: float, tna_pct: float, quotas: int) -> list[dict]:
+    """Cronograma cuota a cuota: interés, amortización y saldo después de cada pago."""
+    n = int(quotas)
+    if n <= 0:
+        return []
+    i = float(monthly_rate(tna_pct))
+    c = float(installment(principal, tna_pct, n))
+    k = np.arange(1, n + 1, dtype=float)
+    if i == 0.0:
+        balance = principal - c * k
+    else:
+        growth = np.power(1.0 + i, k)
+        balance = principal * growth - c * (growth - 1.0) / i
+    balance = np.where(np.abs(balance) < 0.005, 0.0, balance)
+    before = np.concatenate(([float(principal)], balance[:-1]))
+    interest = before * i
+    return [
+        {
+            "n": int(kk),
+            "cuota": round(c, 2),
+            "interes": round(float(ii), 2),
+            "amortizacion": round(float(c - ii), 2),
+            "saldo": round(float(bb), 2),
+        }
+        for kk, ii, bb in zip(k, interest, balance)
+    ]
+
+
+def precompute(offers: list[dict], refinanceable: list[dict]) -> list[dict]:
+    """
+    Tabla que se carga con los datos del cliente: cada oferta con su plazo, para los montos
+    de referencia, su propio tope y los saldos refinanciables (uno por uno y todos juntos).
+    """
+    balances = [
+        float(l["remainingAmount"])
+        for l in refinanceable or []
+        if l.get("remainingAmount") is not None
+    ]
+    amounts = set(DEFAULT_AMOUNTS)
+    amounts.update(float(o["maxAmount"]) for o in offers or [] if o.get("maxAmount") is not None)
+    amounts.update(balances)
+    if len(balances) > 1:
+        amounts.add(sum(balances))
+    return simulate_offers(offers, sorted(amounts))
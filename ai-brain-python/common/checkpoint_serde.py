@@ -0,0 +1,141 @@
+"""
+Serializador compacto para los checkpoints de LangGraph en Redis.
+
+AsyncRedisSaver guarda cada checkpoint como documento RedisJSON con los canales (la lista
+completa de mensajes, tool calls incluidas) inline en el formato constructor de LangChain, y
+cada write como ese mismo JSON en base64. Con CHECKPOINT_SERDE=compact:
+
+- los writes van en msgpack (el de LangGraph, con tipos ext) y, desde
+  CHECKPOINT_COMPRESS_MIN_BYTES, comprimidos con zstd (o lz4): tipo "msgpack+zstd";
+- en el documento del checkpoint, los canales que llegan al umbral quedan como
+  {"__ckpt__": tipo, "b": base64}; los chicos siguen en JSON legible;
+- la metadata y el resto del documento siguen en JSON (RedisJSON los indexa para las búsquedas).
+
+Lectura compatible en los dos modos: writes "json"/"msgpack" y canales inline de checkpoints
+viejos se leen como antes, así que se puede volver a CHECKPOINT_SERDE=json sin perder hilos.
+
+CompactAsyncRedisSaver pisa métodos privados de AsyncRedisSaver: langgraph-checkpoint-redis
+va fijado en requirements.txt y `make checkpoint-bench` chequea la lectura al actualizarlo.
+"""
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+from langgraph.checkpoint.redis import AsyncRedisSaver
+from langgraph.checkpoint.redis.jsonplus_redis import JsonPlusRedisSerializer
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_SERDE = os.getenv("CHECKPOINT_SERDE", "compact")  # compact | json
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "zstd")  # zstd | lz4 | none
+CHECKPOINT_COMPRESS_MIN_BYTES = int(os.getenv("CHECKPOINT_COMPRESS_MIN_BYTES", "1024"))
+
+_ZSTD_LEVEL = 3
+# Canal empaquetado dentro del documento JSON del checkpoint.
+_MARKER = "__ckpt__"
+
+# Mientras está activo, dumps_typed devuelve JSON: documento del checkpoint y metadata.
+_json_documents: ContextVar[bool] = ContextVar("checkpoint_json_documents", default=False)
+
+
+def codec(name: str):
+    """(compress, decompress) del algoritmo, o None si es "none" o no está instalado."""
+    if name == "zstd":
+        import zstandard
+
+        return (lambda data: zstandard.compress(data, _ZSTD_LEVEL)), zstandard.decompress
+    if name == "lz4":
+        try:
+            import lz4.frame
+        except ImportError:
+            return None
+        return lz4.frame.compress, lz4.frame.decompress
+    return None
+
+
+class CompactSerializer(JsonPlusRedisSerializer):
+    def __init__(
+        self,
+        compact: bool = CHECKPOINT_SERDE == "compact",
+        compression: str = CHECKPOINT_COMPRESSION,
+        min_bytes: int = CHECKPOINT_COMPRESS_MIN_BYTES,
+    ):
+        super().__init__()
+        self.compact = compact
+        self.min_bytes = min_bytes
+        self._codec = codec(compression)
+        self.compression = compression if self._codec else "none"
+        if compression not in ("none", self.compression):
+            logger.warning("[checkpoint] compresión %s no disponible: msgpack sin comprimir", compression)
+
+    @contextmanager
+    def json_documents(self):
+        token = _json_documents.set(True)
+        try:
+            yield
+        finally:
+            _json_documents.reset(token)
+
+    def pack(self, obj) -> tuple[str, bytes]:
+        """msgpack; comprimido si llega a `min_bytes` y hay algoritmo."""
+        type_, data = JsonPlusSerializer.dumps_typed(self, obj)
+        if self._codec and type_ == "msgpack" and len(data) >= self.min_bytes:
+            return f"{type_}+{self.compression}", self._codec[0](data)
+        return type_, data
+
+    def dumps_typed(self, obj):
+        if not self.compact or _json_documents.get() or obj is None or isinstance(obj, (bytes, bytearray)):
+            return super().dumps_typed(obj)
+        return self.pack(obj)
+
+    def loads_typed(self, data):
+        type_, raw = data
+        base, _, algo = type_.partition("+")
+        if algo:
+            # Cualquier algoritmo escrito se puede leer aunque hoy se escriba con otro.
+            decoder = codec(algo)
+            if decoder is None:
+                raise ValueError(f"checkpoint comprimido con {algo}, que no está instalado")
+            return super().loads_typed((base, decoder[1](raw)))
+        return super().loads_typed(data)
+
+
+class CompactAsyncRedisSaver(AsyncRedisSaver):
+    """AsyncRedisSaver con CompactSerializer y canales grandes empaquetados en el documento."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.serde = CompactSerializer()
+
+    def _pack_channel(self, value):
+        type_, data = self.serde.pack(value)
+        if not type_.startswith("msgpack") or (type_ == "msgpack" and len(data) < self.serde.min_bytes):
+            return value
+        return {_MARKER: type_, "b": self._encode_blob(data)}
+
+    def _dump_checkpoint(self, checkpoint):
+        if self.serde.compact and checkpoint.get("channel_values"):
+            checkpoint = {
+                **checkpoint,
+                "channel_values": {k: self._pack_channel(v) for k, v in checkpoint["channel_values"].items()},
+            }
+        with self.serde.json_documents():
+            return super()._dump_checkpoint(checkpoint)
+
+    def _dump_metadata(self, metadata):
+        with self.serde.json_documents():
+            return super()._dump_metadata(metadata)
+
+    def _load_metadata(self, metadata):
+        with self.serde.json_documents():
+            return super()._load_metadata(metadata)
+
+    def _recursive_deserialize(self, obj):
+        if isinstance(obj, dict) and len(obj) == 2 and _MARKER in obj and "b" in obj:
+            return self.serde.loads_typed((obj[_MARKER], self._decode_blob(obj["b"])))
+        return super()._recursive_deserialize(obj)
@@ -0,0 +1,113 @@
+"""
+Ventana de agrupamiento en el ingreso: los fragmentos que un cliente manda seguidos
+("hola" / "quiero refinanciar" / "el de 500 mil") se juntan en un solo turno.
+
+Cada fragmento reinicia un timer de COALESCE_WINDOW_S; al vencer (o al llegar a
+COALESCE_MAX_WAIT_S desde el primero) se llama a `flush(customer_id, fragments, tokens)` con
+todos. `tokens` son los que se pasaron en `add` (el clasificador manda el record de Kafka, que
+recién se da por procesado y se commitea después del flush).
+Vive en memoria del clasificador: chat-queries usa customerId como key, así que todos los
+fragmentos de un cliente llegan a la misma partición y al mismo proceso. Los flush de un
+mismo cliente van en orden (uno por vez).
+
+COALESCE_WINDOW_S=0 desactiva la ventana (cada mensaje es un turno, como antes).
+"""
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+COALESCE_WINDOW_S = float(os.getenv("COALESCE_WINDOW_S", "1.2"))
+COALESCE_MAX_WAIT_S = float(os.getenv("COALESCE_MAX_WAIT_S", "4"))
+
+
+def merge_fragments(fragments: list[dict]) -> dict:
+    """Un solo payload: contenidos unidos por salto de línea, el resto del último fragmento."""
+    merged = dict(fragments[-1])
+    merged["contenido"] = "\n".join(
+        str(f.get("contenido") or "").strip() for f in fragments if str(f.get("contenido") or "").strip()
+    )
+    contexto = next((f.get("contexto") for f in fragments if f.get("contexto")), None)
+    if contexto:
+        merged["contexto"] = contexto
+    return merged
+
+
+class _Buffer:
+    __slots__ = ("fragments", "tokens", "first", "timer")
+
+    def __init__(self):
+        self.fragments: list[dict] = []
+        self.tokens: list = []
+        self.first = time.monotonic()
+        self.timer: asyncio.Task | None = None
+
+
+class Coalescer:
+    def __init__(self, flush, window_s: float = COALESCE_WINDOW_S, max_wait_s: float = COALESCE_MAX_WAIT_S):
+        self._flush = flush
+        self.window_s = window_s
+        self.max_wait_s = max_wait_s
+        self._pending: dict[str, _Buffer] = {}
+        # customer_id → (lock, flushes usándolo); se borra cuando nadie lo usa.
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    def pending(self, customer_id: str) -> int:
+        buf = self._pending.get(customer_id)
+        return len(buf.fragments) if buf else 0
+
+    async def add(self, customer_id: str, fragment: dict, *, prepend: dict | None = None, token=None) -> None:
+        """`prepend`: texto de un turno cancelado que tiene que ir antes que lo nuevo."""
+        tokens = [token] if token is not None else []
+        if self.window_s <= 0:
+            await self._run(customer_id, [f for f in (prepend, fragment) if f], tokens)
+            return
+        buf = self._pending.get(customer_id)
+        if buf is None:
+            buf = self._pending[customer_id] = _Buffer()
+        if prepend:
+            buf.fragments.insert(0, prepend)
+        buf.fragments.append(fragment)
+        buf.tokens.extend(tokens)
+        if buf.timer is not None:
+            buf.timer.cancel()
+        delay = min(self.window_s, max(0.0, buf.first + self.max_wait_s - time.monotonic()))
+        buf.timer = asyncio.create_task(self._fire(customer_id, delay))
+
+    async def _fire(self, customer_id: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # Desde acá el buffer ya no recibe fragmentos: los nuevos arman otro.
+        buf = self._pending.pop(customer_id, None)
+        if buf is not None:
+            await self._run(customer_id, buf.fragments, buf.tokens)
+
+    async def _run(self, customer_id: str, fragments: list[dict], tokens: list) -> None:
+        lock, users = self._locks.get(customer_id) or (asyncio.Lock(), 0)
+        self._locks[customer_id] = (lock, users + 1)
+        try:
+            async with lock:
+                if len(fragments) > 1:
+                    logger.info("[coalesce] %s: %s fragmentos en un turno", customer_id, len(fragments))
+                await self._flush(customer_id, fragments, tokens)
+        except Exception:
+            logger.exception("[coalesce] flush de %s falló", customer_id)
+        finally:
+            lock, users = self._locks[customer_id]
+            if users <= 1:
+                del self._locks[customer_id]
+            else:
+                self._locks[customer_id] = (lock, users - 1)
+
+    async def close(self) -> None:
+        """Despacha ya lo que quedó en ventana (apagado ordenado)."""
+        for customer_id in list(self._pending):
+            buf = self._pending.pop(customer_id)
+            if buf.timer is not None:
+                buf.timer.cancel()
+            await self._run(customer_id, buf.fragments, buf.tokens)
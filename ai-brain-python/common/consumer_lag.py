@@ -0,0 +1,311 @@
+"""
+Atraso de los consumidores y réplicas recomendadas, en formato de texto de Prometheus.
+
+Por cada grupo:
+- Kafka (classifier-group en chat-queries): lag por partición (fin del topic − offset
+  commiteado) y tasa de llegada;
+- streams de Redis (master-group, brain-group, loans-group, investment-group): largo del
+  stream, pendientes (XPENDING), sin entregar, edad de la pendiente más vieja y de la primera
+  sin entregar, tasas de llegada y de procesamiento (ventana de LAG_RATE_WINDOW_S) y tiempo de
+  servicio observado por los workers (kafka_config.service_time_key).
+
+Réplicas recomendadas por stream: las que hacen falta para atender la llegada con
+utilización LAG_TARGET_UTILIZATION y, además, vaciar el backlog actual en LAG_DRAIN_S:
+
+    réplicas = ⌈ (λ + backlog / LAG_DRAIN_S) · S / LAG_TARGET_UTILIZATION ⌉   (mínimo 1)
+
+con λ = llegadas/s y S = segundos de servicio por mensaje (mediana de las últimas muestras).
+
+    python -m common.consumer_lag [--port 9108]     →  GET /metrics
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from statistics import median
+
+from dotenv import load_dotenv
+
+from common.kafka_config import BOOTSTRAP_SERVERS, service_time_key
+from common.redis_config import get_redis
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LAG_EXPORTER_PORT = int(os.getenv("LAG_EXPORTER_PORT", "9108"))
+LAG_SAMPLE_INTERVAL_S = float(os.getenv("LAG_SAMPLE_INTERVAL_S", "5"))
+LAG_RATE_WINDOW_S = float(os.getenv("LAG_RATE_WINDOW_S", "60"))
+LAG_TARGET_UTILIZATION = float(os.getenv("LAG_TARGET_UTILIZATION", "0.7"))
+LAG_DRAIN_S = float(os.getenv("LAG_DRAIN_S", "30"))
+
+KAFKA_GROUPS = {"chat-queries": "classifier-group"}
+STREAM_GROUPS = {
+    "to-master": "master-group",
+    "to-brain": "brain-group",
+    "workflow_loans": "loans-group",
+    "workflow_investment": "investment-group",
+}
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _id_ms(entry_id) -> int:
+    return int(_text(entry_id).split("-", 1)[0])
+
+
+class RateWindow:
+    """Tasa (por segundo) de un contador a partir de las muestras de la última ventana."""
+
+    def __init__(self, window_s: float = LAG_RATE_WINDOW_S):
+        self.window_s = window_s
+        self._samples: deque[tuple[float, float]] = deque()
+
+    def add(self, ts: float, value: float | None) -> float | None:
+        if value is None:
+            return None
+        if self._samples and value < self._samples[-1][1]:
+            # El contador volvió a cero (Redis vaciado, topic recreado).
+            self._samples.clear()
+        self._samples.append((ts, value))
+        while len(self._samples) > 2 and ts - self._samples[1][0] >= self.window_s:
+            self._samples.popleft()
+        first_ts, first = self._samples[0]
+        if ts - first_ts <= 0:
+            return None
+        return (value - first) / (ts - first_ts)
+
+
+def recommend_replicas(arrival_rate: float | None, service_s: float | None, backlog: int) -> int | None:
+    if service_s is None:
+        return None
+    demand = (arrival_rate or 0.0) + backlog / LAG_DRAIN_S
+    return max(1, math.ceil(demand * service_s / LAG_TARGET_UTILIZATION))
+
+
+async def service_time(redis, stream: str) -> float | None:
+    raw = await redis.lrange(service_time_key(stream), 0, -1)
+    return median(float(x) for x in raw) if raw else None
+
+
+async def stream_group_stats(redis, stream: str, group: str) -> dict | None:
+    """Foto de un stream y su grupo (None si el stream o el grupo no existen todavía)."""
+    try:
+        info = await redis.xinfo_stream(stream)
+        groups = await redis.xinfo_groups(stream)
+    except Exception:
+        return None
+    g = next((x for x in groups if _text(x["name"]) == group), None)
+    if g is None:
+        return None
+    pending = int(g.get("pending") or 0)
+    oldest_age = 0.0
+    if pending:
+        summary = await redis.xpending(stream, group)
+        if summary.get("min"):
+            oldest_age = max(0.0, time.time() - _id_ms(summary["min"]) / 1000)
+    lag = g.get("lag")
+    entries_read = g.get("entries-read")
+    # La primera sin entregar es la que más espera a un worker libre.
+    head_age = 0.0
+    if lag is None or int(lag):
+        last = _text(g.get("last-delivered-id") or "0-0")
+        head = await redis.xrange(stream, min=f"({last}", count=1)
+        if head:
+            head_age = max(0.0, time.time() - _id_ms(head[0][0]) / 1000)
+    return {
+        "length": int(info.get("length") or 0),
+        "entries_added": info.get("entries-added"),
+        "pending": pending,
+        "undelivered": int(lag) if lag is not None else None,
+        "entries_read": int(entries_read) if entries_read is not None else None,
+        "oldest_pending_age_s": oldest_age,
+        "oldest_undelivered_age_s": head_age,
+        "consumers": int(g.get("consumers") or 0),
+        "service_s": await service_time(redis, stream),
+    }
+
+
+class KafkaLag:
+    """Clientes de Kafka de larga vida para leer offsets commiteados y fin de cada partición."""
+
+    def __init__(self):
+        self._admin = None
+        self._consumer = None
+
+    async def _start(self) -> None:
+        from aiokafka import AIOKafkaConsumer
+        from aiokafka.admin import AIOKafkaAdminClient
+
+        self._admin = AIOKafkaAdminClient(bootstrap_servers=BOOTSTRAP_SERVERS)
+        self._consumer = AIOKafkaConsumer(bootstrap_servers=BOOTSTRAP_SERVERS, enable_auto_commit=False)
+        await self._admin.start()
+        await self._consumer.start()
+
+    async def lag(self, topic: str, group: str) -> dict[int, tuple[int, int]]:
+        """partición → (fin del topic, lag)."""
+        from aiokafka.structs import TopicPartition
+
+        if self._admin is None:
+            await self._start()
+        await self._consumer.topics()
+        partitions = [TopicPartition(topic, p) for p in sorted(self._consumer.partitions_for_topic(topic) or ())]
+        if not partitions:
+            return {}
+        ends = await self._consumer.end_offsets(partitions)
+        starts = await self._consumer.beginning_offsets(partitions)
+        committed = await self._admin.list_consumer_group_offsets(group, partitions=partitions)
+        out = {}
+        for tp in partitions:
+            meta = committed.get(tp)
+            position = meta.offset if meta is not None and meta.offset >= 0 else starts[tp]
+            out[tp.partition] = (ends[tp], max(0, ends[tp] - position))
+        return out
+
+    async def close(self) -> None:
+        if self._consumer is not None:
+            await self._consumer.stop()
+        if self._admin is not None:
+            await self._admin.close()
+
+
+class Collector:
+    """Muestrea cada LAG_SAMPLE_INTERVAL_S y guarda la última foto (los scrapes no tocan Redis)."""
+
+    def __init__(self, redis, kafka: KafkaLag | None = None):
+        self.redis = redis
+        self.kafka = kafka
+        self.snapshot: dict = {"streams": {}, "kafka": {}, "ts": 0.0}
+        self._rates: dict[tuple, RateWindow] = {}
+
+    def _rate(self, key: tuple, ts: float, value) -> float | None:
+        return self._rates.setdefault(key, RateWindow()).add(ts, value)
+
+    async def sample(self) -> dict:
+        ts = time.monotonic()
+        streams = {}
+        for stream, group in STREAM_GROUPS.items():
+            st = await stream_group_stats(self.redis, stream, group)
+            if st is None:
+                continue
+            done = st["entries_read"] - st["pending"] if st["entries_read"] is not None else None
+            st["arrival_rate"] = self._rate(("added", stream), ts, st["entries_added"])
+            st["processed_rate"] = self._rate(("done", stream, group), ts, done)
+            st["backlog"] = st["pending"] + (st["undelivered"] or 0)
+            st["recommended_replicas"] = recommend_replicas(st["arrival_rate"], st["service_s"], st["backlog"])
+            streams[(stream, group)] = st
+        kafka = {}
+        if self.kafka is not None:
+            for topic, group in KAFKA_GROUPS.items():
+                try:
+                    parts = await self.kafka.lag(topic, group)
+                except Exception as e:
+                    logger.warning("[lag] Kafka %s/%s no disponible: %s", topic, group, e)
+                    continue
+                end_total = sum(end for end, _ in parts.values())
+                kafka[(topic, group)] = {
+                    "partitions": parts,
+                    "arrival_rate": self._rate(("kafka", topic), ts, end_total if parts else None),
+                }
+        self.snapshot = {"streams": streams, "kafka": kafka, "ts": time.time()}
+        return self.snapshot
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.sample()
+            except Exception:
+                logger.exception("[lag] error muestreando")
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL_S)
+
+
+_METRICS = [
+    # (nombre, tipo, ayuda, clave en la foto del stream)
+    ("moustro_stream_length", "gauge", "Entradas en el stream", "length"),
+    ("moustro_stream_entries_added_total", "counter", "Entradas agregadas al stream", "entries_added"),
+    ("moustro_stream_group_pending", "gauge", "Entregadas sin ack (XPENDING)", "pending"),
+    ("moustro_stream_group_undelivered", "gauge", "Entradas todavía no entregadas al grupo", "undelivered"),
+    ("moustro_stream_group_entries_read_total", "counter", "Entradas entregadas al grupo", "entries_read"),
+    ("moustro_stream_group_oldest_pending_age_seconds", "gauge", "Edad de la pendiente más vieja", "oldest_pending_age_s"),
+    ("moustro_stream_group_oldest_undelivered_age_seconds", "gauge", "Edad de la primera sin entregar", "oldest_undelivered_age_s"),
+    ("moustro_stream_group_consumers", "gauge", "Consumidores registrados en el grupo", "consumers"),
+    ("moustro_stream_arrival_rate", "gauge", "Llegadas por segundo (ventana)", "arrival_rate"),
+    ("moustro_stream_group_processed_rate", "gauge", "Mensajes terminados por segundo (ventana)", "processed_rate"),
+    ("moustro_stream_group_service_time_seconds", "gauge", "Tiempo de servicio por mensaje (mediana)", "service_s"),
+    ("moustro_stream_group_recommended_replicas", "gauge", "Réplicas recomendadas", "recommended_replicas"),
+]
+
+
+def render(snapshot: dict) -> str:
+    lines = []
+    for name, kind, help_, key in _METRICS:
+        lines += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+        for (stream, group), st in snapshot["streams"].items():
+            if st.get(key) is not None:
+                lines.append(f'{name}{{stream="{stream}",group="{group}"}} {st[key]}')
+    lines += [
+        "# HELP moustro_kafka_consumer_lag Mensajes del topic sin consumir por el grupo",
+        "# TYPE moustro_kafka_consumer_lag gauge",
+    ]
+    for (topic, group), k in snapshot["kafka"].items():
+        for partition, (_, lag) in sorted(k["partitions"].items()):
+            lines.append(f'moustro_kafka_consumer_lag{{topic="{topic}",group="{group}",partition="{partition}"}} {lag}')
+    lines += ["# HELP moustro_kafka_arrival_rate Mensajes por segundo al topic (ventana)", "# TYPE moustro_kafka_arrival_rate gauge"]
+    for (topic, group), k in snapshot["kafka"].items():
+        if k["arrival_rate"] is not None:
+            lines.append(f'moustro_kafka_arrival_rate{{topic="{topic}",group="{group}"}} {k["arrival_rate"]}')
+    lines += ["# HELP moustro_lag_sample_timestamp_seconds Última muestra", "# TYPE moustro_lag_sample_timestamp_seconds gauge"]
+    lines.append(f"moustro_lag_sample_timestamp_seconds {snapshot['ts']}")
+    return "\n".join(lines) + "\n"
+
+
+async def serve(port: int) -> None:
+    redis = get_redis()
+    kafka = KafkaLag()
+    collector = Collector(redis, kafka)
+    sampler = asyncio.create_task(collector.run())
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            path = request.split(b" ")[1] if request.count(b" ") >= 2 else b"/"
+            if path.split(b"?")[0] == b"/metrics":
+                body, status = render(collector.snapshot).encode(), b"200 OK"
+            else:
+                body, status = b"not found\n", b"404 Not Found"
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "0.0.0.0", port)
+    logger.info("📈 Exporter de atraso en :%s/metrics", port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        sampler.cancel()
+        await kafka.close()
+        await redis.aclose()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Exporter Prometheus del atraso de los consumidores")
+    parser.add_argument("--port", type=int, default=LAG_EXPORTER_PORT)
+    args = parser.parse_args()
+    asyncio.run(serve(args.port))
+
+
+if __name__ == "__main__":
+    main()
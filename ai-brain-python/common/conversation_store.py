@@ -1,9 +1,9 @@
 import os
-import json
 import logging
 import asyncpg
 from datetime import datetime, timezone
 from dotenv import load_dotenv
+from common import wire
 
 load_dotenv()
 
@@ -61,7 +61,7 @@ async def save_conversation(customer_id: str, service: str, messages: list) -> N
             """,
             customer_id,
             service,
-            json.dumps(serialized),
+            wire.dumps_str(serialized),
             datetime.now(timezone.utc),
         )
         logger.info(f"[conversation_store] Conversación guardada: customer={customer_id} service={service} msgs={len(serialized)}")
@@ -0,0 +1,253 @@
+"""
+Cuarentena de mensajes venenosos en los streams de trabajo: un mensaje que siempre falla (o
+que tira abajo al worker antes del ack) no se reintenta para siempre ni frena la cola.
+
+poison:{stream}:{id}  hash    attempts, error (TTL POISON_TTL_S)
+retry:{stream}        zset    id → cuándo reintentar (epoch s)
+dead:{stream}         stream  campos originales + deadId, deadError, deadAttempts, deadAt
+
+- `admit` (al tomar el mensaje) suma un intento; también cuentan las entregas que terminaron
+  con el worker caído antes del ack y se releen al reiniciar. Pasado POISON_MAX_DELIVERIES el
+  mensaje va a dead:{stream} sin procesarse.
+- `failed` (excepción al procesar): si quedan intentos lo agenda con backoff exponencial y el
+  mensaje queda pendiente (sin ack); `xreadgroup_with_recovery` lo vuelve a entregar al vencer
+  (XCLAIM) y mientras tanto siguen los mensajes nuevos. Sin intentos, va a dead:{stream}.
+- `handoff` (common.supervisor, al retirar o perder un worker): sus pendientes pasan a la
+  cola de reintentos para que las tome otro.
+- `ack` (mensaje resuelto, bien o mal): XACK y se borra el contador de intentos.
+- `postpone` (common.turns: el cliente tiene otro turno corriendo en otro worker): vuelve a
+  la cola de reintentos sin contar el intento.
+
+    python -m common.deadletter list workflow_loans [--count 20]
+    python -m common.deadletter replay workflow_loans <id>... | --all
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+POISON_MAX_DELIVERIES = int(os.getenv("POISON_MAX_DELIVERIES", "3"))
+POISON_BACKOFF_S = float(os.getenv("POISON_BACKOFF_S", "2"))
+POISON_BACKOFF_MAX_S = float(os.getenv("POISON_BACKOFF_MAX_S", "60"))
+POISON_TTL_S = int(os.getenv("POISON_TTL_S", "86400"))
+DEAD_LETTER_MAXLEN = int(os.getenv("DEAD_LETTER_MAXLEN", "10000"))
+
+# Dueño de las pendientes de workers que ya no existen mientras esperan a un worker vivo.
+HANDOFF_CONSUMER = "handoff"
+
+_DEAD_FIELDS = (b"deadId", b"deadError", b"deadAttempts", b"deadAt")
+
+
+def _id(msg_id) -> str:
+    return msg_id.decode() if isinstance(msg_id, bytes) else str(msg_id)
+
+
+def _poison_key(stream: str, msg_id) -> str:
+    return f"poison:{stream}:{_id(msg_id)}"
+
+
+def _retry_key(stream: str) -> str:
+    return f"retry:{stream}"
+
+
+def dead_stream(stream: str) -> str:
+    return f"dead:{stream}"
+
+
+def backoff(attempts: int) -> float:
+    return min(POISON_BACKOFF_MAX_S, POISON_BACKOFF_S * 2 ** max(0, attempts - 1))
+
+
+async def quarantine(redis, stream: str, msg_id, data: dict, error: str, attempts: int) -> None:
+    """Copia el mensaje a dead:{stream}. El ack lo hace quien llama."""
+    await redis.xadd(
+        dead_stream(stream),
+        {
+            **data,
+            "deadId": _id(msg_id),
+            "deadError": error[:2000],
+            "deadAttempts": str(attempts),
+            "deadAt": str(int(time.time())),
+        },
+        maxlen=DEAD_LETTER_MAXLEN,
+        approximate=True,
+    )
+    pipe = redis.pipeline()
+    pipe.delete(_poison_key(stream, msg_id))
+    pipe.zrem(_retry_key(stream), _id(msg_id))
+    await pipe.execute()
+    logger.error("☠️ %s %s → %s tras %s intentos: %s", stream, _id(msg_id), dead_stream(stream), attempts, error)
+
+
+async def admit(redis, stream: str, msg_id, data: dict) -> bool:
+    """Cuenta la entrega; False si agotó los intentos (ya quedó en dead:{stream}: hacer ack)."""
+    key = _poison_key(stream, msg_id)
+    pipe = redis.pipeline()
+    pipe.hincrby(key, "attempts", 1)
+    pipe.expire(key, POISON_TTL_S)
+    pipe.hget(key, "error")
+    attempts, _, error = await pipe.execute()
+    if attempts <= POISON_MAX_DELIVERIES:
+        return True
+    reason = error.decode() if error else "el worker se cayó antes del ack"
+    await quarantine(redis, stream, msg_id, data, reason, attempts - 1)
+    return False
+
+
+async def postpone(redis, stream: str, msg_id, delay: float) -> None:
+    """Vuelve en `delay` s sin gastar un intento (no falló: su cliente tenía otro turno corriendo)."""
+    pipe = redis.pipeline()
+    pipe.hincrby(_poison_key(stream, msg_id), "attempts", -1)
+    pipe.zadd(_retry_key(stream), {_id(msg_id): time.time() + delay})
+    await pipe.execute()
+
+
+async def redelivered(redis, stream: str, msg_id) -> bool:
+    """True si no es la primera entrega que cuenta `admit` (reintento, handoff o caída)."""
+    raw = await redis.hget(_poison_key(stream, msg_id), "attempts")
+    return int(raw or 0) > 1
+
+
+async def failed(redis, stream: str, msg_id, data: dict, exc: BaseException) -> bool:
+    """
+    True si se va a reintentar (no hacer ack ni contestar error); False si agotó los intentos:
+    ya quedó en dead:{stream} y se sigue como antes (respuesta de error y ack).
+    """
+    key = _poison_key(stream, msg_id)
+    error = f"{type(exc).__name__}: {exc}"
+    raw = await redis.hget(key, "attempts")
+    attempts = int(raw or 1)
+    if attempts >= POISON_MAX_DELIVERIES:
+        await quarantine(redis, stream, msg_id, data, error, attempts)
+        return False
+    delay = backoff(attempts)
+    pipe = redis.pipeline()
+    pipe.hset(key, "error", error[:2000])
+    pipe.zadd(_retry_key(stream), {_id(msg_id): time.time() + delay})
+    await pipe.execute()
+    logger.warning("🔁 %s %s falló (intento %s), reintento en %.0fs: %s", stream, _id(msg_id), attempts, delay, error)
+    return True
+
+
+async def ack(redis, stream: str, group: str, *msg_ids) -> None:
+    """XACK y fuera el contador de intentos: el mensaje ya no vuelve."""
+    pipe = redis.pipeline()
+    pipe.xack(stream, group, *msg_ids)
+    for msg_id in msg_ids:
+        pipe.delete(_poison_key(stream, msg_id))
+    await pipe.execute()
+
+
+async def claim_due(redis, stream: str, group: str, consumer: str, count: int):
+    """Reintentos vencidos, reclamados para este consumer; mismo formato que XREADGROUP."""
+    key = _retry_key(stream)
+    due = await redis.zrangebyscore(key, "-inf", time.time(), start=0, num=count)
+    if not due:
+        return None
+    pipe = redis.pipeline()
+    for entry_id in due:
+        pipe.zrem(key, entry_id)
+    # Solo se queda con los que sacó él (con varios consumers, cada reintento va a uno).
+    mine = [entry_id for entry_id, removed in zip(due, await pipe.execute()) if removed]
+    if not mine:
+        return None
+    entries = await redis.xclaim(stream, group, consumer, min_idle_time=0, message_ids=mine)
+    live = [(entry_id, data) for entry_id, data in entries if data]
+    # Los que se borraron del stream (XTRIM/XDEL) mientras esperaban vuelven sin datos (o no
+    # vuelven, desde Redis 7): no hay nada que reintentar.
+    alive = {_id(entry_id) for entry_id, _ in live}
+    trimmed = [entry_id for entry_id in mine if _id(entry_id) not in alive]
+    if trimmed:
+        await ack(redis, stream, group, *trimmed)
+    if not live:
+        return None
+    return [(stream.encode(), live)]
+
+
+async def handoff(redis, stream: str, group: str, consumer: str) -> int:
+    """
+    Pendientes de un consumer que ya no existe (worker retirado o caído): pasan a
+    HANDOFF_CONSUMER y a la cola de reintentos, vencidos ya, para que los tome `claim_due` de
+    cualquier worker vivo (con su intento contado por `admit`). Después se borra el consumer.
+    """
+    moved = 0
+    while True:
+        pending = await redis.xpending_range(stream, group, "-", "+", 100, consumername=consumer)
+        if not pending:
+            break
+        ids = [p["message_id"] for p in pending]
+        await redis.xclaim(stream, group, HANDOFF_CONSUMER, min_idle_time=0, message_ids=ids, justid=True)
+        # nx: un reintento ya agendado conserva su backoff.
+        await redis.zadd(_retry_key(stream), {_id(i): time.time() for i in ids}, nx=True)
+        moved += len(ids)
+    await redis.xgroup_delconsumer(stream, group, consumer)
+    if moved:
+        logger.warning("🔀 %s: %s pendientes de %s pasan a reintento", stream, moved, consumer)
+    return moved
+
+
+async def list_dead(redis, stream: str, count: int = 20) -> list:
+    return await redis.xrevrange(dead_stream(stream), count=count)
+
+
+async def replay(redis, stream: str, ids: list[str] | None = None) -> int:
+    """Reencola en `stream` los mensajes muertos (todos si `ids` es None) con id nuevo."""
+    dead = dead_stream(stream)
+    entries = (
+        await redis.xrange(dead)
+        if ids is None
+        else [e for entry_id in ids for e in await redis.xrange(dead, min=entry_id, max=entry_id)]
+    )
+    for entry_id, data in entries:
+        original = {k: v for k, v in data.items() if k not in _DEAD_FIELDS}
+        await redis.xadd(stream, original)
+        await redis.xdel(dead, entry_id)
+    return len(entries)
+
+
+async def _cli(args) -> None:
+    from common.redis_config import get_redis
+
+    redis = get_redis()
+    try:
+        if args.cmd == "list":
+            for entry_id, data in await list_dead(redis, args.stream, args.count):
+                fields = {k.decode(): v.decode() for k, v in data.items()}
+                print(
+                    f"{entry_id.decode()}  cliente={fields.get('customerId', '?')}  "
+                    f"original={fields.get('deadId')}  intentos={fields.get('deadAttempts')}\n"
+                    f"    {fields.get('deadError', '')}\n"
+                    f"    {fields.get('contenido', '')[:200]!r}"
+                )
+        else:
+            n = await replay(redis, args.stream, None if args.all else args.ids)
+            print(f"{n} mensajes reencolados en {args.stream}")
+    finally:
+        await redis.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mensajes en cuarentena (dead:{stream})")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    ls = sub.add_parser("list", help="últimos mensajes muertos de un stream")
+    ls.add_argument("stream")
+    ls.add_argument("--count", type=int, default=20)
+    rp = sub.add_parser("replay", help="reencolar mensajes muertos")
+    rp.add_argument("stream")
+    rp.add_argument("ids", nargs="*", help="ids en dead:{stream}")
+    rp.add_argument("--all", action="store_true")
+    args = parser.parse_args()
+    if args.cmd == "replay" and not args.ids and not args.all:
+        parser.error("indicar ids o --all")
+    asyncio.run(_cli(args))
+
+
+if __name__ == "__main__":
+    main()
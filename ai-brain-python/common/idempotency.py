@@ -0,0 +1,150 @@
+"""
+Ledger de idempotencia: turnos ya procesados, por id de mensaje.
+
+idem:{scope}:{id} (hash)  state=computed|done, reply=texto publicado (con marcadores)
+
+- scope: el stream (to-master, to-brain, workflow_*) con el id de la entrada, o
+  chat-queries en el ingreso con partición:offset:timestamp del record de Kafka (se marca al
+  salir el turno de la ventana de agrupamiento, junto con el commit del offset).
+- computed: la respuesta ya se calculó (LLM, tools) pero puede no haberse publicado; en una
+  redelivery se publica la guardada, sin volver a llamar a Bedrock ni al core.
+- done: respuesta publicada o mensaje reenviado al siguiente salto; en una redelivery solo
+  se hace ack.
+- tool:{nombre}:{hash de los argumentos}: resultado de una operación del core (préstamo,
+  refinanciación) que ya corrió en este turno con esos mismos argumentos; si el worker se cae
+  antes de `computed` y el turno se repite, la tool devuelve lo guardado en vez de volver a
+  ejecutarla (ver `operation`). Solo se guardan las que el core aceptó: un reintento con otros
+  argumentos, o después de un rechazo, vuelve a llamar al core.
+
+Si el worker se cae antes de `computed`, el turno se vuelve a correr completo (no hay nada
+que reproducir).
+"""
+import hashlib
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+
+from common.post_close_kafka import send_reply_set_post_close_if_marker
+from common.redis_config import get_redis_sync
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_S = int(os.getenv("IDEMPOTENCY_TTL_S", "86400"))
+
+COMPUTED = "computed"
+DONE = "done"
+
+# (scope, id) del mensaje que se está procesando; las tools destructivas corren adentro.
+_operation: ContextVar[tuple[str, str] | None] = ContextVar("moustro_idem_operation", default=None)
+_redis_sync = None
+
+
+def kafka_id(msg) -> str:
+    # El timestamp distingue un record nuevo si el topic se recreó y los offsets volvieron a 0.
+    return f"{msg.partition}:{msg.offset}:{msg.timestamp}"
+
+
+def _key(scope: str, msg_id) -> str:
+    if isinstance(msg_id, bytes):
+        msg_id = msg_id.decode()
+    return f"idem:{scope}:{msg_id}"
+
+
+async def _store(redis, scope: str, msg_id, state: str, reply: str | None = None) -> None:
+    key = _key(scope, msg_id)
+    fields = {"state": state}
+    if reply is not None:
+        fields["reply"] = reply
+    pipe = redis.pipeline()
+    pipe.hset(key, mapping=fields)
+    pipe.expire(key, IDEMPOTENCY_TTL_S)
+    await pipe.execute()
+
+
+async def lookup(redis, scope: str, msg_id) -> dict | None:
+    raw = await redis.hgetall(_key(scope, msg_id))
+    if not raw:
+        return None
+    return {k.decode(): v.decode() for k, v in raw.items()}
+
+
+async def mark_done(redis, scope: str, msg_id, reply: str | None = None) -> None:
+    await _store(redis, scope, msg_id, DONE, reply)
+
+
+async def publish_once(redis, producer, scope: str, msg_id, customer_id: str, text: str) -> None:
+    """Guarda la respuesta, la publica en chat-response y la marca como publicada."""
+    await _store(redis, scope, msg_id, COMPUTED, text)
+    await send_reply_set_post_close_if_marker(redis, producer, customer_id, text)
+    await _store(redis, scope, msg_id, DONE)
+
+
+async def replay(redis, producer, scope: str, msg_id, customer_id: str) -> bool:
+    """
+    True si el mensaje ya estaba procesado (y entonces no hay que recalcularlo): publica la
+    respuesta guardada si no había llegado a salir. False si hay que procesarlo.
+    """
+    entry = await lookup(redis, scope, msg_id)
+    if entry is None or "state" not in entry:
+        # Sin estado (a lo sumo tools ya ejecutadas): el turno no terminó, se vuelve a correr.
+        return False
+    if entry.get("state") == COMPUTED and entry.get("reply") is not None:
+        logger.info("[idem] %s %s: se publica la respuesta guardada", scope, msg_id)
+        await send_reply_set_post_close_if_marker(redis, producer, customer_id, entry["reply"])
+        await _store(redis, scope, msg_id, DONE)
+    else:
+        logger.info("[idem] %s %s ya procesado, solo ack", scope, msg_id)
+    return True
+
+
+@asynccontextmanager
+async def operation(scope: str, msg_id):
+    """Turno en curso: las tools destructivas del grafo lo usan de clave (`tool_result`)."""
+    if isinstance(msg_id, bytes):
+        msg_id = msg_id.decode()
+    token = _operation.set((scope, msg_id))
+    try:
+        yield
+    finally:
+        _operation.reset(token)
+
+
+def _sync():
+    global _redis_sync
+    if _redis_sync is None:
+        _redis_sync = get_redis_sync()
+    return _redis_sync
+
+
+def _tool_field(tool_name: str, args: dict) -> str:
+    digest = hashlib.sha256(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f"tool:{tool_name}:{digest}"
+
+
+def tool_result(tool_name: str, args: dict) -> dict | None:
+    """Resultado guardado si la tool ya corrió con `args` para el mensaje en curso (sync: corre en un thread)."""
+    op = _operation.get()
+    if op is None:
+        return None
+    raw = _sync().hget(_key(*op), _tool_field(tool_name, args))
+    if raw is None:
+        return None
+    logger.info("[idem] %s %s: %s ya se ejecutó, se devuelve el resultado guardado", op[0], op[1], tool_name)
+    return json.loads(raw)
+
+
+def record_tool(tool_name: str, args: dict, result: dict) -> None:
+    """Guarda el resultado de una operación que el core aceptó (los rechazos no se guardan)."""
+    op = _operation.get()
+    if op is None or not isinstance(result, dict) or result.get("ok") is False or result.get("success") is False:
+        return
+    pipe = _sync().pipeline()
+    pipe.hset(_key(*op), _tool_field(tool_name, args), json.dumps(result, ensure_ascii=False, default=str))
+    pipe.expire(_key(*op), IDEMPOTENCY_TTL_S)
+    pipe.execute()
@@ -0,0 +1,50 @@
+"""
+Marca "esperando interrupt" por hilo de LangGraph: el worker decide resume vs invoke nuevo
+sin cargar el checkpoint (ainvoke lo vuelve a leer igual).
+
+interrupt:{workflow}:{thread_id} = "1" (hay interrupt pendiente) | "0" (no hay)
+
+Se borra antes de correr el grafo y se escribe al terminar el turno con lo que devolvió; si
+el worker se cae en el medio no queda una marca vieja.
+Si falta (primer turno tras el deploy, TTL, error previo) se consulta aget_state una vez y
+se reescribe; así nunca se decide con una marca vieja.
+"""
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Los checkpoints no vencen; la marca sí, para no acumular claves de clientes inactivos.
+INTERRUPT_MARKER_TTL_S = int(os.getenv("INTERRUPT_MARKER_TTL_S", str(7 * 24 * 3600)))
+
+
+def _key(workflow: str, thread_id: str) -> str:
+    return f"interrupt:{workflow}:{thread_id}"
+
+
+async def mark(redis, workflow: str, thread_id: str, pending: bool) -> None:
+    await redis.set(_key(workflow, thread_id), "1" if pending else "0", ex=INTERRUPT_MARKER_TTL_S)
+
+
+async def forget(redis, workflow: str, thread_id: str) -> None:
+    await redis.delete(_key(workflow, thread_id))
+
+
+async def awaiting(redis, graph, workflow: str, config: dict) -> bool:
+    """True si el hilo quedó esperando un interrupt (resume con Command)."""
+    thread_id = str(config["configurable"]["thread_id"])
+    raw = await redis.get(_key(workflow, thread_id))
+    if raw is not None:
+        return raw == b"1"
+    try:
+        snap = await graph.aget_state(config)
+        pending = bool(snap.interrupts)
+    except Exception as ex:
+        logger.debug("[%s] aget_state: %s", workflow, ex)
+        return False
+    await mark(redis, workflow, thread_id, pending)
+    return pending
@@ -1,16 +1,41 @@
-import json
+import asyncio
 import logging
 import os
+import signal
+import time
+from collections import defaultdict
 
-from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, TopicPartition
 from dotenv import load_dotenv
 from redis.exceptions import ResponseError
 
+from common import deadletter, tracing, wire
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
 BOOTSTRAP_SERVERS = os.getenv("KAFKA_BROKER", "localhost:9092")
+# Nombre del consumer en el grupo del stream; common.supervisor le da uno propio a cada proceso.
+STREAM_CONSUMER = os.getenv("STREAM_CONSUMER", "worker-1")
+
+_draining = False
+
+
+def drain_on_sigterm() -> None:
+    """Con SIGTERM el worker deja de leer: termina el mensaje en curso (con su ack) y sale."""
+
+    def _stop() -> None:
+        global _draining
+        if not _draining:
+            logger.info("SIGTERM: %s termina el mensaje en curso y sale", STREAM_CONSUMER)
+        _draining = True
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, _stop)
+
+
+def draining() -> bool:
+    return _draining
 
 
 def get_producer() -> AIOKafkaProducer:
@@ -20,11 +45,9 @@ def get_producer() -> AIOKafkaProducer:
 
 async def send_chat_response(producer: AIOKafkaProducer, customer_id: str, reply: str) -> None:
     """Publica en chat-response el JSON que consume Java (String + ObjectMapper)."""
-    raw = json.dumps(
-        {"customerId": customer_id, "reply": reply},
-        ensure_ascii=False,
-    ).encode("utf-8")
-    await producer.send_and_wait("chat-response", raw)
+    raw = wire.chat_reply(customer_id, reply)
+    with tracing.span("kafka.publish chat-response", kind="producer", **{"customer.id": customer_id}):
+        await producer.send_and_wait("chat-response", raw, headers=tracing.kafka_headers())
     logger.info(
         "Kafka chat-response publicado customerId=%s chars=%s",
         customer_id,
@@ -32,15 +55,63 @@ async def send_chat_response(producer: AIOKafkaProducer, customer_id: str, reply
     )
 
 
-def get_consumer(topic, group_id):
+def get_consumer(topic, group_id, *, auto_commit: bool = True):
     return AIOKafkaConsumer(
         topic,
         bootstrap_servers=BOOTSTRAP_SERVERS,
         group_id=group_id,
-        value_deserializer=lambda x: json.loads(x.decode("utf-8")),
+        value_deserializer=wire.loads,
+        enable_auto_commit=auto_commit,
     )
 
 
+class OffsetTracker:
+    """
+    Commit manual para un consumer sin auto-commit: por partición se commitea hasta el primer
+    record que sigue en vuelo (p. ej. esperando en la ventana del clasificador). Si el proceso
+    se cae, Kafka vuelve a entregar desde ahí.
+    """
+
+    def __init__(self, consumer):
+        self._consumer = consumer
+        self._inflight: dict[TopicPartition, set[int]] = defaultdict(set)
+        self._next: dict[TopicPartition, int] = {}
+        self._committed: dict[TopicPartition, int] = {}
+
+    def track(self, msg) -> tuple[TopicPartition, int]:
+        tp = TopicPartition(msg.topic, msg.partition)
+        self._inflight[tp].add(msg.offset)
+        self._next[tp] = max(self._next.get(tp, 0), msg.offset + 1)
+        return tp, msg.offset
+
+    def release(self, token: tuple[TopicPartition, int]) -> None:
+        tp, offset = token
+        self._inflight[tp].discard(offset)
+
+    async def commit(self) -> None:
+        assigned = self._consumer.assignment()
+        offsets = {}
+        for tp in list(self._next):
+            if tp not in assigned:
+                # Partición reasignada a otro consumer: ahora commitea él.
+                self._next.pop(tp)
+                self._inflight.pop(tp, None)
+                self._committed.pop(tp, None)
+                continue
+            pending = self._inflight[tp]
+            position = min(pending) if pending else self._next[tp]
+            if position > self._committed.get(tp, -1):
+                offsets[tp] = position
+        if not offsets:
+            return
+        try:
+            await self._consumer.commit(offsets)
+            self._committed.update(offsets)
+        except Exception as e:
+            # Se reintenta en el próximo commit; una redelivery la frena el ledger de ingreso.
+            logger.warning("Kafka: commit de offsets falló: %s", e)
+
+
 async def ensure_redis_stream_group(redis, stream: str, group: str) -> None:
     """Crea stream + consumer group si no existen (evita NOGROUP en xreadgroup)."""
     try:
@@ -65,6 +136,59 @@ async def ensure_redis_stream_group(redis, stream: str, group: str) -> None:
             raise e2 from e
 
 
+# (stream, group, consumer) → último id pendiente releído; al vaciarse pasa a _backlog_drained.
+_backlog_cursor: dict[tuple[str, str, str], str] = {}
+_backlog_drained: set[tuple[str, str, str]] = set()
+
+
+async def _read_own_pending(redis, ident: tuple[str, str, str], count: int):
+    stream, group, consumer = ident
+    try:
+        res = await redis.xreadgroup(
+            group, consumer, {stream: _backlog_cursor.get(ident, "0")}, count=count
+        )
+    except Exception as e:
+        logger.debug("Redis: pendientes de %s no disponibles: %s", stream, e)
+        _backlog_drained.add(ident)
+        return None
+    entries = res[0][1] if res else []
+    if not entries:
+        _backlog_drained.add(ident)
+        _backlog_cursor.pop(ident, None)
+        return None
+    _backlog_cursor[ident] = entries[-1][0].decode() if isinstance(entries[-1][0], bytes) else entries[-1][0]
+    live = []
+    for entry_id, data in entries:
+        if data:
+            live.append((entry_id, data))
+        else:
+            # La entrada se borró del stream (XTRIM/XDEL) pero seguía pendiente.
+            await redis.xack(stream, group, entry_id)
+    logger.info("Redis: %s releyendo %s pendientes de %s", consumer, len(live), stream)
+    return [(res[0][0], live)] if live else []
+
+
+# Tiempo de servicio observado por stream (segundos por mensaje, últimas muestras): lo usa
+# common.consumer_lag para recomendar réplicas.
+SERVICE_TIME_SAMPLES = 200
+# (stream, group, consumer) → (monotonic al devolver la última tanda, mensajes en ella).
+_last_batch: dict[tuple[str, str, str], tuple[float, int]] = {}
+
+
+def service_time_key(stream: str) -> str:
+    return f"svc_time:{stream}"
+
+
+async def _record_service_time(redis, stream: str, seconds: float) -> None:
+    try:
+        pipe = redis.pipeline()
+        pipe.lpush(service_time_key(stream), f"{seconds:.4f}")
+        pipe.ltrim(service_time_key(stream), 0, SERVICE_TIME_SAMPLES - 1)
+        await pipe.execute()
+    except Exception as e:
+        logger.debug("Redis: no se pudo registrar tiempo de servicio de %s: %s", stream, e)
+
+
 async def xreadgroup_with_recovery(
     redis,
     stream: str,
@@ -77,7 +201,35 @@ async def xreadgroup_with_recovery(
     """
     XREADGROUP con reintento si Redis se vació (FLUSHALL), falta stream/grupo,
     o el stream existía sin grupo (solo XADD).
+
+    Al arrancar, el consumidor primero relee sus pendientes (entregados sin ack: el proceso
+    anterior se cayó a mitad de turno), una vez cada uno; el ledger de common.idempotency
+    evita recalcular los que ya estaban resueltos. Después entrega los reintentos vencidos
+    de common.deadletter y sigue con mensajes nuevos (">").
+
+    Los workers procesan en serie entre llamada y llamada: ese intervalo, dividido por los
+    mensajes de la tanda anterior, es el tiempo de servicio que se registra.
     """
+    ident = (stream, group, consumer)
+    previous = _last_batch.pop(ident, None)
+    if previous is not None:
+        await _record_service_time(redis, stream, (time.monotonic() - previous[0]) / previous[1])
+    results = await _read_next(redis, ident, count, block)
+    delivered = sum(len(entries) for _, entries in results or ())
+    if delivered:
+        _last_batch[ident] = (time.monotonic(), delivered)
+    return results
+
+
+async def _read_next(redis, ident: tuple[str, str, str], count: int, block: int):
+    stream, group, consumer = ident
+    if ident not in _backlog_drained:
+        backlog = await _read_own_pending(redis, ident, count)
+        if backlog is not None:
+            return backlog
+    due = await deadletter.claim_due(redis, stream, group, consumer, count)
+    if due:
+        return due
     streams = {stream: ">"}
     for attempt in range(3):
         try:
@@ -0,0 +1,220 @@
+"""
+Léxico de intenciones compartido por los routers (classifier, brain, quiz).
+
+- `normalize`: casefold, sin tildes (ñ → n), puntuación → espacio, espacios colapsados.
+  Se hace una sola vez por mensaje.
+- Match exacto: una única regex con todas las frases de todas las intenciones (alternancia
+  ordenada por largo, con límites de palabra); una pasada por el texto.
+- Frases con `*` al final matchean como prefijo ("refinanc*" → refinanciar, refinancio…).
+- Tolerancia a errores: los tokens que no matchearon se comparan contra FUZZY_WORDS
+  (palabras completas) con distancia de edición ≤ 1 (incluye transposición) y la mitad
+  de peso: "prestmo", "refinaciar", "invesrion". Las palabras reales a un error de una
+  clave ("prestado", "inverso") quedan afuera (_NOT_FUZZY).
+
+`scan(texto)` retorna los hits y el puntaje por intención.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+INVESTMENT = "investment"
+LOANS = "loans"
+CLOSE = "close"
+
+_FUZZY_MIN_LEN = 6
+_FUZZY_WEIGHT = 0.5
+# Palabras correctas a distancia 1 de una de FUZZY_WORDS: no son errores de tipeo
+# ("me lo prestado" no habla de un préstamo).
+_NOT_FUZZY = frozenset({"prestado", "prestada", "prestados", "prestadas", "inverso", "inversos"})
+
+# intención → [(frase, peso)]; las frases se escriben ya normalizadas.
+INTENTS: dict[str, list[tuple[str, float]]] = {
+    INVESTMENT: [
+        ("inversi*", 1.0),
+        ("invert*", 1.0),
+        ("inviert*", 1.0),
+        ("inversor*", 1.0),
+        ("perfil inversor", 2.0),
+        ("perfil de inversor", 2.0),
+        ("test de idoneidad", 2.0),
+        ("idoneidad", 2.0),
+        ("mercado de capitales", 1.0),
+        ("fci", 1.0),
+        ("fcis", 1.0),
+        ("fondo comun*", 1.0),
+        ("fondos comunes", 1.0),
+        ("cedear*", 1.0),
+        ("mep", 1.0),
+        ("bono", 1.0),
+        ("bonos", 1.0),
+        ("letras del tesoro", 1.0),
+        ("lecap*", 1.0),
+        ("armar cartera", 1.0),
+        ("activos financieros", 1.0),
+    ],
+    LOANS: [
+        ("prestamo*", 2.0),
+        ("refinanc*", 2.0),
+        ("refi", 1.0),
+        ("nuevo credito", 1.0),
+        ("credito nuevo", 1.0),
+        ("credito personal", 1.0),
+        ("plata en mano", 1.0),
+        ("efectivo en mano", 1.0),
+        ("loan", 1.0),
+        ("loans", 1.0),
+        ("millon de plata", 1.0),
+        ("millon plata", 1.0),
+        ("tope 1 2", 1.0),
+        ("tope 12", 1.0),
+    ],
+    CLOSE: [
+        ("gracias", 1.0),
+        ("muchas gracias", 1.0),
+        ("chau", 1.0),
+        ("chao", 1.0),
+        ("nos vemos", 1.0),
+        ("eso es todo", 1.0),
+        ("nada mas", 1.0),
+        ("no necesito nada", 1.0),
+    ],
+}
+
+# Palabras completas frecuentes con errores de tipeo (match difuso con peso reducido).
+FUZZY_WORDS: dict[str, list[tuple[str, float]]] = {
+    INVESTMENT: [
+        ("inversion", 1.0),
+        ("inversiones", 1.0),
+        ("invertir", 1.0),
+        ("inversor", 1.0),
+        ("idoneidad", 2.0),
+    ],
+    LOANS: [
+        ("prestamo", 2.0),
+        ("prestamos", 2.0),
+        ("refinanciar", 2.0),
+        ("refinanciacion", 2.0),
+        ("refinancio", 2.0),
+    ],
+    CLOSE: [("gracias", 1.0)],
+}
+
+_NON_WORD = re.compile(r"[^\w]+|_")
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", (text or "").casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", stripped).split())
+
+
+@dataclass
+class LexiconResult:
+    text: str
+    hits: list[tuple[str, str, float]] = field(default_factory=list)
+    scores: dict[str, float] = field(default_factory=dict)
+
+    def score(self, intent: str) -> float:
+        return self.scores.get(intent, 0.0)
+
+    def has(self, intent: str) -> bool:
+        return self.scores.get(intent, 0.0) > 0
+
+    def only(self, intent: str, *others: str) -> bool:
+        """Hay `intent` y ninguna de `others`."""
+        return self.has(intent) and not any(self.has(o) for o in others)
+
+
+def _one_edit(a: str, b: str) -> bool:
+    """Distancia Damerau-Levenshtein ≤ 1, en O(n)."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    i = 0
+    while i < min(la, lb) and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        if a[i + 1:] == b[i + 1:]:
+            return True
+        return i + 1 < la and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+    if la > lb:
+        return a[i + 1:] == b[i:]
+    return a[i:] == b[i + 1:]
+
+
+class Lexicon:
+    def __init__(self, intents: dict[str, list[tuple[str, float]]], fuzzy: dict[str, list[tuple[str, float]]]):
+        prefixes: dict[str, tuple[str, float]] = {}
+        exact: dict[str, tuple[str, float]] = {}
+        for intent, phrases in intents.items():
+            for raw, weight in phrases:
+                phrase = normalize(raw.rstrip("*"))
+                (prefixes if raw.endswith("*") else exact)[phrase] = (intent, weight)
+        # Palabras difusas indexadas por largo: un token solo se compara con las de largo ±1.
+        self._fuzzy: dict[int, list[tuple[str, str, float]]] = {}
+        for intent, words in fuzzy.items():
+            for word, weight in words:
+                word = normalize(word)
+                if len(word) >= _FUZZY_MIN_LEN:
+                    for n in (len(word) - 1, len(word), len(word) + 1):
+                        self._fuzzy.setdefault(n, []).append((word, intent, weight))
+        alternatives = [
+            re.escape(p) + r"\w*" for p in sorted(prefixes, key=len, reverse=True)
+        ] + [re.escape(p) for p in sorted(exact, key=len, reverse=True)]
+        # Una sola regex: cada match se resuelve a su frase buscando el prefijo/exacto más largo.
+        self._pattern = re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+        self._prefixes = sorted(prefixes.items(), key=lambda kv: len(kv[0]), reverse=True)
+        self._exact = exact
+
+    def _resolve(self, matched: str) -> tuple[str, str, float]:
+        hit = self._exact.get(matched)
+        if hit:
+            return matched, hit[0], hit[1]
+        for phrase, (intent, weight) in self._prefixes:
+            if matched.startswith(phrase):
+                return phrase + "*", intent, weight
+        return matched, "", 0.0
+
+    def _fuzzy_hit(self, token: str):
+        for word, intent, weight in self._fuzzy.get(len(token), ()):
+            if _one_edit(token, word):
+                return word, intent, weight * _FUZZY_WEIGHT
+        return None
+
+    def scan_normalized(self, norm: str) -> LexiconResult:
+        result = LexiconResult(norm)
+        covered: set[int] = set()
+        for m in self._pattern.finditer(norm):
+            phrase, intent, weight = self._resolve(m.group(0))
+            if intent:
+                result.hits.append((intent, phrase, weight))
+                result.scores[intent] = result.scores.get(intent, 0.0) + weight
+                covered.update(range(m.start(), m.end()))
+        pos = 0
+        for token in norm.split(" "):
+            start, pos = pos, pos + len(token) + 1
+            if len(token) < _FUZZY_MIN_LEN - 1 or start in covered or token in _NOT_FUZZY:
+                continue
+            hit = self._fuzzy_hit(token)
+            if hit:
+                phrase, intent, weight = hit
+                result.hits.append((intent, f"~{phrase}", weight))
+                result.scores[intent] = result.scores.get(intent, 0.0) + weight
+        return result
+
+    def scan(self, text: str) -> LexiconResult:
+        return self.scan_normalized(normalize(text))
+
+
+LEXICON = Lexicon(INTENTS, FUZZY_WORDS)
+
+
+@lru_cache(maxsize=4096)
+def scan(text: str) -> LexiconResult:
+    """Escaneo con caché (los routers vuelven a ver el mismo texto en varios saltos)."""
+    return LEXICON.scan(text)
@@ -8,6 +8,8 @@ import re
 from dataclasses import dataclass
 from typing import List, Optional, Tuple
 
+from common.lexicon import normalize
+
 # Cada letra aporta riesgo_score (0 = más conservador, 3 = más arriesgado en 4-opción).
 # P7 solo tiene 3 opciones.
 
@@ -185,6 +187,89 @@ def parse_quiz_letter(
     return "A"
 
 
+_ORDINALS = {"primera": 0, "segunda": 1, "tercera": 2, "cuarta": 3}
+_STRICT_LETTER = re.compile(r"^(?:(?:la|el|opcion|respuesta|letra)\s+)*([a-d])$")
+_STRICT_NUMBER = re.compile(r"^(?:(?:la|el|opcion|respuesta)\s+)*([1-4])$")
+_STRICT_ORDINAL = re.compile(r"^(?:la\s+)?(primera|segunda|tercera|cuarta)(?:\s+opcion)?$")
+
+
+def match_quiz_letter(user_text: str, item: QuizItem) -> Optional[str]:
+    """
+    Versión estricta de parse_quiz_letter: solo acepta mensajes que son claramente una
+    respuesta ('b', 'la B', 'opción c', '2', 'la segunda') y válida para el ítem.
+    Retorna None si no lo es (parse_quiz_letter, en cambio, cae en 'A').
+    """
+    t = normalize(user_text)
+    opts = [o[0] for o in item.options]
+    m = _STRICT_LETTER.match(t)
+    if m:
+        letter = m.group(1).upper()
+        return letter if letter in opts else None
+    m = _STRICT_NUMBER.match(t) or _STRICT_ORDINAL.match(t)
+    if m:
+        raw = m.group(1)
+        idx = int(raw) - 1 if raw.isdigit() else _ORDINALS[raw]
+        return opts[idx] if idx < len(opts) else None
+    return None
+
+
+# Número de pregunta + letra. Suelto en una frase solo vale con separador explícito ("1) a",
+# "2- c", "3: b", "4. d") o pegado ("1a") y seguido de fin, puntuación u otro par: así
+# "tengo 2 a 3 hijos" o "invierto 1 a 2 años" (rangos "N a M") no se toman como respuestas.
+_PAIR = r"([1-9])\s*(?:[)\-:.]\s*)?([a-d])"
+_ONLY_PAIRS = re.compile(rf"^(?:[\s,;]*{_PAIR}(?![a-z0-9])[\s,;.!]*)+$")
+_ANY_PAIR = re.compile(_PAIR)
+_SEPARATED_PAIR = re.compile(r"(?<![\w.,])([1-9])\s*[)\-:.]\s*([a-d])(?![a-z0-9])")
+_GLUED_PAIR = re.compile(
+    r"(?<![\w.,])([1-9])([a-d])(?=\s*(?:$|[,;.!?)]|[1-9]\s*[)\-:.]?\s*[a-d](?![a-z0-9])))"
+)
+# "1a y 2b", "1a, 2b e 3c": la conjunción separa pares como una coma.
+_CONJUNCTION = re.compile(r"\s+[ye]\s+")
+# Letras pegadas ("acbdb"): desde 5, para no tomar palabras como "cada".
+_LETTER_RUN = re.compile(r"^[a-d]{5,9}$")
+_SHOW_ALL = {"todas", "todas juntas", "todas de una", "todo junto", "todas las preguntas"}
+
+
+def wants_all_questions(user_text: str) -> bool:
+    return normalize(user_text) in _SHOW_ALL
+
+
+def parse_quiz_answers(user_text: str, pending: List[int]) -> dict[int, str]:
+    """
+    Varias respuestas en un mensaje. `pending`: índices (0-based) de QUIZ sin responder, en orden.
+    - numeradas: "1a 2c 3b", "1) A, 2-c", "1a y 2b" (el número es el de la pregunta);
+    - en secuencia: "A C B D B A C B D", "a, c, b" o "acbdb" → a los pendientes en orden.
+    Cada letra se valida contra las opciones de su ítem; las inválidas quedan afuera
+    (se vuelven a preguntar). Retorna {índice: letra}.
+    """
+    t = normalize(user_text)
+    found: dict[int, str] = {}
+    # Los separadores de "1) a" se pierden al normalizar: los pares se buscan en el original.
+    raw = _CONJUNCTION.sub(", ", (user_text or "").casefold())
+    if _ONLY_PAIRS.match(raw):
+        numbered = _ANY_PAIR.findall(raw)
+    else:
+        numbered = _SEPARATED_PAIR.findall(raw) + _GLUED_PAIR.findall(raw)
+    if numbered:
+        for num, letter in numbered:
+            idx = int(num) - 1
+            if idx in pending:
+                found[idx] = letter.upper()
+    else:
+        tokens = t.split()
+        if len(tokens) == 1 and _LETTER_RUN.match(tokens[0]):
+            tokens = list(tokens[0])
+        if len(tokens) < 2 or any(len(tok) != 1 or tok not in "abcd" for tok in tokens):
+            return {}
+        for idx, letter in zip(pending, tokens):
+            found[idx] = letter.upper()
+    return {
+        idx: letter
+        for idx, letter in found.items()
+        if letter in {o[0] for o in QUIZ[idx].options}
+    }
+
+
 def compute_profile(answers: List[str]) -> Tuple[str, int, int, str]:
     """
     answers: 9 letras, índice alineado con QUIZ.
@@ -226,10 +311,12 @@ def compute_profile(answers: List[str]) -> Tuple[str, int, int, str]:
     return tier, int(total), max_loss, horizon
 
 
-def format_question_block(item: QuizItem) -> str:
+def format_question_block(item: QuizItem, hint: bool = True) -> str:
     lines = [f"**Pregunta {item.id}/9**", "", item.text, ""]
     for L, txt, _ in item.options:
         lines.append(f"**{L})** {txt}")
+    if not hint:
+        return "\n".join(lines)
     lines.append("")
     opts = [o[0] for o in item.options]
     if len(opts) == 3:
@@ -237,3 +324,15 @@ def format_question_block(item: QuizItem) -> str:
     else:
         lines.append("Respondé con la letra (A, B, C o D según corresponda).")
     return "\n".join(lines)
+
+
+def format_questions_block(items: List[QuizItem]) -> str:
+    """Todas las preguntas pendientes juntas, para responder en un solo mensaje."""
+    blocks = [format_question_block(it, hint=False) for it in items]
+    ids = [str(it.id) for it in items]
+    example = " ".join(f"{i}a" for i in ids[:3])
+    blocks.append(
+        f"Respondé todas en un mensaje con el número y la letra (p. ej. `{example}…`) "
+        "o solo las letras en orden, separadas por espacio."
+    )
+    return "\n\n".join(blocks)
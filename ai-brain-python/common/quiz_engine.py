@@ -0,0 +1,145 @@
+"""
+Test de idoneidad fuera del grafo: máquina de estados determinista en un hash de Redis.
+
+Cuando el grafo de inversiones pregunta el ítem N (interrupt de quiz_node), el worker llama
+a `start` y desde ahí el clasificador contesta cada respuesta con la pregunta siguiente sin
+pasar por to-brain / workflow_investment / checkpoint. Al completar los 9 ítems se reenvían
+todas las letras juntas a workflow_investment (campos quizAnswers y quizOffset) y el grafo
+retoma el interrupt pendiente en un solo paso: perfil → persist → asesor. El worker aplica
+las respuestas mire lo que mire la marca de interrupt (ver investment/main._resume_quiz).
+
+hash quiz:{customerId}
+  offset   respuestas que el grafo ya tenía cuando arrancó el fast path
+  q{i}     letra del ítem i (0-based) contestada desde entonces (o que el grafo ya tenía
+           guardada para un ítem posterior, quiz_prefill)
+
+Se puede responder de a una o varias juntas ("A C B D…", "1a 2c 3b…"; "todas" muestra las
+pendientes en un solo bloque). Las letras inválidas para su ítem se vuelven a preguntar.
+
+Si el mensaje no es una respuesta y el léxico ve otra intención (préstamos, cierre) se
+abandona: se borra el hash y el mensaje sigue el ruteo normal (el grafo sigue esperando en
+la pregunta donde arrancó el fast path, como antes). Si no es respuesta ni otra intención,
+se repregunta el mismo ítem.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass, field
+
+from common.lexicon import CLOSE, LOANS, scan
+from common.questionnaire import (
+    QUIZ,
+    format_question_block,
+    format_questions_block,
+    match_quiz_letter,
+    parse_quiz_answers,
+    wants_all_questions,
+)
+
+logger = logging.getLogger(__name__)
+
+QUIZ_FAST_PATH = os.getenv("QUIZ_FAST_PATH", "1") == "1"
+# Misma ventana que session: si expira, el grafo retoma desde su propio interrupt.
+QUIZ_TTL_S = int(os.getenv("QUIZ_TTL_S", "1800"))
+
+ASK = "ask"
+DONE = "done"
+ABANDON = "abandon"
+
+RETRY_HINT = "No llegué a tomar tu respuesta. "
+
+
+@dataclass
+class QuizStep:
+    action: str
+    reply: str = ""
+    answers: list[str] = field(default_factory=list)
+    # Ítem (0-based) al que corresponde answers[0].
+    offset: int = 0
+
+
+def state_key(customer_id: str) -> str:
+    return f"quiz:{customer_id}"
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else (value or "")
+
+
+async def start(redis, customer_id: str, offset: int, given: dict | None = None) -> None:
+    """
+    El grafo acaba de preguntar el ítem `offset` (0-based): el resto lo contesta el ingreso.
+    `given` (índice → letra) son respuestas posteriores que el grafo ya tiene: no se repreguntan.
+    """
+    if not QUIZ_FAST_PATH or offset >= len(QUIZ):
+        return
+    key = state_key(customer_id)
+    pipe = redis.pipeline()
+    pipe.delete(key)
+    later = {f"q{i}": letter for i, letter in (given or {}).items() if int(i) > offset}
+    pipe.hset(key, mapping={"offset": offset, **later})
+    pipe.expire(key, QUIZ_TTL_S)
+    await pipe.execute()
+
+
+async def clear(redis, customer_id: str) -> None:
+    await redis.delete(state_key(customer_id))
+
+
+async def answer(redis, customer_id: str, text: str) -> QuizStep | None:
+    """
+    Procesa un mensaje en el ingreso. None si el cliente no está en el test.
+    ASK: responder `reply` (siguiente pregunta o repregunta). DONE: `answers` trae las letras
+    desde `offset` para reanudar el grafo. ABANDON: ruteo normal.
+    """
+    if not QUIZ_FAST_PATH:
+        return None
+    key = state_key(customer_id)
+    raw = await redis.hgetall(key)
+    if not raw:
+        return None
+    state = {_decode(k): _decode(v) for k, v in raw.items()}
+    offset = int(state.get("offset") or 0)
+    given = {int(k[1:]): v for k, v in state.items() if k.startswith("q")}
+    pending = [i for i in range(offset, len(QUIZ)) if i not in given]
+    if not pending:
+        return QuizStep(DONE, answers=[given[i] for i in range(offset, len(QUIZ))], offset=offset)
+
+    if wants_all_questions(text):
+        await redis.expire(key, QUIZ_TTL_S)
+        return QuizStep(ASK, format_questions_block([QUIZ[i] for i in pending]))
+
+    parsed = parse_quiz_answers(text, pending)
+    if not parsed:
+        letter = match_quiz_letter(text, QUIZ[pending[0]])
+        if letter is not None:
+            parsed = {pending[0]: letter}
+    if not parsed:
+        hits = scan(text or "")
+        if hits.has(LOANS) or hits.has(CLOSE):
+            await clear(redis, customer_id)
+            logger.info("[quiz] %s abandona el test en el ítem %s", customer_id, QUIZ[pending[0]].id)
+            return QuizStep(ABANDON)
+        await redis.expire(key, QUIZ_TTL_S)
+        return QuizStep(ASK, RETRY_HINT + format_question_block(QUIZ[pending[0]]))
+
+    pipe = redis.pipeline()
+    pipe.hset(key, mapping={f"q{i}": letter for i, letter in parsed.items()})
+    pipe.expire(key, QUIZ_TTL_S)
+    await pipe.execute()
+    given.update(parsed)
+    pending = [i for i in pending if i not in parsed]
+    if not pending:
+        return QuizStep(DONE, answers=[given[i] for i in range(offset, len(QUIZ))], offset=offset)
+    if len(parsed) == 1:
+        return QuizStep(ASK, format_question_block(QUIZ[pending[0]]))
+    if len(pending) == 1:
+        return QuizStep(
+            ASK, f"Anoté {len(parsed)} respuestas. Me falta esta:\n\n" + format_question_block(QUIZ[pending[0]])
+        )
+    return QuizStep(
+        ASK,
+        f"Anoté {len(parsed)} respuestas. Me faltan estas:\n\n"
+        + format_questions_block([QUIZ[i] for i in pending]),
+    )
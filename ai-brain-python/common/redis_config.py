@@ -1,7 +1,8 @@
 import os
 import redis.asyncio as redis
-from langgraph.checkpoint.redis import AsyncRedisSaver
+import redis as redis_sync
 from dotenv import load_dotenv
+from common.checkpoint_serde import CompactAsyncRedisSaver
 
 load_dotenv()
 
@@ -12,5 +13,11 @@ def get_redis():
     return redis.from_url(REDIS_URL)
 
 
+def get_redis_sync():
+    """Cliente bloqueante, solo para caminos sync (p. ej. invoke del limitador de Bedrock)."""
+    return redis_sync.from_url(REDIS_URL)
+
+
 def get_checkpointer():
-    return AsyncRedisSaver.from_conn_string(REDIS_URL)
\ No newline at end of file
+    """Saver de LangGraph con el serializador compacto (common/checkpoint_serde.py)."""
+    return CompactAsyncRedisSaver.from_conn_string(REDIS_URL)
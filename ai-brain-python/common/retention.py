@@ -0,0 +1,193 @@
+"""
+Retención de los streams de trabajo (to-master, to-brain, workflow_*): sin esto, cada entrada
+ya procesada queda en Redis para siempre.
+
+Por stream se calcula el punto de corte (se borra todo lo anterior con XTRIM MINID):
+- lo más viejo que todavía necesita algún consumer group: la entrada pendiente (sin ack) más
+  antigua o, si no hay pendientes, la siguiente a la última entregada;
+- se conservan igual las entradas de los últimos STREAM_RETENTION_KEEP_S (para depurar);
+- tope por edad, STREAM_RETENTION_MAX_AGE_S: lo más viejo que eso se borra aunque siga
+  pendiente o sin entregar (un grupo sin consumidores no retiene memoria para siempre; quien
+  relea una pendiente borrada recibe la entrada vacía y le hace ack, ver kafka_config).
+
+Antes de recortar, con STREAM_ARCHIVE=postgres|file, lo que se va a borrar se guarda en la
+tabla `stream_archive` (base de conversaciones) o en {STREAM_ARCHIVE_DIR}/{stream}/{día}.jsonl.gz.
+Si el archivo falla, ese stream no se recorta en esta vuelta.
+
+    python -m common.retention [--once] [--dry-run]
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from common import wire
+from common.redis_config import get_redis
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STREAM_RETENTION_INTERVAL_S = float(os.getenv("STREAM_RETENTION_INTERVAL_S", "60"))
+STREAM_RETENTION_KEEP_S = int(os.getenv("STREAM_RETENTION_KEEP_S", "600"))
+STREAM_RETENTION_MAX_AGE_S = int(os.getenv("STREAM_RETENTION_MAX_AGE_S", str(24 * 3600)))
+STREAM_ARCHIVE = os.getenv("STREAM_ARCHIVE", "none")  # none | postgres | file
+STREAM_ARCHIVE_DIR = os.getenv("STREAM_ARCHIVE_DIR", "archive/streams")
+
+STREAMS = ("to-master", "to-brain", "workflow_loans", "workflow_investment")
+
+_BATCH = 500
+
+CREATE_ARCHIVE_SQL = """
+CREATE TABLE IF NOT EXISTS stream_archive (
+    stream      VARCHAR(100) NOT NULL,
+    entry_id    VARCHAR(64)  NOT NULL,
+    fields      JSONB        NOT NULL,
+    archived_at TIMESTAMPTZ  NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (stream, entry_id)
+);
+"""
+
+
+def _parse_id(entry_id) -> tuple[int, int]:
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _format_id(parsed: tuple[int, int]) -> str:
+    return f"{parsed[0]}-{parsed[1]}"
+
+
+async def cutoff(redis, stream: str, now_ms: int | None = None) -> tuple[int, int] | None:
+    """Primer id que se conserva (MINID), o None si no hay nada que recortar."""
+    try:
+        groups = await redis.xinfo_groups(stream)
+    except Exception:
+        # Stream aún no creado.
+        return None
+    if not groups:
+        # Nadie lo consume todavía: no se sabe qué ya se procesó.
+        return None
+    needed = []
+    for g in groups:
+        summary = await redis.xpending(stream, g["name"]) if int(g.get("pending") or 0) else None
+        if summary and summary.get("min"):
+            needed.append(_parse_id(summary["min"]))
+        else:
+            ms, seq = _parse_id(g.get("last-delivered-id") or "0-0")
+            needed.append((ms, seq + 1))
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    point = min(min(needed), (now_ms - STREAM_RETENTION_KEEP_S * 1000, 0))
+    if STREAM_RETENTION_MAX_AGE_S > 0:
+        point = max(point, (now_ms - STREAM_RETENTION_MAX_AGE_S * 1000, 0))
+    return point if point > (0, 0) else None
+
+
+async def _archive_postgres(stream: str, rows: list[tuple[str, dict]]) -> None:
+    import asyncpg
+
+    from common.conversation_store import POSTGRES_URL
+
+    conn = await asyncpg.connect(POSTGRES_URL)
+    try:
+        await conn.execute(CREATE_ARCHIVE_SQL)
+        # Idempotente: si una vuelta anterior archivó y no llegó a recortar, no duplica.
+        await conn.executemany(
+            "INSERT INTO stream_archive (stream, entry_id, fields) VALUES ($1, $2, $3) "
+            "ON CONFLICT DO NOTHING",
+            [(stream, entry_id, wire.dumps_str(fields)) for entry_id, fields in rows],
+        )
+    finally:
+        await conn.close()
+
+
+def _archive_file(stream: str, rows: list[tuple[str, dict]]) -> None:
+    day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    folder = os.path.join(STREAM_ARCHIVE_DIR, stream)
+    os.makedirs(folder, exist_ok=True)
+    # Cada vuelta agrega un miembro gzip: el archivo se lee entero con gzip.open.
+    with gzip.open(os.path.join(folder, f"{day}.jsonl.gz"), "ab") as f:
+        for entry_id, fields in rows:
+            f.write(wire.dumps({"id": entry_id, "fields": fields}) + b"\n")
+
+
+async def archive(redis, stream: str, before: tuple[int, int], mode: str | None = None) -> int:
+    """Archiva las entradas con id < `before`; devuelve cuántas."""
+    mode = mode or STREAM_ARCHIVE
+    if mode == "none":
+        return 0
+    start, total = "-", 0
+    while True:
+        entries = await redis.xrange(stream, min=start, max=f"({_format_id(before)}", count=_BATCH)
+        if not entries:
+            return total
+        rows = [
+            (entry_id.decode(), {k.decode(): v.decode() for k, v in data.items()})
+            for entry_id, data in entries
+        ]
+        if mode == "postgres":
+            await _archive_postgres(stream, rows)
+        else:
+            await asyncio.to_thread(_archive_file, stream, rows)
+        total += len(rows)
+        start = f"({rows[-1][0]}"
+
+
+async def trim_stream(redis, stream: str, *, dry_run: bool = False) -> int:
+    point = await cutoff(redis, stream)
+    if point is None:
+        return 0
+    if dry_run:
+        old = await redis.xrange(stream, min="-", max=f"({_format_id(point)}", count=_BATCH)
+        more = "+" if len(old) == _BATCH else ""
+        logger.info("[retention] %s: %s%s entradas antes de %s", stream, len(old), more, _format_id(point))
+        return 0
+    try:
+        archived = await archive(redis, stream, point)
+    except Exception:
+        logger.exception("[retention] %s: falló el archivo, no se recorta", stream)
+        return 0
+    # Exacto (no ~): lo borrado tiene que coincidir con lo archivado.
+    removed = await redis.xtrim(stream, minid=_format_id(point), approximate=False)
+    if removed:
+        logger.info("[retention] %s: %s entradas borradas (%s archivadas)", stream, removed, archived)
+    return removed
+
+
+async def run_once(redis, *, dry_run: bool = False) -> dict[str, int]:
+    return {s: await trim_stream(redis, s, dry_run=dry_run) for s in STREAMS}
+
+
+async def run(*, once: bool = False, dry_run: bool = False) -> None:
+    redis = get_redis()
+    try:
+        while True:
+            try:
+                await run_once(redis, dry_run=dry_run)
+            except Exception:
+                logger.exception("[retention] error en la vuelta")
+            if once:
+                return
+            await asyncio.sleep(STREAM_RETENTION_INTERVAL_S)
+    finally:
+        await redis.aclose()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Retención y archivo de los streams de trabajo")
+    parser.add_argument("--once", action="store_true", help="una sola vuelta y salir")
+    parser.add_argument("--dry-run", action="store_true", help="solo informar qué se borraría")
+    args = parser.parse_args()
+    asyncio.run(run(once=args.once, dry_run=args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Supervisor local de workers: por cada stream de trabajo levanta y retira procesos consumidores
+entre SUPERVISOR_MIN_WORKERS y SUPERVISOR_MAX_WORKERS según lo que espera en el grupo
+(common.consumer_lag.stream_group_stats), para seguir la carga del día en un solo host sin
+tocar el compose.
+
+- Suma workers si la primera entrada sin entregar espera más de SUPERVISOR_MAX_WAIT_S o si hay
+  más de SUPERVISOR_BACKLOG_PER_WORKER sin entregar por worker (de a varios si hace falta).
+- Retira de a uno cuando no esperó nada durante SUPERVISOR_IDLE_S.
+- Entre cambios de un mismo stream pasa al menos SUPERVISOR_COOLDOWN_S (salvo para volver al
+  mínimo si un worker se cayó).
+
+Cada proceso corre con su propio STREAM_CONSUMER (`{stream}-{host}-{pid}-{n}`). Para retirarlo
+se le manda SIGTERM: termina el mensaje en curso y sale (kafka_config.drain_on_sigterm); si no
+terminó en SUPERVISOR_DRAIN_TIMEOUT_S, SIGKILL. Al salir un worker (retirado o caído) sus
+pendientes pasan a reintento con deadletter.handoff y otro worker las toma. Lo mismo con
+consumers ajenos (una corrida anterior, otro host) que tienen pendientes y no leen hace
+SUPERVISOR_ORPHAN_IDLE_S.
+
+Con varios workers en un stream, los turnos de un mismo cliente no se pisan: cada worker toma
+turns.lease del cliente antes de correr el grafo y, si está tomado, pospone el mensaje.
+
+    python -m common.supervisor [--streams workflow_loans to-master ...] [--min 1] [--max 4]
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import signal
+import socket
+import sys
+import time
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from common import deadletter
+from common.consumer_lag import stream_group_stats
+from common.kafka_config import ensure_redis_stream_group
+from common.redis_config import get_redis
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SUPERVISOR_INTERVAL_S = float(os.getenv("SUPERVISOR_INTERVAL_S", "5"))
+SUPERVISOR_MIN_WORKERS = int(os.getenv("SUPERVISOR_MIN_WORKERS", "1"))
+SUPERVISOR_MAX_WORKERS = int(os.getenv("SUPERVISOR_MAX_WORKERS", "4"))
+SUPERVISOR_BACKLOG_PER_WORKER = int(os.getenv("SUPERVISOR_BACKLOG_PER_WORKER", "3"))
+SUPERVISOR_MAX_WAIT_S = float(os.getenv("SUPERVISOR_MAX_WAIT_S", "10"))
+SUPERVISOR_IDLE_S = float(os.getenv("SUPERVISOR_IDLE_S", "120"))
+SUPERVISOR_COOLDOWN_S = float(os.getenv("SUPERVISOR_COOLDOWN_S", "30"))
+SUPERVISOR_DRAIN_TIMEOUT_S = float(os.getenv("SUPERVISOR_DRAIN_TIMEOUT_S", "180"))
+SUPERVISOR_ORPHAN_IDLE_S = float(os.getenv("SUPERVISOR_ORPHAN_IDLE_S", "600"))
+
+# stream → (consumer group, módulo del worker)
+WORKERS = {
+    "to-master": ("master-group", "services.master.main"),
+    "to-brain": ("brain-group", "services.brain.main"),
+    "workflow_loans": ("loans-group", "services.brain.workflows.loans.main"),
+    "workflow_investment": ("investment-group", "services.brain.workflows.investment.main"),
+}
+
+
+def target_workers(
+    current: int,
+    waiting: int,
+    wait_age_s: float,
+    quiet_s: float,
+    *,
+    minimum: int = SUPERVISOR_MIN_WORKERS,
+    maximum: int = SUPERVISOR_MAX_WORKERS,
+) -> int:
+    """Workers que debería tener un stream con `waiting` sin entregar (la primera hace `wait_age_s`)."""
+    want = current
+    if waiting and (wait_age_s >= SUPERVISOR_MAX_WAIT_S or waiting > current * SUPERVISOR_BACKLOG_PER_WORKER):
+        want = max(current + 1, math.ceil(waiting / SUPERVISOR_BACKLOG_PER_WORKER))
+    elif not waiting and quiet_s >= SUPERVISOR_IDLE_S:
+        want = current - 1
+    return min(max(want, minimum), maximum)
+
+
+@dataclass
+class Worker:
+    consumer: str
+    proc: asyncio.subprocess.Process
+    retiring: bool = False
+
+
+class StreamPool:
+    """Workers de un stream y el estado de la decisión de escala."""
+
+    def __init__(self, stream: str, minimum: int, maximum: int):
+        self.stream = stream
+        self.group, self.module = WORKERS[stream]
+        self.minimum = minimum
+        self.maximum = maximum
+        self.workers: list[Worker] = []
+        self.tasks: set[asyncio.Task] = set()
+        self.quiet_since = time.monotonic()
+        self.changed_at = 0.0
+
+    @property
+    def active(self) -> list[Worker]:
+        return [w for w in self.workers if not w.retiring]
+
+
+class Supervisor:
+    def __init__(self, redis, streams, minimum: int, maximum: int):
+        self.redis = redis
+        self.pools = {s: StreamPool(s, minimum, maximum) for s in streams}
+        self._seq = 0
+        self._prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    def _spawn_task(self, pool: StreamPool, coro) -> None:
+        task = asyncio.create_task(coro)
+        pool.tasks.add(task)
+        task.add_done_callback(pool.tasks.discard)
+
+    async def spawn(self, pool: StreamPool) -> Worker:
+        self._seq += 1
+        consumer = f"{pool.stream}-{self._prefix}-{self._seq}"
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            pool.module,
+            env={**os.environ, "STREAM_CONSUMER": consumer},
+            # Sesión propia: el Ctrl+C de la terminal le llega solo al supervisor, que drena.
+            start_new_session=True,
+        )
+        worker = Worker(consumer, proc)
+        pool.workers.append(worker)
+        self._spawn_task(pool, self._watch(pool, worker))
+        logger.info("➕ %s: worker %s (pid %s)", pool.stream, consumer, proc.pid)
+        return worker
+
+    async def retire(self, pool: StreamPool, worker: Worker) -> None:
+        if worker.retiring:
+            return
+        worker.retiring = True
+        logger.info("➖ %s: drenando %s", pool.stream, worker.consumer)
+        try:
+            worker.proc.send_signal(signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(worker.proc.wait(), SUPERVISOR_DRAIN_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            logger.warning("%s no terminó en %.0fs: SIGKILL", worker.consumer, SUPERVISOR_DRAIN_TIMEOUT_S)
+            worker.proc.kill()
+
+    async def _watch(self, pool: StreamPool, worker: Worker) -> None:
+        code = await worker.proc.wait()
+        pool.workers.remove(worker)
+        if not worker.retiring:
+            logger.error("💥 %s: worker %s salió con código %s", pool.stream, worker.consumer, code)
+        try:
+            await deadletter.handoff(self.redis, pool.stream, pool.group, worker.consumer)
+        except Exception:
+            logger.exception("%s: no se pudieron pasar las pendientes de %s", pool.stream, worker.consumer)
+
+    async def adopt_orphans(self, pool: StreamPool) -> None:
+        """Consumers que no son de este supervisor, con pendientes y sin leer hace rato."""
+        ours = {w.consumer for w in pool.workers}
+        for c in await self.redis.xinfo_consumers(pool.stream, pool.group):
+            name = c["name"].decode() if isinstance(c["name"], bytes) else c["name"]
+            if name in ours or name == deadletter.HANDOFF_CONSUMER:
+                continue
+            if int(c.get("pending") or 0) and int(c.get("idle") or 0) >= SUPERVISOR_ORPHAN_IDLE_S * 1000:
+                logger.warning("%s: %s no lee hace %ss, se reparten sus pendientes", pool.stream, name, c["idle"] // 1000)
+                await deadletter.handoff(self.redis, pool.stream, pool.group, name)
+
+    async def scale(self, pool: StreamPool) -> None:
+        stats = await stream_group_stats(self.redis, pool.stream, pool.group)
+        if stats is None:
+            return
+        waiting = stats["undelivered"]
+        if waiting is None:
+            # Redis no pudo calcular el lag (XDEL en el medio): alcanza con saber si hay algo.
+            waiting = 1 if stats["oldest_undelivered_age_s"] else 0
+        now = time.monotonic()
+        if waiting:
+            pool.quiet_since = now
+        active = pool.active
+        want = target_workers(
+            len(active),
+            waiting,
+            stats["oldest_undelivered_age_s"],
+            now - pool.quiet_since,
+            minimum=pool.minimum,
+            maximum=pool.maximum,
+        )
+        if want == len(active):
+            return
+        if len(active) >= pool.minimum and now - pool.changed_at < SUPERVISOR_COOLDOWN_S:
+            return
+        logger.info(
+            "%s: %s → %s workers (sin entregar %s, la primera espera %.1fs)",
+            pool.stream, len(active), want, waiting, stats["oldest_undelivered_age_s"],
+        )
+        for _ in range(want - len(active)):
+            await self.spawn(pool)
+        if want < len(active):
+            # El más nuevo: los viejos ya tienen caliente lo que cachean en proceso.
+            self._spawn_task(pool, self.retire(pool, active[-1]))
+            pool.quiet_since = now
+        pool.changed_at = now
+
+    async def run(self, stop: asyncio.Event) -> None:
+        for pool in self.pools.values():
+            await ensure_redis_stream_group(self.redis, pool.stream, pool.group)
+        logger.info(
+            "🧩 Supervisor: %s (workers %s..%s por stream)",
+            ", ".join(self.pools),
+            min(p.minimum for p in self.pools.values()),
+            max(p.maximum for p in self.pools.values()),
+        )
+        while not stop.is_set():
+            for pool in self.pools.values():
+                try:
+                    await self.adopt_orphans(pool)
+                    await self.scale(pool)
+                except Exception:
+                    logger.exception("[supervisor] %s: error en la vuelta", pool.stream)
+            try:
+                await asyncio.wait_for(stop.wait(), SUPERVISOR_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+        await self.shutdown()
+
+    async def shutdown(self) -> None:
+        logger.info("Supervisor: drenando todos los workers…")
+        for pool in self.pools.values():
+            for worker in list(pool.workers):
+                self._spawn_task(pool, self.retire(pool, worker))
+        for pool in self.pools.values():
+            while pool.tasks:
+                await asyncio.gather(*list(pool.tasks), return_exceptions=True)
+
+
+async def supervise(streams, minimum: int, maximum: int) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    redis = get_redis()
+    try:
+        await Supervisor(redis, streams, minimum, maximum).run(stop)
+    finally:
+        await redis.aclose()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Supervisor de workers de los streams de trabajo")
+    parser.add_argument("--streams", nargs="+", choices=list(WORKERS), default=list(WORKERS))
+    parser.add_argument("--min", type=int, default=SUPERVISOR_MIN_WORKERS, help="workers mínimos por stream")
+    parser.add_argument("--max", type=int, default=SUPERVISOR_MAX_WORKERS, help="workers máximos por stream")
+    args = parser.parse_args()
+    if not 0 <= args.min <= args.max:
+        parser.error("se necesita 0 <= --min <= --max")
+    asyncio.run(supervise(args.streams, args.min, args.max))
+
+
+if __name__ == "__main__":
+    main()
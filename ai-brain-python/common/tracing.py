@@ -0,0 +1,419 @@
+"""
+Tracing distribuido liviano, exportado en formato OpenTelemetry (OTLP/JSON).
+
+El contexto viaja como `traceparent` (W3C) en headers de Kafka, en un campo de cada
+entrada de los streams de Redis y en los headers HTTP hacia el core. Cada servicio
+registra spans por salto: espera en cola, ruteo, nodos de LangGraph, llamadas LLM/HTTP
+y publicación.
+
+Export (TRACE_EXPORT):
+- "off" (default): no se registra nada.
+- "file": una línea OTLP/JSON por lote en TRACE_FILE (jsonl, se puede levantar con un collector).
+- "otlp": POST a {OTEL_EXPORTER_OTLP_ENDPOINT}/v1/traces.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from uuid import UUID
+
+import httpx
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "off")
+TRACE_FILE = os.getenv("TRACE_FILE", "/tmp/moustro-traces.jsonl")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+TRACEPARENT = "traceparent"
+
+_SPAN_KIND = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+
+_service_name = "moustro"
+_current: ContextVar[Optional["Span"]] = ContextVar("moustro_current_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    kind: str = "internal"
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attrs) -> "Span":
+        self.attributes.update({k: v for k, v in attrs.items() if v is not None})
+        return self
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            _exporter.submit(self)
+
+
+def enabled() -> bool:
+    return TRACE_EXPORT != "off"
+
+
+def init_tracing(service_name: str) -> None:
+    """Nombre del servicio (resource service.name) para todos los spans del proceso."""
+    global _service_name
+    _service_name = service_name
+
+
+def parse_traceparent(value) -> Optional[tuple[str, str]]:
+    """(trace_id, span_id) de un traceparent W3C; None si falta o es inválido."""
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("ascii", "ignore")
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def start_span(
+    name: str,
+    *,
+    parent=None,
+    kind: str = "internal",
+    start_ns: Optional[int] = None,
+    **attrs,
+) -> Span:
+    """
+    Abre un span. `parent` puede ser un Span, un traceparent (str/bytes) o None
+    (usa el span actual del contexto o arranca una traza nueva).
+    """
+    if isinstance(parent, Span):
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        ctx = parse_traceparent(parent) if parent is not None else None
+        if ctx is None and _current.get() is not None:
+            cur = _current.get()
+            ctx = (cur.trace_id, cur.span_id)
+        trace_id, parent_id = ctx if ctx else (secrets.token_hex(16), None)
+    s = Span(name, trace_id, secrets.token_hex(8), parent_id, kind)
+    if start_ns is not None:
+        s.start_ns = start_ns
+    return s.set(**attrs)
+
+
+@contextmanager
+def span(name: str, *, parent=None, kind: str = "internal", **attrs):
+    """Span como contexto actual mientras dura el bloque (sirve en código sync y async)."""
+    s = start_span(name, parent=parent, kind=kind, **attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def record_span(name: str, start_ns: int, end_ns: int, *, parent=None, kind="internal", **attrs) -> None:
+    """Span retroactivo (p. ej. espera en cola: desde el timestamp del mensaje hasta ahora)."""
+    if not enabled():
+        return
+    start_span(name, parent=parent, kind=kind, start_ns=start_ns, **attrs).end(end_ns)
+
+
+def record_queue_wait(name: str, enqueued_ms: int, *, parent=None, **attrs) -> None:
+    now = time.time_ns()
+    start = min(now, int(enqueued_ms) * 1_000_000)
+    record_span(name, start, now, parent=parent, kind="consumer", **attrs)
+
+
+def stream_entry_ms(msg_id) -> int:
+    """Timestamp (ms) embebido en el id de una entrada de stream de Redis (`<ms>-<seq>`)."""
+    if isinstance(msg_id, (bytes, bytearray)):
+        msg_id = msg_id.decode()
+    try:
+        return int(str(msg_id).split("-", 1)[0])
+    except ValueError:
+        return int(time.time() * 1000)
+
+
+@contextmanager
+def stream_span(name: str, stream: str, msg_id, data: dict):
+    """
+    Span de procesamiento de una entrada de stream, hijo del traceparent que trae la
+    entrada; antes registra la espera en cola (id de la entrada → ahora).
+    """
+    parent = data.get(TRACEPARENT.encode()) or data.get(TRACEPARENT)
+    mid = msg_id.decode() if isinstance(msg_id, (bytes, bytearray)) else str(msg_id)
+    record_queue_wait(
+        f"queue.wait {stream}",
+        stream_entry_ms(mid),
+        parent=parent,
+        **{"messaging.destination": stream},
+    )
+    with span(
+        name,
+        parent=parent,
+        kind="consumer",
+        **{"messaging.destination": stream, "messaging.message_id": mid},
+    ) as s:
+        yield s
+
+
+def current_traceparent() -> Optional[str]:
+    cur = _current.get()
+    return cur.traceparent if cur is not None else None
+
+
+def inject_fields(fields: dict) -> dict:
+    """Agrega el traceparent actual a los campos de una entrada de stream."""
+    tp = current_traceparent()
+    if tp:
+        fields[TRACEPARENT] = tp
+    return fields
+
+
+def kafka_headers() -> Optional[list]:
+    tp = current_traceparent()
+    return [(TRACEPARENT, tp.encode("ascii"))] if tp else None
+
+
+def traceparent_from_kafka(msg) -> Optional[bytes]:
+    for key, value in getattr(msg, "headers", None) or ():
+        if key == TRACEPARENT:
+            return value
+    return None
+
+
+class _TracingTransport(httpx.BaseTransport):
+    """Span "HTTP <método> <ruta>" por request y traceparent propagado al core."""
+
+    def __init__(self, inner: httpx.BaseTransport):
+        self._inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with span(f"HTTP {request.method} {request.url.path}", kind="client") as s:
+            request.headers[TRACEPARENT] = s.traceparent
+            response = self._inner.handle_request(request)
+            s.set(**{"http.status_code": response.status_code})
+            return response
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+def http_client(**kwargs) -> httpx.Client:
+    """httpx.Client con conexiones reutilizadas y un span por request."""
+    return httpx.Client(transport=_TracingTransport(httpx.HTTPTransport()), **kwargs)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Spans por nodo de LangGraph y por llamada al chat model (con tokens de usage_metadata)."""
+
+    run_inline = True
+    raise_error = False
+
+    def __init__(self):
+        self._spans: dict[UUID, Span] = {}
+        self._parents: dict[UUID, Optional[UUID]] = {}
+
+    def _parent_span(self, parent_run_id: Optional[UUID]):
+        rid = parent_run_id
+        while rid is not None:
+            if rid in self._spans:
+                return self._spans[rid]
+            rid = self._parents.get(rid)
+        return None
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._parents[run_id] = parent_run_id
+        node = (metadata or {}).get("langgraph_node")
+        if not enabled() or not node or kwargs.get("name") != node:
+            return
+        self._spans[run_id] = start_span(
+            f"graph.node {node}",
+            parent=self._parent_span(parent_run_id),
+            **{"langgraph.node": node, "langgraph.step": (metadata or {}).get("langgraph_step")},
+        )
+
+    def _finish(self, run_id, error: Optional[BaseException] = None, **attrs) -> None:
+        self._parents.pop(run_id, None)
+        s = self._spans.pop(run_id, None)
+        if s is None:
+            return
+        if error is not None:
+            s.error = f"{type(error).__name__}: {error}"
+        s.set(**attrs).end()
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        # GraphInterrupt llega como error: es control de flujo, no falla.
+        if type(error).__name__ == "GraphInterrupt":
+            self._finish(run_id, interrupted=True)
+        else:
+            self._finish(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._parents[run_id] = parent_run_id
+        if not enabled():
+            return
+        params = kwargs.get("invocation_params") or {}
+        self._spans[run_id] = start_span(
+            "llm.call",
+            parent=self._parent_span(parent_run_id),
+            kind="client",
+            **{
+                "llm.model": params.get("model_id") or params.get("model"),
+                "langgraph.node": (metadata or {}).get("langgraph_node"),
+            },
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = {}
+        try:
+            usage = response.generations[0][0].message.usage_metadata or {}
+        except (AttributeError, IndexError):
+            pass
+        self._finish(
+            run_id,
+            **{
+                "llm.input_tokens": usage.get("input_tokens"),
+                "llm.output_tokens": usage.get("output_tokens"),
+            },
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error)
+
+
+def graph_config(config: dict) -> dict:
+    """Agrega el handler de tracing a un config de LangGraph (no-op si el tracing está apagado)."""
+    if enabled():
+        config.setdefault("callbacks", []).append(TracingCallbackHandler())
+    return config
+
+
+def _attr(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+def _otlp_span(s: Span) -> dict:
+    out = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": _SPAN_KIND.get(s.kind, 1),
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [_attr(k, v) for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+def to_otlp(spans: list[Span]) -> dict:
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_attr("service.name", _service_name)]},
+                "scopeSpans": [
+                    {"scope": {"name": "moustro.tracing"}, "spans": [_otlp_span(s) for s in spans]}
+                ],
+            }
+        ]
+    }
+
+
+class _Exporter:
+    """Junta spans en una cola y los exporta por lotes desde un hilo aparte."""
+
+    def __init__(self, batch: int = 128, interval_s: float = 1.0):
+        self._queue: queue.Queue = queue.Queue(maxsize=10_000)
+        self._batch = batch
+        self._interval_s = interval_s
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, s: Span) -> None:
+        if not enabled():
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(s)
+        except queue.Full:
+            pass
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _drain(self) -> list[Span]:
+        spans = []
+        while len(spans) < self._batch:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def flush(self) -> None:
+        while True:
+            spans = self._drain()
+            if not spans:
+                return
+            self._export(spans)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self._interval_s)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("[tracing] export falló: %s", e)
+
+    def _export(self, spans: list[Span]) -> None:
+        payload = to_otlp(spans)
+        if TRACE_EXPORT == "file":
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        elif TRACE_EXPORT == "otlp":
+            httpx.post(f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces", json=payload, timeout=5.0)
+
+
+_exporter = _Exporter()
@@ -0,0 +1,263 @@
+"""
+Registro del turno en curso por cliente, para cancelar una generación cuando llega un
+mensaje nuevo del mismo cliente antes de que salga la respuesta.
+
+hash turn:{customerId}
+  id       turnId del último turno reenviado por el clasificador (viaja en los streams)
+  content  texto del turno (se vuelve a mandar junto con el fragmento nuevo si se cancela)
+  state    queued | running | locked | done | cancelled
+
+- El clasificador, al reenviar, llama a `queued`. Al llegar un fragmento nuevo, `cancel`
+  marca el turno como cancelled si estaba queued/running y devuelve su texto.
+- El worker: `begin` (False si ya estaba cancelado o lo reemplazó otro) → corre el grafo
+  con `run_cancellable` → `finish` (False si lo cancelaron mientras corría: no publica).
+  Si se canceló, `rollback` vuelve el hilo al último checkpoint anterior al arranque del turno
+  (`started`): el grafo cortado a mitad deja el mensaje reemplazado y tool calls sin resultado.
+  El hilo se lee recién al cancelar; el camino normal no paga una lectura extra del checkpoint.
+- Reintento de un mensaje (deadletter.redelivered) cuyo HumanMessage ya está en el hilo
+  (`input_id`, `has_input`): el grafo sigue desde su checkpoint con input None en vez de
+  agregar el mensaje otra vez; esa vuelta no se corta.
+- `locked`: reanudaciones de interrupts (confirmaciones que ejecutan tools, test): nunca se
+  cortan a mitad ni se vigilan; publican siempre y el fragmento nuevo va como turno aparte.
+
+turn_lease:{customerId} = token del worker que está corriendo un turno del cliente (SET NX,
+TTL TURN_LEASE_S renovado mientras corre). Con varios workers por stream (common.supervisor)
+dos mensajes del mismo cliente, o un reintento junto con el original, no corren a la vez sobre
+el mismo hilo: `lease` devuelve None y el worker lo pospone (deadletter.postpone).
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TURN_TTL_S = int(os.getenv("TURN_TTL_S", "600"))
+# Cada cuánto el worker mira si su turno fue cancelado mientras corre el grafo.
+TURN_CANCEL_POLL_S = float(os.getenv("TURN_CANCEL_POLL_S", "0.3"))
+# Exclusividad por cliente: vence sola si el worker se cae; se renueva cada tercio.
+TURN_LEASE_S = int(os.getenv("TURN_LEASE_S", "30"))
+# Espera antes de volver a intentar un mensaje cuyo cliente tiene otro turno corriendo.
+TURN_LEASE_RETRY_S = float(os.getenv("TURN_LEASE_RETRY_S", "1"))
+
+QUEUED = "queued"
+RUNNING = "running"
+LOCKED = "locked"
+DONE = "done"
+CANCELLED = "cancelled"
+
+# KEYS[1]=turn:{cid}. Retorna el content si canceló, nil si no había nada cancelable.
+_CANCEL_LUA = """
+local s = redis.call('HGET', KEYS[1], 'state')
+if s == 'queued' or s == 'running' then
+  redis.call('HSET', KEYS[1], 'state', 'cancelled')
+  return redis.call('HGET', KEYS[1], 'content')
+end
+return false
+"""
+
+# KEYS[1]=turn:{cid}; ARGV[1]=turnId. Borra el registro solo si sigue siendo de ese turno.
+_DISCARD_LUA = """
+if redis.call('HGET', KEYS[1], 'id') == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1]=turn:{cid}; ARGV = turnId, estado nuevo, estados desde los que se permite (csv).
+_TRANSITION_LUA = """
+local cur = redis.call('HMGET', KEYS[1], 'id', 'state')
+if cur[1] ~= ARGV[1] then
+  return 0
+end
+for s in string.gmatch(ARGV[3], '[^,]+') do
+  if cur[2] == s then
+    redis.call('HSET', KEYS[1], 'state', ARGV[2])
+    return 1
+  end
+end
+return 0
+"""
+
+
+# KEYS[1]=turn_lease:{cid}; ARGV = token, TTL en ms (0 = liberar).
+_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return 0
+end
+if ARGV[2] == '0' then
+  return redis.call('DEL', KEYS[1])
+end
+return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+"""
+
+
+class TurnCancelled(Exception):
+    """Llegó un mensaje nuevo del cliente mientras se generaba la respuesta."""
+
+
+def new_turn_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _key(customer_id: str) -> str:
+    return f"turn:{customer_id}"
+
+
+async def queued(redis, customer_id: str, turn_id: str, content: str) -> None:
+    key = _key(customer_id)
+    pipe = redis.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping={"id": turn_id, "content": content, "state": QUEUED})
+    pipe.expire(key, TURN_TTL_S)
+    await pipe.execute()
+
+
+async def discard(redis, customer_id: str, turn_id: str) -> None:
+    """Borra el registro si sigue siendo de `turn_id` (turno que no llegó a encolarse)."""
+    await redis.eval(_DISCARD_LUA, 1, _key(customer_id), turn_id)
+
+
+async def cancel(redis, customer_id: str) -> str | None:
+    """Cancela el turno pendiente o en curso; retorna su texto (None si no había)."""
+    raw = await redis.eval(_CANCEL_LUA, 1, _key(customer_id))
+    if raw is None:
+        return None
+    logger.info("[turns] %s: turno en curso cancelado por mensaje nuevo", customer_id)
+    return raw.decode() if isinstance(raw, bytes) else raw
+
+
+async def _transition(redis, customer_id: str, turn_id: str, to: str, allowed: tuple[str, ...]) -> bool:
+    if not turn_id:
+        # Mensajes sin turnId (diferidos viejos, herramientas): se procesan como siempre.
+        return True
+    return bool(await redis.eval(_TRANSITION_LUA, 1, _key(customer_id), turn_id, to, ",".join(allowed)))
+
+
+async def alive(redis, customer_id: str, turn_id: str) -> bool:
+    if not turn_id:
+        return True
+    raw = await redis.hmget(_key(customer_id), "id", "state")
+    if raw[0] is None:
+        return True
+    return raw[0].decode() == turn_id and raw[1] != CANCELLED.encode()
+
+
+async def begin(redis, customer_id: str, turn_id: str, *, cancellable: bool = True) -> bool:
+    return await _transition(
+        redis, customer_id, turn_id, RUNNING if cancellable else LOCKED, (QUEUED, RUNNING, LOCKED)
+    )
+
+
+async def finish(redis, customer_id: str, turn_id: str) -> bool:
+    """True si el turno sigue vigente (publicar la respuesta); False si lo cancelaron."""
+    return await _transition(redis, customer_id, turn_id, DONE, (RUNNING, LOCKED, QUEUED))
+
+
+async def _watch(redis, customer_id: str, turn_id: str) -> None:
+    while True:
+        await asyncio.sleep(TURN_CANCEL_POLL_S)
+        if not await alive(redis, customer_id, turn_id):
+            return
+
+
+async def run_cancellable(redis, customer_id: str, turn_id: str, coro):
+    """Corre `coro`; si el turno se cancela mientras tanto, la cancela y levanta TurnCancelled."""
+    if not turn_id:
+        return await coro
+    work = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_watch(redis, customer_id, turn_id))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if not work.done():
+        work.cancel()
+        # Deja que la llamada cancelada libere lo suyo (limitador, coberturas) antes de seguir.
+        await asyncio.gather(work, return_exceptions=True)
+        raise TurnCancelled(customer_id)
+    return work.result()
+
+
+def input_id(stream: str, msg_id) -> str:
+    """Id del HumanMessage del turno: el mismo en cada entrega de la entrada del stream."""
+    return f"{stream}:{msg_id.decode() if isinstance(msg_id, bytes) else msg_id}"
+
+
+async def has_input(graph, config, message_id: str) -> bool:
+    """True si el hilo ya tiene el mensaje del turno (un intento anterior llegó a correr el grafo)."""
+    snap = await graph.aget_state(config)
+    return any(getattr(m, "id", None) == message_id for m in (snap.values or {}).get("messages", []))
+
+
+def started() -> datetime:
+    """Marca para `rollback`: los checkpoints del hilo con `ts` posterior son de este turno."""
+    return datetime.now(timezone.utc)
+
+
+async def rollback(graph, config, since: datetime | None) -> None:
+    """Vuelve el hilo a como estaba antes de `since` tras un turno cancelado (None: el grafo no llegó a correr)."""
+    if since is None:
+        return
+    thread_id = str(config["configurable"]["thread_id"])
+    try:
+        written = False
+        before = None
+        # Del más nuevo al más viejo: se corta en el primero que ya estaba antes del turno.
+        async for tup in graph.checkpointer.alist({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}):
+            if datetime.fromisoformat(tup.checkpoint["ts"]) < since:
+                before = tup
+                break
+            written = True
+        if not written:
+            return
+        if before is not None:
+            # Copia de ese checkpoint como el último del hilo; el historial cortado queda atrás.
+            await graph.aupdate_state(before.config, None)
+        else:
+            await graph.checkpointer.adelete_thread(thread_id)
+    except Exception:
+        logger.exception("[turns] no se pudo volver al checkpoint anterior de %s", thread_id)
+
+
+class Lease:
+    """Turno del cliente tomado por este worker; se libera al salir del `async with`."""
+
+    def __init__(self, redis, customer_id: str, token: str):
+        self._redis = redis
+        self._key = f"turn_lease:{customer_id}"
+        self._token = token
+        self._renewer = asyncio.ensure_future(self._renew())
+
+    async def _renew(self) -> None:
+        while True:
+            await asyncio.sleep(TURN_LEASE_S / 3)
+            if not await self._redis.eval(_LEASE_LUA, 1, self._key, self._token, TURN_LEASE_S * 1000):
+                logger.warning("[turns] %s: se perdió la exclusividad del turno", self._key)
+                return
+
+    async def release(self) -> None:
+        self._renewer.cancel()
+        await self._redis.eval(_LEASE_LUA, 1, self._key, self._token, 0)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.release()
+
+
+async def lease(redis, customer_id: str) -> Lease | None:
+    """Toma el turno del cliente para este worker; None si otro worker lo tiene."""
+    token = uuid.uuid4().hex
+    if not await redis.set(f"turn_lease:{customer_id}", token, nx=True, ex=TURN_LEASE_S):
+        return None
+    return Lease(redis, customer_id, token)
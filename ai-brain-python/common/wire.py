@@ -0,0 +1,71 @@
+"""
+Codec compartido de lo que viaja entre servicios: JSON de Kafka (chat-queries, chat-response),
+campos de los streams de Redis y el JSONB de `conversations`.
+
+- JSON con orjson si está instalado (bytes UTF-8 directo, sin pasar por str); si no, json de
+  la stdlib con un encoder/decoder creados una sola vez (json.dumps con argumentos arma uno
+  nuevo en cada llamada). Mismo formato en los dos casos: UTF-8 sin escapar, sin espacios.
+- chat-response respeta el contrato de Java `ChatReplyPayload` {customerId, reply}.
+- Campos de stream: siempre str. None → "", bool → "1"/"0" (como newSession), bytes se
+  decodifican, dict/list van como JSON (antes `str(v)` dejaba "True" o el repr de un dict).
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson viene con langgraph; por las dudas
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+if orjson is not None:
+    _OPTS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=str, option=_OPTS)
+
+    def loads(raw):
+        return orjson.loads(raw)
+
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str)
+    _decoder = json.JSONDecoder()
+
+    def dumps(obj) -> bytes:
+        return _encoder.encode(obj).encode("utf-8")
+
+    def loads(raw):
+        if isinstance(raw, (bytes, bytearray, memoryview)):
+            raw = bytes(raw).decode("utf-8")
+        return _decoder.decode(raw)
+
+
+def dumps_str(obj) -> str:
+    """JSON como str (parámetros json/jsonb de asyncpg)."""
+    return dumps(obj).decode("utf-8")
+
+
+def chat_reply(customer_id: str, reply: str) -> bytes:
+    """Payload de chat-response (Java: ChatReplyPayload leído con ObjectMapper)."""
+    return dumps({"customerId": customer_id, "reply": reply})
+
+
+def field_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode("utf-8")
+    return dumps_str(value)
+
+
+def encode_fields(data: dict) -> dict[str, str]:
+    """Campos para XADD a partir de un payload (p. ej. el JSON de chat-queries)."""
+    # Casi todo ya es str: se evita la llamada en ese caso.
+    return {k: v if type(v) is str else field_value(v) for k, v in data.items()}
+
@@ -1,6 +1,8 @@
 import re
 import logging
+from common.lexicon import INVESTMENT, LOANS, scan
 from services.brain.classifier.prompt import PROMPT_BRAIN_CLS
+from services.llms import timeouts
 from services.llms.models import get_bedrock_model_master
 
 model = get_bedrock_model_master()
@@ -12,19 +14,6 @@ VALID_WORKFLOWS = ["workflow_loans", "workflow_investment"]
 # Misma ventana que session: al expirar se vuelve a clasificar con Haiku si hace falta.
 BRAIN_WORKFLOW_TTL_S = 1800
 
-_BRAIN_INVEST = re.compile(
-    r"(\binversiones?\b|\binversión\b|\binvertir\b|perfil inversor|test de idoneidad|idoneidad|"
-    r"mercado de capitales|fci|cedear|dónde invertir|donde invertir|mep|bonos?|letras del tesoro|"
-    r"armar cartera|activos financieros|fondo común|módulo de inversion|ahora inversi|tema inversi)",
-    re.I,
-)
-
-_BRAIN_LOANS = re.compile(
-    r"(\bpréstamo|\bprestamo|refinanc|refi\b|nuevo crédito|plata en mano|"
-    r"efectivo en mano|mi préstamo|solicit(ar|o) (un )?préstamo|loan|mill[oó]n (de )?plata|tope 1[,.]?2)",
-    re.I,
-)
-
 
 def should_reclassify_brain_workflow(
     cached: str, contenido_usuario: str
@@ -35,15 +24,15 @@ def should_reclassify_brain_workflow(
     """
     if cached not in VALID_WORKFLOWS:
         return True
-    u = (contenido_usuario or "").strip()
-    if cached == "workflow_loans" and _BRAIN_INVEST.search(u) and not _BRAIN_LOANS.search(u):
+    hits = scan((contenido_usuario or "").strip())
+    if cached == "workflow_loans" and hits.only(INVESTMENT, LOANS):
         return True
-    if cached == "workflow_investment" and _BRAIN_LOANS.search(u) and not _BRAIN_INVEST.search(u):
+    if cached == "workflow_investment" and hits.only(LOANS, INVESTMENT):
         return True
     return False
 
 
-def get_brain_classification(
+async def get_brain_classification(
     contenido_usuario: str, ultimo_asistente: str | None = None
 ) -> str:
     """
@@ -53,11 +42,11 @@ def get_brain_classification(
     c = (contenido_usuario or "").strip()
     a = (ultimo_asistente or "").strip()
 
-    t = f"{a}\n{c}" if a else c
-    if a == "" and _BRAIN_INVEST.search(t) and not _BRAIN_LOANS.search(t):
+    hits = scan(c)
+    if a == "" and hits.only(INVESTMENT, LOANS):
         logger.info("[BRAIN-CLS] Heurística -> workflow_investment")
         return "workflow_investment"
-    if a == "" and _BRAIN_LOANS.search(t) and not _BRAIN_INVEST.search(t):
+    if a == "" and hits.only(LOANS, INVESTMENT):
         logger.info("[BRAIN-CLS] Heurística -> workflow_loans")
         return "workflow_loans"
 
@@ -67,7 +56,7 @@ def get_brain_classification(
     )
 
     try:
-        response = model.invoke(formatted_prompt)
+        response = await timeouts.route(model, formatted_prompt, label="brain_router")
         raw = (response.content or "").strip().lower() if isinstance(response.content, str) else str(
             response.content
         )
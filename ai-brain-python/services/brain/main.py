@@ -1,7 +1,15 @@
 import asyncio
 import logging
-from common.kafka_config import ensure_redis_stream_group, xreadgroup_with_recovery
+from common import deadletter, idempotency, tracing, turns
+from common.kafka_config import (
+    STREAM_CONSUMER,
+    drain_on_sigterm,
+    draining,
+    ensure_redis_stream_group,
+    xreadgroup_with_recovery,
+)
 from common.redis_config import get_redis
+from services.llms import usage
 from services.brain.classifier.logic import (
     BRAIN_WORKFLOW_TTL_S,
     get_brain_classification,
@@ -16,17 +24,19 @@ _MAX_CONTEXTO_BRAIN_CLS = 12_000
 
 
 async def run_brain():
+    tracing.init_tracing("brain")
     redis = get_redis()
     await ensure_redis_stream_group(redis, "to-brain", "brain-group")
+    drain_on_sigterm()
 
     logger.info("Brain activo: to-brain → Haiku elige workflow (loans | investment)…")
 
-    while True:
+    while not draining():
         results = await xreadgroup_with_recovery(
             redis,
             "to-brain",
             "brain-group",
-            "worker-1",
+            STREAM_CONSUMER,
             count=1,
             block=1000,
         )
@@ -36,32 +46,54 @@ async def run_brain():
 
         for _, messages in results:
             for msg_id, data in messages:
-                customer_id = data[b"customerId"].decode()
-                contenido = data[b"contenido"].decode()
-                contexto = data.get(b"contexto", b"").decode()
-                if len(contexto) > _MAX_CONTEXTO_BRAIN_CLS:
-                    contexto = contexto[:_MAX_CONTEXTO_BRAIN_CLS] + "\n…"
+                with tracing.stream_span("brain.route", "to-brain", msg_id, data) as span:
+                    customer_id = data[b"customerId"].decode()
+                    if await idempotency.lookup(redis, "to-brain", msg_id):
+                        logger.info("♻️ %s ya ruteado (redelivery), solo ack", msg_id.decode())
+                        await deadletter.ack(redis, "to-brain", "brain-group", msg_id)
+                        continue
+                    # Sin try: un mensaje que rompe el ruteo tira el proceso y se relee al
+                    # reiniciar; acá se corta después de POISON_MAX_DELIVERIES entregas.
+                    if not await deadletter.admit(redis, "to-brain", msg_id, data):
+                        await deadletter.ack(redis, "to-brain", "brain-group", msg_id)
+                        continue
+                    turn_id = data.get(b"turnId", b"").decode()
+                    if not await turns.alive(redis, customer_id, turn_id):
+                        # El cliente escribió de nuevo: el turno nuevo ya viene con este texto.
+                        logger.info("✂️ %s: turno reemplazado antes de rutear", customer_id)
+                        await idempotency.mark_done(redis, "to-brain", msg_id)
+                        await deadletter.ack(redis, "to-brain", "brain-group", msg_id)
+                        continue
+                    contenido = data[b"contenido"].decode()
+                    contexto = data.get(b"contexto", b"").decode()
+                    if len(contexto) > _MAX_CONTEXTO_BRAIN_CLS:
+                        contexto = contexto[:_MAX_CONTEXTO_BRAIN_CLS] + "\n…"
 
-                wf_key = f"brain_workflow:{customer_id}"
-                raw_cached = await redis.get(wf_key)
-                if raw_cached and not should_reclassify_brain_workflow(
-                    raw_cached.decode(), contenido
-                ):
-                    workflow = raw_cached.decode()
-                    logger.info("🔀 %s → %s (caché, sin Haiku)", customer_id, workflow)
-                else:
-                    workflow = get_brain_classification(
-                        contenido, ultimo_asistente=contexto or None
-                    )
-                    logger.info("🔀 %s → %s", customer_id, workflow)
-                await redis.set(wf_key, workflow, ex=BRAIN_WORKFLOW_TTL_S)
+                    wf_key = f"brain_workflow:{customer_id}"
+                    raw_cached = await redis.get(wf_key)
+                    if raw_cached and not should_reclassify_brain_workflow(
+                        raw_cached.decode(), contenido
+                    ):
+                        workflow = raw_cached.decode()
+                        logger.info("🔀 %s → %s (caché, sin Haiku)", customer_id, workflow)
+                    else:
+                        with tracing.span("llm.route brain", kind="client"):
+                            async with usage.turn(redis, "brain", customer_id, node="router"):
+                                workflow = await get_brain_classification(
+                                    contenido, ultimo_asistente=contexto or None
+                                )
+                        logger.info("🔀 %s → %s", customer_id, workflow)
+                    await redis.set(wf_key, workflow, ex=BRAIN_WORKFLOW_TTL_S)
+                    span.set(**{"route.workflow": workflow})
 
-                await redis.xadd(workflow,{
-                    "customerId": customer_id,
-                    "contenido": contenido,
-                    "contexto": contexto
-                })
-                await redis.xack("to-brain", "brain-group", msg_id)
+                    await redis.xadd(workflow, tracing.inject_fields({
+                        "customerId": customer_id,
+                        "contenido": contenido,
+                        "contexto": contexto,
+                        "turnId": turn_id,
+                    }))
+                    await idempotency.mark_done(redis, "to-brain", msg_id)
+                    await deadletter.ack(redis, "to-brain", "brain-group", msg_id)
 
 if __name__ == "__main__":
     asyncio.run(run_brain())
\ No newline at end of file
@@ -1,6 +1,6 @@
 from langgraph.graph import StateGraph, START, END
 from services.brain.workflows.investment.state import InvestmentState
-from services.brain.workflows.investment.questionnaire import QUIZ
+from common.questionnaire import QUIZ
 from services.brain.workflows.investment.nodes import (
     check_profile_node,
     quiz_node,
@@ -2,16 +2,22 @@ import asyncio
 import logging
 from langchain_core.messages import HumanMessage
 from langgraph.types import Command
+from common import deadletter, idempotency, interrupts, tracing, turns
 from common.redis_config import get_redis, get_checkpointer
-from common.post_close_kafka import send_reply_set_post_close_if_marker
+from common.admission import track_llm_turn
+from services.llms import usage
 from common.kafka_config import (
     get_producer,
     send_chat_response,
     ensure_redis_stream_group,
     xreadgroup_with_recovery,
+    STREAM_CONSUMER,
+    drain_on_sigterm,
+    draining,
 )
 from common.conversation_store import init_db, save_conversation
 from services.brain.workflows.investment.graph import build_graph
+from common import quiz_engine
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -47,25 +53,45 @@ def _interrupts_from_graph_result(result):
     return ()
 
 
+async def _resume_quiz(graph, config, fresh_input: dict, letters: str, offset: int):
+    """
+    Respuestas del test que juntó el clasificador (desde el ítem `offset`). Se decide con el
+    checkpoint y no con la marca de interrupt: si el hilo no está esperando en el test, un
+    invoke nuevo lo lleva hasta la pregunta que corresponda y recién ahí se aplican. El
+    quiz_node toma las que le faltan y guarda las de ítems que todavía no preguntó.
+    """
+    resume = Command(resume={"quiz_answers": list(letters), "quiz_offset": offset})
+    snap = await graph.aget_state(config)
+    if snap.interrupts:
+        return await graph.ainvoke(resume, config=config)
+    result = await graph.ainvoke(fresh_input, config=config)
+    if not _interrupts_from_graph_result(result):
+        # Ya tenía perfil en el core (fue directo al asesor): el test no hace falta.
+        return result
+    return await graph.ainvoke(resume, config=config)
+
+
 async def run():
+    tracing.init_tracing("workflow-investment")
     await init_db()
 
     redis = get_redis()
     await ensure_redis_stream_group(redis, "workflow_investment", "investment-group")
     producer = get_producer()
     await producer.start()
+    drain_on_sigterm()
 
     async with get_checkpointer() as checkpointer:
         graph = build_graph(checkpointer)
 
         logger.info("📈 Workflow Inversiones activo en stream:workflow_investment...")
 
-        while True:
+        while not draining():
             results = await xreadgroup_with_recovery(
                 redis,
                 "workflow_investment",
                 "investment-group",
-                "worker-1",
+                STREAM_CONSUMER,
                 count=1,
                 block=1000,
             )
@@ -75,91 +101,167 @@ async def run():
 
             for _, messages in results:
                 for msg_id, data in messages:
-                    customer_id = data[b"customerId"].decode()
-                    contenido = data[b"contenido"].decode()
-                    contexto = data.get(b"contexto", b"").decode()
-
-                    config = {"configurable": {"thread_id": customer_id}}
-
-                    initial_messages = []
-                    if contexto:
-                        initial_messages.append(
-                            HumanMessage(content=f"Contexto previo: {contexto}")
-                        )
-                    initial_messages.append(HumanMessage(content=contenido))
-
-                    try:
-                        try:
-                            snap = await graph.aget_state(config)
-                            waiting = bool(snap.interrupts)
-                        except Exception as ex:
-                            logger.debug("[investment] aget_state: %s", ex)
-                            waiting = False
-
-                        if waiting:
-                            result = await graph.ainvoke(
-                                Command(resume=contenido), config=config
-                            )
-                        else:
-                            result = await graph.ainvoke(
-                                {
-                                    "messages": initial_messages,
-                                    "customer_id": customer_id,
-                                },
-                                config=config,
-                            )
+                    with tracing.stream_span("investment.turn", "workflow_investment", msg_id, data):
+                        customer_id = data[b"customerId"].decode()
+                        contenido = data[b"contenido"].decode()
+                        contexto = data.get(b"contexto", b"").decode()
+                        quiz_answers = data.get(b"quizAnswers", b"").decode()
+                        quiz_offset = int(data.get(b"quizOffset", b"0") or 0)
+                        turn_id = data.get(b"turnId", b"").decode()
 
-                        intrs = _interrupts_from_graph_result(result)
-                        state = _state_from_graph_result(result)
+                        if await idempotency.replay(redis, producer, "workflow_investment", msg_id, customer_id):
+                            await deadletter.ack(redis, "workflow_investment", "investment-group", msg_id)
+                            continue
+                        if not await deadletter.admit(redis, "workflow_investment", msg_id, data):
+                            await deadletter.ack(redis, "workflow_investment", "investment-group", msg_id)
+                            continue
 
-                        if intrs:
-                            first = intrs[0]
-                            pregunta = (
-                                first.value
-                                if hasattr(first, "value")
-                                else getattr(first, "value", first)
-                            )
-                            await send_reply_set_post_close_if_marker(
-                                redis, producer, customer_id, str(pregunta)
+                        turn_lease = await turns.lease(redis, customer_id)
+                        if turn_lease is None:
+                            # Otro worker está con un turno de este cliente: vuelve en un rato.
+                            await deadletter.postpone(
+                                redis, "workflow_investment", msg_id, turns.TURN_LEASE_RETRY_S
                             )
-                        elif isinstance(state, dict) and state.get("messages"):
-                            raw = state["messages"][-1].content
-                            text = _text_from_message_content(raw)
-                            await send_reply_set_post_close_if_marker(
-                                redis, producer, customer_id, text
+                            continue
+
+                        async with turn_lease:
+                            config = tracing.graph_config(
+                                {"configurable": {"thread_id": customer_id}}
                             )
+
+                            initial_messages = []
+                            if contexto:
+                                initial_messages.append(
+                                    HumanMessage(content=f"Contexto previo: {contexto}")
+                                )
+                            input_id = turns.input_id("workflow_investment", msg_id)
+                            initial_messages.append(HumanMessage(content=contenido, id=input_id))
+
+                            started_at = None
                             try:
-                                await save_conversation(
-                                    customer_id, "investment", state["messages"]
+                                # Reintento con el mensaje ya en el hilo: se sigue desde el checkpoint.
+                                resuming = (
+                                    not quiz_answers
+                                    and await deadletter.redelivered(redis, "workflow_investment", msg_id)
+                                    and await turns.has_input(graph, config, input_id)
                                 )
-                            except Exception:
+                                waiting = bool(quiz_answers) or (
+                                    not resuming and await interrupts.awaiting(redis, graph, "investment", config)
+                                )
+                                # Las respuestas a un interrupt (test, confirmaciones) no se cortan.
+                                if not await turns.begin(
+                                    redis, customer_id, turn_id, cancellable=not (waiting or resuming)
+                                ):
+                                    raise turns.TurnCancelled(customer_id)
+                                # Si el worker se cae a mitad del grafo la marca no queda vieja.
+                                await interrupts.forget(redis, "investment", customer_id)
+
+                                async with track_llm_turn(redis, f"investment:{msg_id.decode()}"), usage.turn(
+                                    redis, "investment", customer_id
+                                ):
+                                    if quiz_answers:
+                                        result = await _resume_quiz(
+                                            graph,
+                                            config,
+                                            {"messages": initial_messages, "customer_id": customer_id},
+                                            quiz_answers,
+                                            quiz_offset,
+                                        )
+                                    elif resuming:
+                                        result = await graph.ainvoke(None, config=config)
+                                    elif waiting:
+                                        result = await graph.ainvoke(
+                                            Command(resume=contenido), config=config
+                                        )
+                                    else:
+                                        started_at = turns.started()
+                                        result = await turns.run_cancellable(
+                                            redis,
+                                            customer_id,
+                                            turn_id,
+                                            graph.ainvoke(
+                                                {
+                                                    "messages": initial_messages,
+                                                    "customer_id": customer_id,
+                                                },
+                                                config=config,
+                                            ),
+                                        )
+
+                                intrs = _interrupts_from_graph_result(result)
+                                state = _state_from_graph_result(result)
+                                await interrupts.mark(redis, "investment", customer_id, bool(intrs))
+                                if not await turns.finish(redis, customer_id, turn_id) and not (waiting or resuming):
+                                    raise turns.TurnCancelled(customer_id)
+
+                                if intrs:
+                                    first = intrs[0]
+                                    pregunta = (
+                                        first.value
+                                        if hasattr(first, "value")
+                                        else getattr(first, "value", first)
+                                    )
+                                    await idempotency.publish_once(
+                                        redis, producer, "workflow_investment", msg_id, customer_id, str(pregunta)
+                                    )
+                                    # Las preguntas siguientes las contesta el clasificador.
+                                    if isinstance(state, dict):
+                                        await quiz_engine.start(
+                                            redis,
+                                            customer_id,
+                                            len(state.get("quiz_answers") or []),
+                                            state.get("quiz_prefill"),
+                                        )
+                                elif isinstance(state, dict) and state.get("messages"):
+                                    raw = state["messages"][-1].content
+                                    text = _text_from_message_content(raw)
+                                    await idempotency.publish_once(
+                                        redis, producer, "workflow_investment", msg_id, customer_id, text
+                                    )
+                                    try:
+                                        await save_conversation(
+                                            customer_id, "investment", state["messages"]
+                                        )
+                                    except Exception:
+                                        logger.exception(
+                                            "save_conversation (investment) falló; respuesta ya enviada"
+                                        )
+                                else:
+                                    logger.warning(
+                                        "[investment] Sin mensaje para %s", customer_id
+                                    )
+                                    await send_chat_response(
+                                        producer,
+                                        customer_id,
+                                        "No se pudo generar la respuesta de inversiones. Probá de nuevo.",
+                                    )
+
+                            except turns.TurnCancelled:
+                                logger.info("[investment] Turno de %s reemplazado por un mensaje nuevo", customer_id)
+                                await turns.rollback(graph, config, started_at)
+                                # El hilo volvió al checkpoint anterior: la próxima vez se relee el estado.
+                                await interrupts.forget(redis, "investment", customer_id)
+                                await idempotency.mark_done(redis, "workflow_investment", msg_id)
+                            except Exception as e:
                                 logger.exception(
-                                    "save_conversation (investment) falló; respuesta ya enviada"
+                                    "[investment] Error procesando %s", customer_id
                                 )
-                        else:
-                            logger.warning(
-                                "[investment] Sin mensaje para %s", customer_id
-                            )
-                            await send_chat_response(
-                                producer,
-                                customer_id,
-                                "No se pudo generar la respuesta de inversiones. Probá de nuevo.",
-                            )
+                                # Si le quedan intentos queda pendiente (sin ack) y vuelve con backoff.
+                                await interrupts.forget(redis, "investment", customer_id)
+                                if await deadletter.failed(redis, "workflow_investment", msg_id, data, e):
+                                    continue
+                                try:
+                                    await send_chat_response(
+                                        producer,
+                                        customer_id,
+                                        "Tuvimos un error en inversiones. Probá de nuevo en un rato.",
+                                    )
+                                except Exception:
+                                    pass
 
-                    except Exception:
-                        logger.exception(
-                            "[investment] Error procesando %s", customer_id
-                        )
-                        try:
-                            await send_chat_response(
-                                producer,
-                                customer_id,
-                                "Tuvimos un error en inversiones. Probá de nuevo en un rato.",
-                            )
-                        except Exception:
-                            pass
+                            await deadletter.ack(redis, "workflow_investment", "investment-group", msg_id)
 
-                    await redis.xack("workflow_investment", "investment-group", msg_id)
+    await producer.stop()
 
 
 if __name__ == "__main__":
@@ -4,16 +4,20 @@ from functools import partial
 from langchain_core.messages import SystemMessage
 from langgraph.types import interrupt
 from services.brain.workflows.investment.state import InvestmentState
-from services.brain.workflows.investment.questionnaire import (
+from common.questionnaire import (
     QUIZ,
     compute_profile,
     format_question_block,
+    format_questions_block,
+    parse_quiz_answers,
     parse_quiz_letter,
+    wants_all_questions,
 )
 from services.brain.workflows.investment.tools import (
     fetch_profile_investor,
     save_profile_investor,
 )
+from services.llms import timeouts
 from services.brain.workflows.investment.prompt import (
     SYSTEM_INVESTMENT_ADVISOR,
     tier_blurb,
@@ -24,13 +28,16 @@ logger = logging.getLogger(__name__)
 INTRO_QUIZ = (
     "Hola, soy el asesor de inversiones del Banco Moustro. **No tenés aún un perfil de inversor registrado** "
     "(idoneidad / CNV) para este cliente, así que primero hacemos el test obligatorio. "
-    "Son **9 preguntas**; en cada una respondé con la letra **A, B, C o D** (o lo que indique el enunciado).\n\n"
+    "Son **9 preguntas**; en cada una respondé con la letra **A, B, C o D** (o lo que indique el enunciado). "
+    "Si ya conocés el test, escribí **todas** y te las paso juntas para responder en un solo mensaje "
+    "(p. ej. `A C B D B A C B D` o `1a 2c 3b…`).\n\n"
 )
 
 
 def _cleared_quiz_state() -> dict:
     return {
         "quiz_answers": [],
+        "quiz_prefill": {},
         "investor_tier": None,
         "quiz_total_score": None,
         "max_loss_percent": None,
@@ -102,13 +109,36 @@ def quiz_node(state: InvestmentState) -> dict:
         text = block
 
     raw = interrupt(text)
-    letter = parse_quiz_letter(str(raw) if raw is not None else "", item)
-    new_ans = answers + [letter]
+    if isinstance(raw, str) and wants_all_questions(raw):
+        raw = interrupt(format_questions_block(QUIZ[n:]))
+    prefill = dict(state.get("quiz_prefill") or {})
+    if isinstance(raw, dict) and raw.get("quiz_answers"):
+        # Respuestas ya validadas en el ingreso (quiz_engine), desde el ítem `quiz_offset`.
+        # Si el grafo quedó antes de ese ítem, se guardan hasta llegar y se pregunta el hueco.
+        start = int(raw.get("quiz_offset", n))
+        for i, letter in enumerate(raw["quiz_answers"]):
+            if n <= start + i < len(QUIZ):
+                prefill[str(start + i)] = str(letter).upper()
+        new_ans = list(answers)
+    else:
+        text_raw = str(raw) if raw is not None else ""
+        # Varias respuestas en un mensaje: se toman las consecutivas desde este ítem.
+        parsed = parse_quiz_answers(text_raw, list(range(n, len(QUIZ))))
+        batch = []
+        for idx in range(n, len(QUIZ)):
+            if idx not in parsed:
+                break
+            batch.append(parsed[idx])
+        new_ans = answers + (batch or [parse_quiz_letter(text_raw, item)])
+    while len(new_ans) < len(QUIZ) and str(len(new_ans)) in prefill:
+        new_ans.append(prefill[str(len(new_ans))])
+    prefill = {k: v for k, v in prefill.items() if int(k) >= len(new_ans)}
     if len(new_ans) < len(QUIZ):
-        return {"quiz_answers": new_ans}
+        return {"quiz_answers": new_ans, "quiz_prefill": prefill}
     tier, tot, mloss, horiz = compute_profile(new_ans)
     return {
         "quiz_answers": new_ans,
+        "quiz_prefill": {},
         "investor_tier": tier,
         "quiz_total_score": tot,
         "max_loss_percent": mloss,
@@ -134,7 +164,7 @@ def persist_profile_node(state: InvestmentState) -> dict:
     return {"profile_persisted": True}
 
 
-def advisor_node(state: InvestmentState, model) -> dict:
+async def advisor_node(state: InvestmentState, model) -> dict:
     tier = (state.get("investor_tier") or "MODERADO").upper()
     mloss = state.get("max_loss_percent")
     if mloss is None:
@@ -149,7 +179,7 @@ def advisor_node(state: InvestmentState, model) -> dict:
         perfil_breve=perfil,
     )
     if state.get("quiz_total_score") is not None:
-        from services.brain.workflows.investment.questionnaire import max_quiz_score
+        from common.questionnaire import max_quiz_score
 
         sys_text += (
             f"\n\nEl usuario **acaba de completar** el test: perfil **{tier}**, "
@@ -158,7 +188,7 @@ def advisor_node(state: InvestmentState, model) -> dict:
             f" ofrecé una primera orientación alineada al perfil."
         )
     messages = [SystemMessage(content=sys_text)] + list(state["messages"])
-    res = model.invoke(messages)
+    res = await timeouts.turn(model, messages, label="investment.advisor")
     return {"messages": [res]}
 
 
@@ -10,6 +10,8 @@ class InvestmentState(TypedDict):
     has_profile: NotRequired[Optional[bool]]
     investor_tier: NotRequired[Optional[str]]
     quiz_answers: NotRequired[list[str]]
+    # Respuestas ya dadas para ítems posteriores al que espera el grafo (índice → letra).
+    quiz_prefill: NotRequired[dict[str, str]]
     quiz_total_score: NotRequired[Optional[int]]
     max_loss_percent: NotRequired[Optional[int]]
     horizon: NotRequired[Optional[str]]
@@ -1,21 +1,24 @@
 import logging
 import os
 
-import httpx
+from common import tracing
 
 logger = logging.getLogger(__name__)
 
 CORE_API = os.getenv("CORE_API_URL", "http://localhost:8080/api/v1/bank-ia")
 
+# Cliente compartido: reutiliza conexiones al core y abre un span por request.
+_http = tracing.http_client()
+
 
 def fetch_profile_investor(customer_id: str) -> dict:
-    r = httpx.get(f"{CORE_API}/profile-investor/{customer_id}", timeout=15.0)
+    r = _http.get(f"{CORE_API}/profile-investor/{customer_id}", timeout=15.0)
     r.raise_for_status()
     return r.json()
 
 
 def delete_profile_investor(customer_id: str) -> None:
-    r = httpx.delete(f"{CORE_API}/profile-investor/{customer_id}", timeout=15.0)
+    r = _http.delete(f"{CORE_API}/profile-investor/{customer_id}", timeout=15.0)
     r.raise_for_status()
 
 
@@ -33,7 +36,7 @@ def save_profile_investor(
         "maxLossPercent": max_loss_percent,
         "horizon": horizon,
     }
-    r = httpx.post(
+    r = _http.post(
         f"{CORE_API}/new-profile-investor/{customer_id}",
         json=body,
         timeout=15.0,
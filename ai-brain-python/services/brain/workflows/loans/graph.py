@@ -1,18 +1,22 @@
 from functools import partial
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
-from services.llms.models import get_bedrock_model_brain
+from services.llms.models import get_bedrock_model_brain, get_bedrock_model_master
+from services.llms.rate_limiter import INTERACTIVE
 from services.brain.workflows.loans.state import LoanState
-from services.brain.workflows.loans.tools import DESTRUCTIVE_TOOLS, DESTRUCTIVE_TOOL_NAMES
+from services.brain.workflows.loans.tools import ALL_TOOLS, DESTRUCTIVE_TOOL_NAMES, READ_TOOLS
 from services.brain.workflows.loans.nodes import load_data_node, agent_node, confirmation_node
+from services.brain.workflows.loans.tiering import HAIKU, SONNET
 
 
 def route_after_agent(state: LoanState) -> str:
     last = state["messages"][-1]
     if not getattr(last, "tool_calls", None):
         return END
-    tool_name = last.tool_calls[0]["name"]
-    return "confirm" if tool_name in DESTRUCTIVE_TOOL_NAMES else "tools"
+    # Basta una destructiva entre varias llamadas para que todo el paso pase por confirmación.
+    if any(tc["name"] in DESTRUCTIVE_TOOL_NAMES for tc in last.tool_calls):
+        return "confirm"
+    return "read_tools"
 
 
 def route_after_confirm(state: LoanState) -> str:
@@ -20,26 +24,36 @@ def route_after_confirm(state: LoanState) -> str:
 
 
 def build_graph(checkpointer):
-    model = get_bedrock_model_brain().bind_tools(DESTRUCTIVE_TOOLS)
+    # Sonnet planea; Haiku redacta resultados de tools y cierres triviales (ver tiering.select_tier).
+    models = {
+        SONNET: get_bedrock_model_brain().bind_tools(ALL_TOOLS),
+        # Todas las tools: Converse rechaza un historial con tool_use de una tool que no está en
+        # el toolConfig (p. ej. un create_new_loan ya confirmado). Si Haiku pide alguna, el paso
+        # lo rehace Sonnet (nodes.agent_node): nunca llega a route_after_agent.
+        HAIKU: get_bedrock_model_master(INTERACTIVE).bind_tools(ALL_TOOLS),
+    }
 
     builder = StateGraph(LoanState)
 
     builder.add_node("load_data", load_data_node)
-    builder.add_node("agent", partial(agent_node, model=model))
+    builder.add_node("agent", partial(agent_node, models=models))
     builder.add_node("confirm", confirmation_node)
-    builder.add_node("tools", ToolNode(DESTRUCTIVE_TOOLS))
+    # Sin confirmación solo se puede leer; las tools del core corren únicamente tras "confirm".
+    builder.add_node("read_tools", ToolNode(READ_TOOLS))
+    builder.add_node("tools", ToolNode(ALL_TOOLS))
 
     builder.add_edge(START, "load_data")
     builder.add_edge("load_data", "agent")
     builder.add_conditional_edges("agent", route_after_agent, {
         "confirm": "confirm",
-        "tools": "tools",
+        "read_tools": "read_tools",
         END: END,
     })
     builder.add_conditional_edges("confirm", route_after_confirm, {
         "tools": "tools",
         END: END,
     })
+    builder.add_edge("read_tools", "agent")
     builder.add_edge("tools", "agent")
 
     return builder.compile(checkpointer=checkpointer)
@@ -53,6 +53,15 @@ def enrich_offer_row(offer: dict) -> dict:
     return d
 
 
+def offer_tool_rate(offer: dict) -> float:
+    """Tasa con la que execute_refinance identifica la fila de oferta (applied_rate)."""
+    for k in ("monthlyRate", "annualNominalRate"):
+        v = offer.get(k)
+        if v is not None:
+            return float(v)
+    return 0.0
+
+
 def enrich_offers_list(offers: list | None) -> List[dict]:
     if not offers:
         return []
@@ -2,13 +2,19 @@ import asyncio
 import logging
 from langchain_core.messages import HumanMessage
 from langgraph.types import Command
+from common import deadletter, idempotency, interrupts, tracing, turns
 from common.redis_config import get_redis, get_checkpointer
+from common.admission import track_llm_turn
+from services.llms import usage
 from common.post_close_kafka import send_reply_set_post_close_if_marker
 from common.kafka_config import (
     get_producer,
     send_chat_response,
     ensure_redis_stream_group,
     xreadgroup_with_recovery,
+    STREAM_CONSUMER,
+    drain_on_sigterm,
+    draining,
 )
 from common.conversation_store import init_db, save_conversation
 from services.brain.workflows.loans.graph import build_graph
@@ -48,24 +54,26 @@ def _interrupts_from_graph_result(result):
 
 
 async def run():
+    tracing.init_tracing("workflow-loans")
     await init_db()
 
     redis = get_redis()
     await ensure_redis_stream_group(redis, "workflow_loans", "loans-group")
     producer = get_producer()
     await producer.start()
+    drain_on_sigterm()
 
     async with get_checkpointer() as checkpointer:
         graph = build_graph(checkpointer)
 
         logger.info("💳 Workflow Préstamos activo en stream:workflow_loans...")
 
-        while True:
+        while not draining():
             results = await xreadgroup_with_recovery(
                 redis,
                 "workflow_loans",
                 "loans-group",
-                "worker-1",
+                STREAM_CONSUMER,
                 count=1,
                 block=1000,
             )
@@ -75,91 +83,150 @@ async def run():
 
             for _, messages in results:
                 for msg_id, data in messages:
-                    customer_id = data[b"customerId"].decode()
-                    contenido = data[b"contenido"].decode()
-                    contexto = data.get(b"contexto", b"").decode()
-
-                    config = {"configurable": {"thread_id": customer_id}}
-
-                    initial_messages = []
-                    if contexto:
-                        initial_messages.append(HumanMessage(content=f"Contexto previo: {contexto}"))
-                    initial_messages.append(HumanMessage(content=contenido))
-
-                    try:
-                        try:
-                            snap = await graph.aget_state(config)
-                            waiting_confirm = bool(snap.interrupts)
-                        except Exception as ex:
-                            logger.debug("[loans] aget_state: %s", ex)
-                            waiting_confirm = False
-
-                        if waiting_confirm:
-                            result = await graph.ainvoke(
-                                Command(resume=contenido), config=config
-                            )
-                        else:
-                            result = await graph.ainvoke(
-                                {
-                                    "messages": initial_messages,
-                                    "customer_id": customer_id,
-                                    "loans": [],
-                                    "refinanceable": [],
-                                    "offers": [],
-                                    "confirmed": False,
-                                },
-                                config=config,
-                            )
+                    with tracing.stream_span("loans.turn", "workflow_loans", msg_id, data):
+                        customer_id = data[b"customerId"].decode()
+                        contenido = data[b"contenido"].decode()
+                        contexto = data.get(b"contexto", b"").decode()
+                        turn_id = data.get(b"turnId", b"").decode()
 
-                        intrs = _interrupts_from_graph_result(result)
-                        state = _state_from_graph_result(result)
+                        if await idempotency.replay(redis, producer, "workflow_loans", msg_id, customer_id):
+                            await deadletter.ack(redis, "workflow_loans", "loans-group", msg_id)
+                            continue
+                        if not await deadletter.admit(redis, "workflow_loans", msg_id, data):
+                            await deadletter.ack(redis, "workflow_loans", "loans-group", msg_id)
+                            continue
 
-                        if intrs:
-                            first = intrs[0]
-                            pregunta = (
-                                first.value
-                                if hasattr(first, "value")
-                                else getattr(first, "value", first)
+                        turn_lease = await turns.lease(redis, customer_id)
+                        if turn_lease is None:
+                            # Otro worker está con un turno de este cliente: vuelve en un rato.
+                            await deadletter.postpone(
+                                redis, "workflow_loans", msg_id, turns.TURN_LEASE_RETRY_S
                             )
-                            await send_reply_set_post_close_if_marker(
-                                redis, producer, customer_id, str(pregunta)
-                            )
-                        elif isinstance(state, dict) and state.get("messages"):
-                            raw = state["messages"][-1].content
-                            text = _text_from_message_content(raw)
-                            await send_reply_set_post_close_if_marker(
-                                redis, producer, customer_id, text
+                            continue
+
+                        async with turn_lease:
+                            config = tracing.graph_config(
+                                {"configurable": {"thread_id": customer_id}}
                             )
+
+                            initial_messages = []
+                            if contexto:
+                                initial_messages.append(HumanMessage(content=f"Contexto previo: {contexto}"))
+                            input_id = turns.input_id("workflow_loans", msg_id)
+                            initial_messages.append(HumanMessage(content=contenido, id=input_id))
+
+                            started_at = None
                             try:
-                                await save_conversation(
-                                    customer_id, "loans", state["messages"]
-                                )
-                            except Exception:
-                                logger.exception(
-                                    "save_conversation (loans) falló; respuesta ya enviada"
+                                # Reintento con el mensaje ya en el hilo: se sigue desde el checkpoint
+                                # (si quedó en la confirmación, se vuelve a preguntar).
+                                resuming = await deadletter.redelivered(
+                                    redis, "workflow_loans", msg_id
+                                ) and await turns.has_input(graph, config, input_id)
+                                waiting_confirm = not resuming and await interrupts.awaiting(
+                                    redis, graph, "loans", config
                                 )
-                        else:
-                            logger.warning(
-                                "[loans] Sin mensaje ni interrupt para %s", customer_id
-                            )
-                            await send_chat_response(
-                                producer,
-                                customer_id,
-                                "No se pudo generar la respuesta de préstamos. Probá de nuevo.",
-                            )
+                                # Una confirmación ejecuta tools del core: no se corta a mitad.
+                                if not await turns.begin(
+                                    redis, customer_id, turn_id, cancellable=not (waiting_confirm or resuming)
+                                ):
+                                    raise turns.TurnCancelled(customer_id)
+                                # Si el worker se cae a mitad del grafo la marca no queda vieja: sin
+                                # marca, el próximo intento relee el checkpoint.
+                                await interrupts.forget(redis, "loans", customer_id)
 
-                    except Exception as e:
-                        logger.exception("[loans] Error procesando %s", customer_id)
-                        try:
-                            await send_chat_response(
-                                producer,
-                                customer_id,
-                                "Tuvimos un error al armar la respuesta de préstamos. Probá de nuevo.",
-                            )
-                        except Exception:
-                            pass
+                                async with idempotency.operation("workflow_loans", msg_id), track_llm_turn(
+                                    redis, f"loans:{msg_id.decode()}"
+                                ), usage.turn(redis, "loans", customer_id):
+                                    if resuming:
+                                        result = await graph.ainvoke(None, config=config)
+                                    elif waiting_confirm:
+                                        result = await graph.ainvoke(
+                                            Command(resume=contenido), config=config
+                                        )
+                                    else:
+                                        started_at = turns.started()
+                                        result = await turns.run_cancellable(
+                                            redis,
+                                            customer_id,
+                                            turn_id,
+                                            graph.ainvoke(
+                                                {
+                                                    "messages": initial_messages,
+                                                    "customer_id": customer_id,
+                                                    "data_ref": "",
+                                                    "confirmed": False,
+                                                },
+                                                config=config,
+                                            ),
+                                        )
+
+                                intrs = _interrupts_from_graph_result(result)
+                                state = _state_from_graph_result(result)
+                                await interrupts.mark(redis, "loans", customer_id, bool(intrs))
+                                if (
+                                    not await turns.finish(redis, customer_id, turn_id)
+                                    and not (waiting_confirm or resuming)
+                                ):
+                                    raise turns.TurnCancelled(customer_id)
+
+                                if intrs:
+                                    first = intrs[0]
+                                    pregunta = (
+                                        first.value
+                                        if hasattr(first, "value")
+                                        else getattr(first, "value", first)
+                                    )
+                                    await idempotency.publish_once(
+                                        redis, producer, "workflow_loans", msg_id, customer_id, str(pregunta)
+                                    )
+                                elif isinstance(state, dict) and state.get("messages"):
+                                    raw = state["messages"][-1].content
+                                    text = _text_from_message_content(raw)
+                                    await idempotency.publish_once(
+                                        redis, producer, "workflow_loans", msg_id, customer_id, text
+                                    )
+                                    try:
+                                        await save_conversation(
+                                            customer_id, "loans", state["messages"]
+                                        )
+                                    except Exception:
+                                        logger.exception(
+                                            "save_conversation (loans) falló; respuesta ya enviada"
+                                        )
+                                else:
+                                    logger.warning(
+                                        "[loans] Sin mensaje ni interrupt para %s", customer_id
+                                    )
+                                    await send_chat_response(
+                                        producer,
+                                        customer_id,
+                                        "No se pudo generar la respuesta de préstamos. Probá de nuevo.",
+                                    )
+
+                            except turns.TurnCancelled:
+                                logger.info("[loans] Turno de %s reemplazado por un mensaje nuevo", customer_id)
+                                await turns.rollback(graph, config, started_at)
+                                # El hilo volvió al checkpoint anterior: la próxima vez se relee el estado.
+                                await interrupts.forget(redis, "loans", customer_id)
+                                await idempotency.mark_done(redis, "workflow_loans", msg_id)
+                            except Exception as e:
+                                logger.exception("[loans] Error procesando %s", customer_id)
+                                # Si le quedan intentos queda pendiente (sin ack) y vuelve con backoff.
+                                await interrupts.forget(redis, "loans", customer_id)
+                                if await deadletter.failed(redis, "workflow_loans", msg_id, data, e):
+                                    continue
+                                try:
+                                    await send_chat_response(
+                                        producer,
+                                        customer_id,
+                                        "Tuvimos un error al armar la respuesta de préstamos. Probá de nuevo.",
+                                    )
+                                except Exception:
+                                    pass
+
+                            await deadletter.ack(redis, "workflow_loans", "loans-group", msg_id)
 
-                    await redis.xack("workflow_loans", "loans-group", msg_id)
+    await producer.stop()
 
 
 async def resume(customer_id: str, respuesta_usuario: str):
@@ -176,6 +243,7 @@ async def resume(customer_id: str, respuesta_usuario: str):
             Command(resume=respuesta_usuario),
             config=config,
         )
+        await interrupts.mark(redis, "loans", customer_id, bool(_interrupts_from_graph_result(result)))
         state = _state_from_graph_result(result)
         raw = state["messages"][-1].content if isinstance(state, dict) else ""
         await send_reply_set_post_close_if_marker(
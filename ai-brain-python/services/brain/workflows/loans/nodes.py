@@ -1,17 +1,20 @@
+import asyncio
 import logging
+import time
 from uuid import UUID
 
 from langchain_core.messages import SystemMessage
 from langgraph.types import interrupt
 from services.brain.workflows.loans.state import LoanState
+from common import refdata
 from services.brain.workflows.loans.tools import (
-    fetch_customer_loans,
-    fetch_refinanceable_loans,
-    fetch_available_offers,
+    load_reference_data,
+    reference_data,
     DESTRUCTIVE_TOOL_NAMES,
 )
 from services.brain.workflows.loans.prompt import SYSTEM_PROMPT_LOANS
-from services.brain.workflows.loans.loan_payload import enrich_loans_list, enrich_offers_list
+from services.brain.workflows.loans.tiering import HAIKU, SONNET, record_tier_call, select_tier
+from services.llms import timeouts
 
 logger = logging.getLogger(__name__)
 
@@ -49,65 +52,70 @@ def _loan_numbers_for_refi_confirmation(loans: list, source_ids: list) -> str:
     return ", ".join(labels[:-1]) + f" y {labels[-1]}"
 
 
-def load_data_node(state: LoanState) -> dict:
+async def load_data_node(state: LoanState) -> dict:
     customer_id = state["customer_id"]
     logger.info(f"[loans] Cargando datos para cliente {customer_id}")
 
-    loans = enrich_loans_list(fetch_customer_loans(customer_id))
-    refinanceable = enrich_loans_list(fetch_refinanceable_loans(customer_id))
-    offers = enrich_offers_list(fetch_available_offers(customer_id))
+    # El cliente HTTP del core es bloqueante: fuera del event loop, como corría el nodo sync.
+    data = await asyncio.to_thread(load_reference_data, customer_id)
+    # En el estado (y en cada checkpoint) queda solo el hash; los datos van a refdata.
+    return {"data_ref": await refdata.put(data)}
 
-    return {
-        "loans": loans,
-        "refinanceable": refinanceable,
-        "offers": offers,
-    }
 
-
-def agent_node(state: LoanState, model) -> dict:
-    prompt = SYSTEM_PROMPT_LOANS.format(
-        customer_id=state["customer_id"],
-        loans=state["loans"],
-        refinanceable=state["refinanceable"],
-        offers=state["offers"],
-    )
+async def agent_node(state: LoanState, models: dict) -> dict:
+    data = await reference_data(state)
+    prompt = SYSTEM_PROMPT_LOANS.format(customer_id=state["customer_id"], **data)
     messages = [SystemMessage(content=prompt)] + state["messages"]
-    response = model.invoke(messages)
+    tier, reason = select_tier(state["messages"])
+    started = time.monotonic()
+    response = await timeouts.turn(models[tier], messages, label=f"loans.agent {tier}")
+    await record_tier_call(tier, reason, started, response)
+    if tier == HAIKU and getattr(response, "tool_calls", None):
+        # Haiku solo redacta: si hace falta otra tool, el paso lo planea Sonnet.
+        started = time.monotonic()
+        response = await timeouts.turn(models[SONNET], messages, label=f"loans.agent {SONNET}")
+        await record_tier_call(SONNET, "escalated", started, response)
     return {"messages": [response]}
 
 
-def confirmation_node(state: LoanState) -> dict:
-    tool_call = state["messages"][-1].tool_calls[0]
+async def _operation_summary(state: LoanState, tool_call: dict) -> str:
     tool_name = tool_call["name"]
     args = tool_call["args"]
 
     if tool_name == "create_new_loan":
-        resumen = (
+        return (
             f"Estás a punto de solicitar un préstamo:\n"
             f"- Monto: ${args['amount']:,.0f}\n"
             f"- Cuotas: {args['quotas']}\n"
-            f"- Tasa: {args['rate']}% TNA\n\n"
-            f"¿Confirmás? (sí / no)"
+            f"- Tasa: {args['rate']}% TNA"
         )
-    elif tool_name == "execute_refinance":
+    if tool_name == "execute_refinance":
         ids = args.get("source_loan_ids") or ([args["loan_id"]] if args.get("loan_id") else [])
         cuotas = args.get("selected_quotas", args.get("new_quotas"))
         monto = float(args.get("offered_amount") or args.get("offeredAmount") or 0)
         tna = args.get("applied_rate", args.get("appliedRate"))
         cash = float(args.get("expected_cash_out") or args.get("expectedCashOut") or 0)
-        ref_label = _loan_numbers_for_refi_confirmation(state.get("loans") or [], ids)
-        resumen = (
+        loans = (await reference_data(state))["loans"]
+        ref_label = _loan_numbers_for_refi_confirmation(loans, ids)
+        return (
             f"Estás a punto de refinanciar: {ref_label}.\n"
             f"- Monto del nuevo préstamo: ${monto:,.0f}\n"
             f"- Cuotas: {cuotas} | TNA: {tna}%\n"
-            f"- Efectivo en mano (estimado): ${cash:,.0f}\n\n"
-            f"¿Confirmás? (sí / no)"
+            f"- Efectivo en mano (estimado): ${cash:,.0f}"
         )
-    else:
-        resumen = f"¿Confirmás la operación {tool_name}? (sí / no)"
+    return f"Estás a punto de ejecutar la operación {tool_name}."
+
+
+async def confirmation_node(state: LoanState) -> dict:
+    # El paso puede traer lecturas junto con la operación: se resume lo que modifica algo.
+    destructive = [
+        tc for tc in state["messages"][-1].tool_calls if tc["name"] in DESTRUCTIVE_TOOL_NAMES
+    ]
+    partes = [await _operation_summary(state, tc) for tc in destructive]
+    resumen = "\n\n".join(partes) + "\n\n¿Confirmás? (sí / no)"
 
     respuesta = interrupt(resumen)
     confirmed = "sí" in respuesta.lower() or "si" in respuesta.lower()
 
-    logger.info(f"[loans] Confirmación de {tool_name}: {confirmed}")
+    logger.info(f"[loans] Confirmación de {', '.join(tc['name'] for tc in destructive)}: {confirmed}")
     return {"confirmed": confirmed}
@@ -0,0 +1,130 @@
+"""
+Optimizador de escenarios de refinancio.
+
+Enumera todos los subconjuntos de préstamos refinanciables contra cada oferta del cliente y
+se queda con los que `execute_refinance` aceptaría (oferta con tope ≥ deuda + efectivo). Para
+cada uno calcula deuda cubierta, efectivo máximo, cuota nueva y ahorro contra lo que queda
+por pagar a la TNA vieja. Al agente le llega una lista corta y ordenada, con los argumentos
+de la tool ya armados, en vez de deducir combinaciones leyendo el JSON.
+
+ahorroTotal = (cuotas que faltan de los préstamos viejos) − (costo total de refinanciar solo
+la deuda en la oferta); no incluye el efectivo en mano, que es plata nueva.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from common import amortization
+from services.brain.workflows.loans.loan_payload import offer_tool_rate
+
+# 2^10 − 1 subconjuntos como máximo; si hay más préstamos entran los de TNA más alta.
+_MAX_LOANS = 10
+TOP_SCENARIOS = 5
+
+
+def _loan_arrays(loans: list[dict]):
+    remaining = np.array([float(l.get("remainingAmount") or 0.0) for l in loans])
+    tna = np.array([float(l.get("tnaAnualPorciento") or 0.0) for l in loans])
+    left = np.array(
+        [max(0, int(l.get("totalQuotas") or 0) - int(l.get("paidQuotas") or 0)) for l in loans]
+    )
+    quota = np.array(
+        [float(l["quotaAmount"]) if l.get("quotaAmount") is not None else np.nan for l in loans]
+    )
+    # Sin cuota informada: la del saldo a la TNA vieja en las cuotas que faltan.
+    missing = np.isnan(quota) & (left > 0)
+    quota[missing] = amortization.installment(remaining[missing], tna[missing], left[missing])
+    quota = np.nan_to_num(quota)
+    return remaining, tna, quota, quota * left
+
+
+def scenarios(
+    refinanceable: list[dict],
+    offers: list[dict],
+    cash_out: float = 0.0,
+    loan_ids: list[str] | None = None,
+    top: int = TOP_SCENARIOS,
+) -> list[dict]:
+    """
+    Escenarios válidos ordenados por ahorroTotal (la mejor oferta de cada combinación de
+    préstamos); se agrega el de mayor alivio en la cuota si no quedó entre los primeros.
+
+    `cash_out`: efectivo en mano pedido (0 = solo consolidar). `loan_ids`: limita la
+    combinación a esos préstamos (por id o loanNumber).
+    """
+    loans = [l for l in refinanceable or [] if l.get("id") and l.get("remainingAmount") is not None]
+    if loan_ids:
+        wanted = {str(x).strip().lower() for x in loan_ids}
+        loans = [
+            l for l in loans
+            if str(l["id"]).lower() in wanted or str(l.get("loanNumber") or "").lower() in wanted
+        ]
+    offers = [o for o in offers or [] if o.get("tnaAnualPorciento") is not None and o.get("maxQuotas")]
+    if not loans or not offers:
+        return []
+    loans = sorted(loans, key=lambda l: -float(l.get("tnaAnualPorciento") or 0.0))[:_MAX_LOANS]
+
+    remaining, old_tna, old_quota, old_cost = _loan_arrays(loans)
+    n_loans = len(loans)
+    # Filas = subconjuntos no vacíos (bitmask), columnas = préstamos.
+    masks = (np.arange(1, 1 << n_loans)[:, None] >> np.arange(n_loans)[None, :]) & 1
+    debt = masks @ remaining
+    subset_quota = masks @ old_quota
+    subset_cost = masks @ old_cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        subset_tna = np.where(debt > 0, (masks @ (remaining * old_tna)) / debt, 0.0)
+
+    tna = np.array([float(o["tnaAnualPorciento"]) for o in offers])
+    quotas = np.array([int(o["maxQuotas"]) for o in offers])
+    caps = np.array([float(o.get("maxAmount") or 0.0) for o in offers])
+
+    cash = max(0.0, float(cash_out or 0.0))
+    amount = debt + cash
+    # Ejes: subconjunto × oferta.
+    new_quota = amortization.installment(amount[:, None], tna[None, :], quotas[None, :])
+    debt_cost = amortization.installment(debt[:, None], tna[None, :], quotas[None, :]) * quotas[None, :]
+    saving_total = subset_cost[:, None] - debt_cost
+    saving_month = subset_quota[:, None] - new_quota
+    valid = (debt[:, None] > 0) & (amount[:, None] <= caps[None, :] + 0.01)
+    if not valid.any():
+        return []
+
+    score = np.where(valid, saving_total, -np.inf)
+    best_offer = score.argmax(axis=1)
+    rows = np.nonzero(valid.any(axis=1))[0]
+    ranked = sorted(rows, key=lambda s: -score[s, best_offer[s]])
+    picked = [(int(s), int(best_offer[s])) for s in ranked[:top]]
+    relief = np.unravel_index(np.where(valid, saving_month, -np.inf).argmax(), valid.shape)
+    relief = (int(relief[0]), int(relief[1]))
+    if relief not in picked:
+        picked.append(relief)
+
+    out = []
+    for s, o in picked:
+        chosen = [loans[k] for k in np.nonzero(masks[s])[0]]
+        offer_amount = round(float(amount[s]), 2)
+        out.append(
+            {
+                "prestamos": [l.get("loanNumber") or "préstamo" for l in chosen],
+                "deuda": round(float(debt[s]), 2),
+                "tnaVieja": round(float(subset_tna[s]), 2),
+                "cuotaVieja": round(float(subset_quota[s]), 2),
+                "tna": float(tna[o]),
+                "cuotas": int(quotas[o]),
+                "maxAmount": float(caps[o]),
+                "efectivoMaximo": round(float(caps[o] - debt[s]), 2),
+                "cuotaNueva": round(float(new_quota[s, o]), 2),
+                "costoTotalNuevo": round(float(new_quota[s, o] * quotas[o]), 2),
+                "ahorroMensual": round(float(saving_month[s, o]), 2),
+                "ahorroTotal": round(float(saving_total[s, o]), 2),
+                # Argumentos listos para execute_refinance (ya validados contra la oferta).
+                "tool_args": {
+                    "source_loan_ids": [str(l["id"]) for l in chosen],
+                    "offered_amount": offer_amount,
+                    "selected_quotas": int(quotas[o]),
+                    "applied_rate": offer_tool_rate(offers[o]),
+                    "expected_cash_out": round(cash, 2),
+                },
+            }
+        )
+    return out
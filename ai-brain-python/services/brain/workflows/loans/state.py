@@ -6,7 +6,7 @@ from langchain_core.messages import BaseMessage
 class LoanState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
     customer_id: str
-    loans: list
-    refinanceable: list
-    offers: list
+    # Hash en refdata del paquete loans/refinanceable/offers/simulations/refinance_scenarios
+    # (tools.load_reference_data): el checkpoint no carga las listas.
+    data_ref: str
     confirmed: bool
@@ -0,0 +1,133 @@
+"""
+Selección de modelo por paso del agente de préstamos.
+
+Regla (en orden):
+1. Último mensaje = resultado de tool con error (`ok: false`) → Sonnet: hay que replanear.
+2. Último mensaje = resultado de tool OK → Haiku: solo redactar lo que devolvió el backend.
+3. Mensaje del usuario que es solo agradecimiento / despedida ("ok gracias", "chau") → Haiku.
+4. Todo lo demás (planear refinancio, préstamo nuevo, simulaciones, confirmaciones) → Sonnet.
+
+Haiku solo redacta: tiene atadas todas las tools (el historial puede traer tool_use de
+cualquiera) pero, si pide una, el paso se descarta y lo vuelve a hacer Sonnet (motivo
+"escalated", ver nodes.agent_node).
+
+Cada llamada registra tier, motivo, latencia, tokens y costo estimado; el acumulado va a
+Redis junto al de services.llms.usage (día UTC, mismo TTL):
+- llm_usage:{día}:loans_tier:{tier}   HASH calls, latency_ms, input_tokens, output_tokens
+- llm_usage:{día}:loans_tier_reasons  HASH "{tier}|{motivo}" → llamadas
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from common.redis_config import get_redis
+from services.llms.usage import LLM_USAGE_TTL_DAYS, PRICING
+
+logger = logging.getLogger(__name__)
+
+HAIKU = "haiku"
+SONNET = "sonnet"
+
+LOANS_MODEL_TIERING = os.getenv("LOANS_MODEL_TIERING", "1") == "1"
+
+# "ok gracias", "listo, muchas gracias!", "chau", "buenísimo gracias"… sin pedir nada nuevo.
+_ACK_ONLY = re.compile(
+    r"^(ok(a|ey)?|dale|listo|perfecto|genial|b(u|ú)en(i|í)simo|joya|b(a|á)rbaro|bueno|"
+    r"muchas|mil|graciass*|chau|chao|nos vemos|saludos|eso es todo|nada m(a|á)s|"
+    r"de nada|un saludo|[\s,.!¡¿?👍🙏])+$",
+    re.I,
+)
+_THANKS_OR_BYE = re.compile(r"gracias|chau|chao|nos vemos|saludos|eso es todo|nada m(a|á)s", re.I)
+_TOOL_ERROR = re.compile(r"['\"]ok['\"]\s*:\s*false|['\"]error['\"]\s*:", re.I)
+
+_redis = None
+
+
+def _stats_redis():
+    global _redis
+    if _redis is None:
+        _redis = get_redis()
+    return _redis
+
+
+def _base(day: str | None = None) -> str:
+    return f"llm_usage:{day or datetime.now(timezone.utc).strftime('%Y%m%d')}"
+
+
+def select_tier(messages: list) -> tuple[str, str]:
+    """Retorna (tier, motivo) para el próximo paso del agente."""
+    if not LOANS_MODEL_TIERING or not messages:
+        return SONNET, "default"
+    last = messages[-1]
+    if isinstance(last, ToolMessage):
+        if _TOOL_ERROR.search(str(last.content)):
+            return SONNET, "tool_error"
+        return HAIKU, "tool_writeup"
+    if isinstance(last, HumanMessage):
+        text = str(last.content or "").strip()
+        if len(text) <= 60 and _ACK_ONLY.match(text) and _THANKS_OR_BYE.search(text):
+            return HAIKU, "ack"
+    return SONNET, "planning"
+
+
+def estimate_cost(tier: str, usage: dict | None) -> float:
+    usage = usage or {}
+    price_in, price_out = PRICING.get(tier, PRICING[SONNET])
+    return (
+        int(usage.get("input_tokens") or 0) * price_in
+        + int(usage.get("output_tokens") or 0) * price_out
+    ) / 1_000_000
+
+
+async def record_tier_call(tier: str, reason: str, started: float, response) -> None:
+    latency = time.monotonic() - started
+    usage = getattr(response, "usage_metadata", None) or {}
+    cost = estimate_cost(tier, usage)
+    base = _base()
+    tier_key, reasons_key = f"{base}:loans_tier:{tier}", f"{base}:loans_tier_reasons"
+    try:
+        pipe = _stats_redis().pipeline(transaction=False)
+        pipe.hincrby(tier_key, "calls", 1)
+        pipe.hincrby(tier_key, "latency_ms", int(latency * 1000))
+        pipe.hincrby(tier_key, "input_tokens", int(usage.get("input_tokens") or 0))
+        pipe.hincrby(tier_key, "output_tokens", int(usage.get("output_tokens") or 0))
+        pipe.hincrby(reasons_key, f"{tier}|{reason}", 1)
+        for key in (tier_key, reasons_key):
+            pipe.expire(key, LLM_USAGE_TTL_DAYS * 86400)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning("[loans-tier] no se pudo registrar la llamada: %s", e)
+    logger.info(
+        "[loans-tier] tier=%s reason=%s latency=%.2fs in=%s out=%s cost=$%.5f",
+        tier,
+        reason,
+        latency,
+        usage.get("input_tokens"),
+        usage.get("output_tokens"),
+        cost,
+    )
+
+
+async def tier_stats(redis, day: str | None = None) -> dict:
+    """Acumulado del día por tier (todos los workers), con latencia media, costo y motivos."""
+    base = _base(day)
+    reasons = {k.decode(): int(v) for k, v in (await redis.hgetall(f"{base}:loans_tier_reasons")).items()}
+    out = {}
+    for tier in (SONNET, HAIKU):
+        s = {k.decode(): int(v) for k, v in (await redis.hgetall(f"{base}:loans_tier:{tier}")).items()}
+        if not s:
+            continue
+        calls = s.get("calls") or 1
+        out[tier] = {
+            **s,
+            "avg_latency_s": s.get("latency_ms", 0) / 1000 / calls,
+            "cost_usd": estimate_cost(tier, s),
+            "reasons": {r.split("|", 1)[1]: n for r, n in reasons.items() if r.startswith(f"{tier}|")},
+        }
+    return out
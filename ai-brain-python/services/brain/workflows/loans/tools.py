@@ -1,10 +1,22 @@
-import httpx
+import asyncio
 import os
+from typing import Annotated
 from uuid import UUID
 from langchain_core.tools import tool
+from langgraph.prebuilt import InjectedState
+from common import amortization, idempotency, refdata, tracing
+from services.brain.workflows.loans import refinance_optimizer
+from services.brain.workflows.loans.loan_payload import (
+    enrich_loans_list,
+    enrich_offers_list,
+    offer_tool_rate,
+)
 
 CORE_API = os.getenv("CORE_API_URL", "http://localhost:8080/api/v1/bank-ia")
 
+# Cliente compartido: reutiliza conexiones al core y abre un span por request.
+_http = tracing.http_client()
+
 
 def _norm_uuid(s: str) -> str:
     try:
@@ -13,21 +25,13 @@ def _norm_uuid(s: str) -> str:
         return str(s).strip().lower()
 
 
-def _tna_of_offer(offer: dict) -> float:
-    for k in ("monthlyRate", "annualNominalRate"):
-        v = offer.get(k)
-        if v is not None:
-            return float(v)
-    return 0.0
-
-
 def _find_offer_row(
     offers: list, selected_quotas: int, applied_rate: float
 ) -> dict | None:
     for o in offers or []:
         if int(o.get("maxQuotas", -1)) != int(selected_quotas):
             continue
-        tna = _tna_of_offer(o)
+        tna = offer_tool_rate(o)
         if abs(tna - float(applied_rate)) < 0.15:
             return o
     return None
@@ -35,26 +39,122 @@ def _find_offer_row(
 
 # Funciones de lectura - llamadas directamente por nodo_cargar_datos
 def fetch_customer_loans(customer_id: str) -> list:
-    response = httpx.get(f"{CORE_API}/loans/{customer_id}")
+    response = _http.get(f"{CORE_API}/loans/{customer_id}")
     return response.json()
 
 
 def fetch_refinanceable_loans(customer_id: str) -> list:
-    response = httpx.get(f"{CORE_API}/loans/{customer_id}/to-cancel")
+    response = _http.get(f"{CORE_API}/loans/{customer_id}/to-cancel")
     return response.json()
 
 
 def fetch_available_offers(customer_id: str) -> list:
-    response = httpx.get(f"{CORE_API}/{customer_id}/available-offer")
+    response = _http.get(f"{CORE_API}/{customer_id}/available-offer")
     return response.json()
 
 
+def load_reference_data(customer_id: str) -> dict:
+    """Préstamos, ofertas y tablas precalculadas del cliente (va a refdata, no al checkpoint)."""
+    loans = enrich_loans_list(fetch_customer_loans(customer_id))
+    refinanceable = enrich_loans_list(fetch_refinanceable_loans(customer_id))
+    offers = enrich_offers_list(fetch_available_offers(customer_id))
+    return {
+        "loans": loans,
+        "refinanceable": refinanceable,
+        "offers": offers,
+        "simulations": amortization.precompute(offers, refinanceable),
+        "refinance_scenarios": refinance_optimizer.scenarios(refinanceable, offers),
+    }
+
+
+async def reference_data(state: dict) -> dict:
+    data = await refdata.get(state.get("data_ref") or "")
+    if data is None:
+        # Hilo anterior al side store o clave vencida: se vuelve a pedir al core.
+        data = await asyncio.to_thread(load_reference_data, state["customer_id"])
+    return data
+
+
+# Tope de filas que vuelven al LLM por simulación (cada fila son tokens de entrada).
+_MAX_SIMULATION_ROWS = 40
+
+
+# Tools de solo cálculo - no tocan el core, no piden confirmación
+@tool
+async def simulate_installments(
+    amounts: list[float],
+    state: Annotated[dict, InjectedState],
+    quotas: list[int] | None = None,
+    rates: list[float] | None = None,
+    include_schedule: bool = False,
+) -> dict:
+    """Simula cuotas exactas (sistema francés, TNA anual). No opera nada: usala en vez de calcular a mano.
+
+    - amounts: capitales a simular (ej. [500000, 1620000]).
+    - quotas: cantidades de cuotas; sin valor se usa el plazo de cada oferta del cliente.
+    - rates: TNA anuales (%) a simular en lugar de las ofertas (ej. la TNA de un préstamo actual); requiere quotas.
+    - include_schedule: cronograma cuota a cuota (interés, amortización, saldo); solo con un monto y una combinación.
+    """
+    if rates:
+        if not quotas:
+            return {"ok": False, "error": "faltan_cuotas", "message": "Con rates hay que indicar quotas."}
+        offers = [{"tnaAnualPorciento": r, "maxQuotas": max(quotas)} for r in rates]
+    else:
+        offers = (await reference_data(state))["offers"]
+    rows = amortization.simulate_offers(offers, amounts, quotas)
+    if not rows:
+        return {
+            "ok": False,
+            "error": "sin_combinaciones",
+            "message": "Ninguna oferta admite esos montos/cuotas (revisá maxAmount y maxQuotas).",
+        }
+    result = {"ok": True, "simulaciones": rows[:_MAX_SIMULATION_ROWS]}
+    if len(rows) > _MAX_SIMULATION_ROWS:
+        result["omitidas"] = len(rows) - _MAX_SIMULATION_ROWS
+    if include_schedule and len(rows) == 1:
+        row = rows[0]
+        result["cronograma"] = amortization.schedule(row["monto"], row["tna"], row["cuotas"])
+    return result
+
+
+@tool
+async def plan_refinance(
+    state: Annotated[dict, InjectedState],
+    cash_out: float = 0.0,
+    loans: list[str] | None = None,
+) -> dict:
+    """Arma escenarios de refinancio válidos (tope, cuotas y TNA ya verificados). No opera nada.
+
+    - cash_out: efectivo en mano que pide el cliente (0 = solo consolidar deuda).
+    - loans: limitar a esos préstamos (loanNumber o id); sin valor prueba todas las combinaciones.
+    Cada escenario trae `tool_args` para pasar tal cual a execute_refinance.
+    """
+    data = await reference_data(state)
+    found = refinance_optimizer.scenarios(
+        data["refinanceable"], data["offers"], cash_out=cash_out, loan_ids=loans
+    )
+    if not found:
+        return {
+            "ok": False,
+            "error": "sin_escenario",
+            "message": (
+                "Ninguna oferta cubre esa deuda más ese efectivo. Probá con menos efectivo en mano "
+                "o con menos préstamos."
+            ),
+        }
+    return {"ok": True, "escenarios": found}
+
+
 # Tools destructivas - el LLM las llama con confirmación previa
 @tool
 def create_new_loan(customer_id: str, amount: float, quotas: int, rate: float) -> dict:
     """Crea un nuevo préstamo para el cliente con el monto, cuotas y tasa indicados."""
+    args = {"customer_id": customer_id, "amount": amount, "quotas": quotas, "rate": rate}
+    done = idempotency.tool_result("create_new_loan", args)
+    if done is not None:
+        return done
     try:
-        response = httpx.post(
+        response = _http.post(
             f"{CORE_API}/new-loan/{customer_id}",
             json={"amount": amount, "quotas": quotas, "rate": rate},
             timeout=60.0,
@@ -72,13 +172,16 @@ def create_new_loan(customer_id: str, amount: float, quotas: int, rate: float) -
         }
     if isinstance(body, dict) and body.get("success") and body.get("data") is not None:
         d = body["data"]
-        return {
+        result = {
             "ok": True,
             "amount": d.get("amount") or d.get("totalAmount"),
             "quotas": d.get("quotas") or d.get("totalQuotas"),
             "rate": d.get("rate"),
         }
-    return {"ok": True, "raw": body}
+    else:
+        result = {"ok": True, "raw": body}
+    idempotency.record_tool("create_new_loan", args, result)
+    return result
 
 
 def _new_loan_error_message(body, response) -> str:
@@ -108,6 +211,17 @@ def execute_refinance(
     - selected_quotas / applied_rate: deben coincidir con una oferta (maxQuotas y TNA de esa oferta).
     - expected_cash_out: ≈ offered_amount − suma de saldos; el backend aplica el monto ofrecido validado.
     """
+    args = {
+        "customer_id": customer_id,
+        "source_loan_ids": source_loan_ids,
+        "offered_amount": offered_amount,
+        "selected_quotas": selected_quotas,
+        "applied_rate": applied_rate,
+        "expected_cash_out": expected_cash_out,
+    }
+    done = idempotency.tool_result("execute_refinance", args)
+    if done is not None:
+        return done
     offers = fetch_available_offers(customer_id)
     row = _find_offer_row(offers, selected_quotas, applied_rate)
     if not row:
@@ -130,7 +244,7 @@ def execute_refinance(
                 "Elegí otra oferta con mayor tope, o bajá monto/efectivo en mano."
             ),
             "maxAmount": max_amt,
-            "tna": _tna_of_offer(row),
+            "tna": offer_tool_rate(row),
         }
 
     loans = fetch_customer_loans(customer_id)
@@ -157,7 +271,11 @@ def execute_refinance(
         "appliedRate": applied_rate,
         "expectedCashOut": expected_cash_out,
     }
-    r = httpx.post(f"{CORE_API}/refinance", json=payload, timeout=60.0)
+    r = _http.post(
+        f"{CORE_API}/refinance",
+        json=payload,
+        timeout=60.0,
+    )
     try:
         body = r.json()
     except Exception:
@@ -166,7 +284,7 @@ def execute_refinance(
         return {"ok": False, "status_code": r.status_code, "detail": body}
     if isinstance(body, dict) and body.get("success") and isinstance(body.get("data"), dict):
         d = body["data"]
-        return {
+        result = {
             "ok": True,
             "mensaje": d.get("message", ""),
             "nuevo_prestamo_numero": d.get("newLoanNumber"),
@@ -174,8 +292,13 @@ def execute_refinance(
             "efectivo_acreditado": d.get("cashOut"),
             "tna_aplicada_porciento": d.get("appliedNominalAnnualRate"),
         }
-    return body
+    else:
+        result = body
+    idempotency.record_tool("execute_refinance", args, result)
+    return result
 
 
 DESTRUCTIVE_TOOLS = [create_new_loan, execute_refinance]
 DESTRUCTIVE_TOOL_NAMES = {t.name for t in DESTRUCTIVE_TOOLS}
+READ_TOOLS = [simulate_installments, plan_refinance]
+ALL_TOOLS = READ_TOOLS + DESTRUCTIVE_TOOLS
@@ -1,10 +1,13 @@
 import asyncio
 import logging
 
-from common.kafka_config import get_consumer, get_producer, send_chat_response
+from common import admission, idempotency, quiz_engine, tracing, turns, wire
+from common.coalesce import Coalescer, merge_fragments
+from common.kafka_config import OffsetTracker, get_consumer, get_producer, send_chat_response
 from common.redis_config import get_redis
 from services.classifier.logic import get_classification
 from services.classifier.post_close_logic import get_post_close_route
+from services.llms import usage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,56 +16,194 @@ POST_CLOSE_FAREWELL = (
     "Dale, cuando quieras. ¡Gracias por charlar y que tengas un buen día!"
 )
 
+# Cada cuánto se intenta reinyectar trabajo diferido por el control de admisión (seg).
+_DRAIN_INTERVAL_S = 1.0
+
+
+async def _drain_deferred_loop(redis, producer):
+    async def on_expired(customer_id: str) -> None:
+        await send_chat_response(producer, customer_id, admission.BUSY_REPLY)
+
+    while True:
+        try:
+            moved = await admission.drain_deferred(redis, on_expired)
+            if moved:
+                logger.info("⏳ Diferidos reinyectados: %s", moved)
+        except Exception:
+            logger.exception("Error reinyectando diferidos")
+        await asyncio.sleep(_DRAIN_INTERVAL_S)
+
+
+async def _exempt_from_quota(redis, customer_id: str) -> bool:
+    """Respuestas del test y la respuesta al cierre: siguen un turno ya abierto, no gastan cuota."""
+    if not customer_id:
+        return False
+    return bool(await redis.exists(f"post_close:{customer_id}", quiz_engine.state_key(customer_id)))
+
+
+async def _route(redis, producer, data: dict, span) -> None:
+    """Rutea un turno (uno o varios fragmentos ya agrupados) a su stream."""
+    customer_id = data.get("customerId")
+    content = data.get("contenido")
+
+    # Test de idoneidad en curso: se contesta desde acá sin pasar por los grafos.
+    with tracing.span("quiz.answer"):
+        step = await quiz_engine.answer(redis, customer_id, content or "")
+    if step is not None and step.action == quiz_engine.ASK:
+        span.set(**{"customer.id": customer_id, "route.stream": "quiz"})
+        await send_chat_response(producer, customer_id, step.reply)
+        return
+    if step is not None and step.action == quiz_engine.DONE:
+        span.set(**{"customer.id": customer_id, "route.stream": "workflow_investment"})
+        fields = tracing.inject_fields(
+            {
+                **wire.encode_fields(data),
+                "quizAnswers": "".join(step.answers),
+                "quizOffset": str(step.offset),
+            }
+        )
+        if await admission.admit(redis, "workflow_investment") != admission.ADMIT:
+            await send_chat_response(producer, customer_id, admission.BUSY_REPLY)
+            return
+        await redis.xadd("workflow_investment", fields)
+        await quiz_engine.clear(redis, customer_id)
+        logger.info("📤 %s completó el test → workflow_investment", customer_id)
+        return
+
+    session_key = f"session:{customer_id}"
+    post_close_key = f"post_close:{customer_id}"
+
+    if await redis.get(post_close_key):
+        async with usage.turn(redis, "classifier", customer_id, node="post_close_router"):
+            action = await get_post_close_route(content or "")
+        await redis.delete(post_close_key)
+        if action == "close":
+            await redis.delete(session_key)
+            await redis.delete(f"brain_workflow:{customer_id}")
+            await send_chat_response(producer, customer_id, POST_CLOSE_FAREWELL)
+            logger.info("📤 post_close → CERRAR %s (sin reenvío)", customer_id)
+            return
+        await redis.delete(session_key)
+        await redis.delete(f"brain_workflow:{customer_id}")
+        logger.info("📤 post_close → NUEVO tema %s (reclasificando)", customer_id)
+
+    cached = await redis.get(session_key)
+
+    if cached:
+        target_stream = cached.decode()
+        logger.info("📥 De: %s -> sesión: %s", customer_id, target_stream)
+    else:
+        with tracing.span("llm.route classifier", kind="client"):
+            async with usage.turn(redis, "classifier", customer_id, node="router"):
+                target_stream = await get_classification(content)
+        if target_stream == "to-brain":
+            await redis.delete(f"brain_workflow:{customer_id}")
+        await redis.set(session_key, target_stream, ex=1800)
+        # El master puede contestar FAQs desde caché solo al arrancar una sesión.
+        data = {**data, "newSession": "1"}
+        logger.info("📥 De: %s -> Haiku: %s", customer_id, target_stream)
+
+    span.set(**{"customer.id": customer_id, "route.stream": target_stream})
+    # turnId viaja hasta el worker, que lo usa para saber si el turno fue reemplazado.
+    turn_id = turns.new_turn_id()
+    fields = tracing.inject_fields(
+        {**wire.encode_fields(data), "turnId": turn_id}
+    )
+    decision = await admission.admit(redis, target_stream)
+    # El turno se registra solo si va a correr: uno rechazado no tiene que volver pegado
+    # al próximo mensaje del cliente (turns.cancel).
+    if decision in (admission.ADMIT, admission.DEFER):
+        await turns.queued(redis, customer_id, turn_id, content or "")
+    if decision == admission.DEFER:
+        if await admission.defer(redis, target_stream, fields):
+            logger.info("⏳ %s diferido (%s con backlog alto)", customer_id, target_stream)
+            return
+        await turns.discard(redis, customer_id, turn_id)
+    if decision != admission.ADMIT:
+        await send_chat_response(producer, customer_id, admission.BUSY_REPLY)
+        logger.info("🚦 %s rechazado: %s saturado", customer_id, target_stream)
+        return
+    await redis.xadd(target_stream, fields)
+
 
 async def run_classifier():
-    consumer = get_consumer("chat-queries", "classifier-group")
+    tracing.init_tracing("classifier")
+    # Sin auto-commit: el offset avanza recién cuando el turno salió de la ventana de agrupamiento.
+    consumer = get_consumer("chat-queries", "classifier-group", auto_commit=False)
+    offsets = OffsetTracker(consumer)
     redis = get_redis()
     producer = get_producer()
     await consumer.start()
     await producer.start()
 
     logger.info("🚀 Clasificador Moustro (Haiku) + post-cierre en chat-queries...")
+    drainer = asyncio.create_task(_drain_deferred_loop(redis, producer))
+
+    async def settle(records: list) -> None:
+        """Libera los records (ingress_id, token de offset) y commitea lo que se pueda."""
+        for _, token in records:
+            offsets.release(token)
+        await offsets.commit()
+
+    async def flush(customer_id: str, fragments: list[dict], records: list) -> None:
+        try:
+            # El timer se crea dentro del span de ingreso del último fragmento: cuelga de ahí.
+            with tracing.span("classifier.route", kind="consumer") as span:
+                span.set(**{"coalesce.fragments": len(fragments)})
+                await _route(redis, producer, merge_fragments(fragments), span)
+            for ingress_id, _ in records:
+                await idempotency.mark_done(redis, "chat-queries", ingress_id)
+        finally:
+            # Un turno que falló al rutear no se reintenta (como con auto-commit).
+            await settle(records)
+
+    coalescer = Coalescer(flush)
 
     try:
         async for msg in consumer:
-            data = msg.value
-            customer_id = data.get("customerId")
-            content = data.get("contenido")
-
-            session_key = f"session:{customer_id}"
-            post_close_key = f"post_close:{customer_id}"
-
-            if await redis.get(post_close_key):
-                action = get_post_close_route(content or "")
-                await redis.delete(post_close_key)
-                if action == "close":
-                    await redis.delete(session_key)
-                    await redis.delete(f"brain_workflow:{customer_id}")
-                    await send_chat_response(producer, customer_id, POST_CLOSE_FAREWELL)
-                    logger.info("📤 post_close → CERRAR %s (sin reenvío)", customer_id)
-                    continue
-                await redis.delete(session_key)
-                await redis.delete(f"brain_workflow:{customer_id}")
-                logger.info("📤 post_close → NUEVO tema %s (reclasificando)", customer_id)
+            parent = tracing.traceparent_from_kafka(msg)
+            tracing.record_queue_wait(
+                "queue.wait chat-queries",
+                msg.timestamp,
+                parent=parent,
+                **{"messaging.destination": "chat-queries"},
+            )
+            # Redelivery de Kafka (rebalanceo o caída antes del commit): no se rutea dos veces.
+            ingress_id = idempotency.kafka_id(msg)
+            record = (ingress_id, offsets.track(msg))
+            if await idempotency.lookup(redis, "chat-queries", ingress_id):
+                logger.info("♻️ chat-queries %s ya procesado, se omite", ingress_id)
+                await settle([record])
+                continue
+            with tracing.span("classifier.ingest", parent=parent, kind="consumer"):
+                data = msg.value
+                customer_id = data.get("customerId")
 
-            cached = await redis.get(session_key)
-
-            if cached:
-                target_stream = cached.decode()
-                logger.info("📥 De: %s -> sesión: %s", customer_id, target_stream)
-            else:
-                target_stream = get_classification(content)
-                if target_stream == "to-brain":
-                    await redis.delete(f"brain_workflow:{customer_id}")
-                await redis.set(session_key, target_stream, ex=1800)
-                logger.info("📥 De: %s -> Haiku: %s", customer_id, target_stream)
+                if not await _exempt_from_quota(redis, customer_id) and not await admission.take_quota(
+                    redis, customer_id
+                ):
+                    if await admission.quota_notice(redis, customer_id):
+                        await send_chat_response(producer, customer_id, admission.QUOTA_REPLY)
+                    logger.info("🚦 %s sin cuota (token bucket)", customer_id)
+                    await idempotency.mark_done(redis, "chat-queries", ingress_id)
+                    await settle([record])
+                    continue
 
-            fields = {k: str(v) if v is not None else "" for k, v in data.items()}
-            await redis.xadd(target_stream, fields)
+                # Si había una respuesta en curso para este cliente se cancela y su texto
+                # se agrupa con el fragmento nuevo. El record queda en vuelo hasta el flush.
+                previous = await turns.cancel(redis, customer_id)
+                await coalescer.add(
+                    customer_id,
+                    data,
+                    prepend={**data, "contenido": previous} if previous else None,
+                    token=record,
+                )
 
     except Exception as e:
         logger.error("Error en el loop del clasificador: %s", e)
     finally:
+        await coalescer.close()
+        drainer.cancel()
         await consumer.stop()
         await producer.stop()
         await redis.aclose()
@@ -1,6 +1,7 @@
 import logging
 import re
 
+from services.llms import timeouts
 from services.llms.models import get_bedrock_model_master
 
 model = get_bedrock_model_master()
@@ -21,13 +22,16 @@ Mensaje del usuario:
 {message}"""
 
 
-def get_post_close_route(message_content: str) -> str:
+async def get_post_close_route(message_content: str) -> str:
     """
     Retorna "close" | "reclassify".
     Se prefiere reclassify ante dudas para no dejar al usuario sin respuesta.
     """
     try:
-        raw = (model.invoke(PROMPT.format(message=message_content)).content or "").strip()
+        response = await timeouts.route(
+            model, PROMPT.format(message=message_content), label="post_close_router"
+        )
+        raw = (response.content or "").strip()
     except Exception as e:
         logger.error("post_close router: %s", e)
         return "reclassify"
@@ -0,0 +1,213 @@
+"""
+Backend falso de chat model con latencia inyectada (pruebas de hedging, carga y replay).
+
+Se activa en services.llms.models con LLM_BACKEND=fake; también se puede instanciar a mano.
+Respeta la interfaz de LangChain (invoke/ainvoke/bind_tools, callbacks y usage_metadata).
+
+`ScriptedResponder` decide la respuesta con reglas JSON (las comparte bench/fake_bedrock.py):
+
+    [{"name": "clasificador", "prompt": "to-master o to-brain", "user": "préstamo", "reply": "to-brain"},
+     {"prompt": "Datos reales", "last_role": "user", "user": "préstamo nuevo",
+      "tool_call": {"name": "create_new_loan",
+                    "args": {"customer_id": "{customer_id}", "amount": 100000, "quotas": 12, "rate": 80}}}]
+
+Campos: `prompt` (regex sobre todo el texto), `user` (regex sobre el último turno del usuario),
+`last_role` ("user" | "tool"), `tools` (regex que debe matchear alguna tool disponible),
+`reply` y/o `tool_call`, `latency_s` (pisa la latencia del backend). Gana la primera que matchea.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+
+class FakeThrottlingError(Exception):
+    """Imita el ClientError de botocore con código ThrottlingException."""
+
+    def __init__(self, message: str = "ThrottlingException: Too many requests (fake)"):
+        super().__init__(message)
+        self.response = {"Error": {"Code": "ThrottlingException", "Message": message}}
+
+
+_CUSTOMER_ID = re.compile(r"customer_?id[\"']?\s*[:=]\s*[\"']?([\w@.-]+)", re.I)
+# En los prompts de ruteo el mensaje del usuario va al final: se compara solo la cola.
+_USER_TAIL_CHARS = 400
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(
+            b if isinstance(b, str) else str(b.get("text", "")) for b in content if isinstance(b, (str, dict))
+        )
+    return str(content)
+
+
+def _tool_name(tool) -> str:
+    if isinstance(tool, dict):
+        return tool.get("name") or (tool.get("function") or {}).get("name") or (
+            tool.get("toolSpec") or {}
+        ).get("name", "")
+    return getattr(tool, "name", "") or getattr(tool, "__name__", "")
+
+
+def _fill(value, customer_id: str):
+    if isinstance(value, str):
+        return value.replace("{customer_id}", customer_id)
+    if isinstance(value, dict):
+        return {k: _fill(v, customer_id) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, customer_id) for v in value]
+    return value
+
+
+class ScriptedResponder:
+    """Reglas en orden; sin match responde `default`."""
+
+    def __init__(self, rules: list[dict], default: str = "ok"):
+        self.default = default
+        self._rules = []
+        for rule in rules:
+            compiled = dict(rule)
+            for key in ("prompt", "user", "tools"):
+                if rule.get(key):
+                    compiled[key] = re.compile(rule[key], re.I | re.S)
+            self._rules.append(compiled)
+
+    @classmethod
+    def from_file(cls, path: str) -> "ScriptedResponder":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            return cls(data.get("rules", []), data.get("default", "ok"))
+        return cls(data)
+
+    def respond(self, system: str, turns: list[tuple[str, str]], tool_names: list[str]) -> dict:
+        """turns: [(rol, texto)] con rol user | assistant | tool. Retorna {text, tool_call, latency_s}."""
+        full = system + "\n" + "\n".join(t for _, t in turns)
+        last_role = turns[-1][0] if turns else "user"
+        user = next((t for r, t in reversed(turns) if r == "user"), "")[-_USER_TAIL_CHARS:]
+        m = _CUSTOMER_ID.search(full)
+        customer_id = m.group(1) if m else ""
+        for rule in self._rules:
+            if rule.get("prompt") and not rule["prompt"].search(full):
+                continue
+            if rule.get("user") and not rule["user"].search(user):
+                continue
+            if rule.get("last_role") and rule["last_role"] != last_role:
+                continue
+            if rule.get("tools") and not any(rule["tools"].search(n) for n in tool_names):
+                continue
+            return {
+                "text": _fill(rule.get("reply", ""), customer_id),
+                "tool_call": _fill(rule.get("tool_call"), customer_id),
+                "latency_s": rule.get("latency_s"),
+            }
+        return {"text": self.default, "tool_call": None, "latency_s": None}
+
+    def __call__(self, messages: list[BaseMessage], tools) -> AIMessage:
+        system, turns = "", []
+        for m in messages:
+            if isinstance(m, SystemMessage):
+                system += _text(m.content)
+            elif isinstance(m, ToolMessage):
+                turns.append(("tool", _text(m.content)))
+            elif isinstance(m, HumanMessage):
+                turns.append(("user", _text(m.content)))
+            else:
+                turns.append(("assistant", _text(m.content)))
+        out = self.respond(system, turns, [_tool_name(t) for t in tools or []])
+        tool_calls = []
+        if out["tool_call"]:
+            tool_calls.append(
+                {
+                    "name": out["tool_call"]["name"],
+                    "args": out["tool_call"].get("args", {}),
+                    "id": f"tooluse_{uuid.uuid4().hex[:16]}",
+                    "type": "tool_call",
+                }
+            )
+        meta = {"fake_latency_s": out["latency_s"]} if out["latency_s"] is not None else {}
+        return AIMessage(content=out["text"], tool_calls=tool_calls, response_metadata=meta)
+
+
+def _text_len(messages: list[BaseMessage]) -> int:
+    total = 0
+    for m in messages:
+        c = m.content
+        total += len(c) if isinstance(c, str) else len(str(c))
+    return total
+
+
+class FakeChatModel(BaseChatModel):
+    model_id: str = "fake"
+    # Latencia base + jitter uniforme; con probabilidad slow_prob la llamada tarda slow_latency_s.
+    latency_s: float = 0.2
+    jitter_s: float = 0.05
+    slow_prob: float = 0.0
+    slow_latency_s: float = 5.0
+    error_prob: float = 0.0
+    # Segundos por token de salida (simula streaming lento de respuestas largas).
+    output_token_s: float = 0.0
+    reply: str = "ok"
+    # responder(messages, tools) -> AIMessage | str; si no está, responde `reply`.
+    responder: Optional[Callable[..., Any]] = None
+    seed: Optional[int] = None
+
+    _rng: random.Random = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_id": self.model_id}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=tools, **kwargs)
+
+    def _plan(self, messages: list[BaseMessage], tools) -> tuple[float, AIMessage]:
+        if self._rng.random() < self.error_prob:
+            raise FakeThrottlingError()
+        out = self.responder(messages, tools) if self.responder else self.reply
+        msg = out if isinstance(out, AIMessage) else AIMessage(content=str(out))
+        input_tokens = max(1, _text_len(messages) // 4)
+        output_tokens = max(1, len(str(msg.content)) // 4)
+        msg.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        msg.response_metadata = {**(msg.response_metadata or {}), "model_id": self.model_id}
+        if msg.response_metadata.get("fake_latency_s") is not None:
+            latency = float(msg.response_metadata["fake_latency_s"])
+        elif self._rng.random() < self.slow_prob:
+            latency = self.slow_latency_s
+        else:
+            latency = self.latency_s + self._rng.uniform(0, self.jitter_s)
+        return latency + output_tokens * self.output_token_s, msg
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        latency, msg = self._plan(messages, kwargs.get("tools"))
+        time.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        latency, msg = self._plan(messages, kwargs.get("tools"))
+        await asyncio.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=msg)])
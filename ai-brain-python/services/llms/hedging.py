@@ -0,0 +1,166 @@
+"""
+Requests con cobertura (hedging) y cadena de fallback modelo/región para la cola de latencia.
+
+La primera llamada va al candidato primario. Si no terminó pasado el p95 reciente, se
+lanza una segunda al siguiente candidato de la cadena (otra región u otro modelo) y gana
+la primera respuesta completa; la otra se cancela (el limitador libera su lugar).
+Si un candidato falla, se pasa al siguiente sin esperar el delay.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Delay de cobertura = p95 de las últimas llamadas, acotado a [MIN, MAX].
+HEDGE_MIN_DELAY_S = float(os.getenv("HEDGE_MIN_DELAY_S", "1.5"))
+HEDGE_MAX_DELAY_S = float(os.getenv("HEDGE_MAX_DELAY_S", "20"))
+# Hasta juntar muestras se usa este delay fijo.
+HEDGE_DEFAULT_DELAY_S = float(os.getenv("HEDGE_DEFAULT_DELAY_S", "8"))
+HEDGE_MIN_SAMPLES = 20
+# Tope de coberturas sobre el total de llamadas (evita duplicar carga cuando todo está lento).
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+
+
+class LatencyTracker:
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if len(self._samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        p95 = self.quantile(0.95)
+        if p95 is None:
+            return HEDGE_DEFAULT_DELAY_S
+        return min(HEDGE_MAX_DELAY_S, max(HEDGE_MIN_DELAY_S, p95))
+
+
+class HedgeStats:
+    """Contadores en proceso; se loguean y se pueden leer con stats()."""
+
+    def __init__(self):
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self.cancelled = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class HedgedChatModel:
+    """
+    `candidates`: modelos ya envueltos (LimitedChatModel) en orden de preferencia.
+    bind_tools se propaga a toda la cadena y comparte latencias y contadores.
+    """
+
+    def __init__(self, candidates: list, name: str, *, tracker=None, stats=None):
+        if not candidates:
+            raise ValueError("HedgedChatModel necesita al menos un candidato")
+        self._candidates = list(candidates)
+        self.name = name
+        self._tracker = tracker or LatencyTracker()
+        self._stats = stats or HedgeStats()
+
+    @property
+    def model_id(self) -> str:
+        return getattr(self._candidates[0], "model_id", self.name)
+
+    def stats(self) -> dict:
+        return self._stats.as_dict()
+
+    def bind_tools(self, tools, **kwargs) -> "HedgedChatModel":
+        return HedgedChatModel(
+            [c.bind_tools(tools, **kwargs) for c in self._candidates],
+            self.name,
+            tracker=self._tracker,
+            stats=self._stats,
+        )
+
+    def _may_hedge(self) -> bool:
+        s = self._stats
+        return s.hedges < max(1.0, s.calls * HEDGE_MAX_RATIO)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        self._stats.calls += 1
+        started = time.monotonic()
+        queue = list(enumerate(self._candidates))
+        running: dict[asyncio.Task, int] = {}
+        last_error: BaseException | None = None
+
+        def launch() -> None:
+            idx, cand = queue.pop(0)
+            running[asyncio.ensure_future(cand.ainvoke(input, config, **kwargs))] = idx
+
+        launch()
+        try:
+            while running:
+                can_hedge = bool(queue) and len(running) == 1 and self._may_hedge()
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=self._tracker.hedge_delay() if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    self._stats.hedges += 1
+                    logger.info(
+                        "[hedge] %s: sin respuesta a %.1fs, cubriendo con candidato %s",
+                        self.name,
+                        time.monotonic() - started,
+                        queue[0][0],
+                    )
+                    launch()
+                    continue
+                for task in done:
+                    idx = running.pop(task)
+                    if task.exception() is None:
+                        self._tracker.observe(time.monotonic() - started)
+                        if idx > 0 and running:
+                            self._stats.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+                    self._stats.errors += 1
+                    logger.warning("[hedge] %s: candidato %s falló: %s", self.name, idx, last_error)
+                if not running and queue:
+                    self._stats.fallbacks += 1
+                    launch()
+            raise last_error
+        finally:
+            for task in running:
+                task.cancel()
+                self._stats.cancelled += 1
+
+    def invoke(self, input, config=None, **kwargs):
+        """Camino sync: sin cobertura, solo fallback secuencial por la cadena."""
+        self._stats.calls += 1
+        last_error: BaseException | None = None
+        for idx, cand in enumerate(self._candidates):
+            try:
+                started = time.monotonic()
+                result = cand.invoke(input, config, **kwargs)
+                self._tracker.observe(time.monotonic() - started)
+                return result
+            except Exception as e:
+                last_error = e
+                self._stats.errors += 1
+                if idx + 1 < len(self._candidates):
+                    self._stats.fallbacks += 1
+                logger.warning("[hedge] %s: candidato %s falló (sync): %s", self.name, idx, e)
+        raise last_error
@@ -2,21 +2,84 @@ import os
 from langchain_aws import ChatBedrockConverse
 from dotenv import load_dotenv
 
+from services.llms.hedging import HedgedChatModel
+from services.llms.rate_limiter import INTERACTIVE, ROUTING, LimitedChatModel
+
 load_dotenv()
 
+# Reintentos de botocore acotados: el throttling lo absorbe el limitador (AIMD), no una tormenta de retries.
+BEDROCK_MAX_RETRIES = int(os.getenv("BEDROCK_MAX_RETRIES", "1"))
+# "bedrock" (default) o "fake" (services.llms.fake: latencia inyectada, sin AWS).
+LLM_BACKEND = os.getenv("LLM_BACKEND", "bedrock")
+# Endpoint Converse alternativo (p. ej. bench/fake_bedrock.py en pruebas de carga).
+BEDROCK_ENDPOINT_URL = os.getenv("BEDROCK_ENDPOINT_URL") or None
+# Responder en proceso para el backend fake (replay/benchmarks); pisa FAKE_LLM_SCRIPT.
+# Se setea antes de importar los grafos, que construyen sus modelos al importarse.
+FAKE_RESPONDER = None
 
-def get_bedrock_model_brain():
-    """Modelo con Converse API: tool calling nativo y tool_choice respetado."""
-    return ChatBedrockConverse(
-        model=os.getenv("AWS_SECOND_LLM", "us.anthropic.claude-sonnet-4-6"),
-        region_name=os.getenv("AWS_REGION", "us-east-2"),
-        temperature=0,
+
+def _fake_model(model_id: str):
+    from services.llms.fake import FakeChatModel, ScriptedResponder
+
+    script = os.getenv("FAKE_LLM_SCRIPT")
+    responder = FAKE_RESPONDER or (ScriptedResponder.from_file(script) if script else None)
+    return FakeChatModel(
+        model_id=model_id,
+        latency_s=float(os.getenv("FAKE_LLM_LATENCY_S", "0.2")),
+        jitter_s=float(os.getenv("FAKE_LLM_JITTER_S", "0.05")),
+        output_token_s=float(os.getenv("FAKE_LLM_OUTPUT_TOKEN_S", "0")),
+        responder=responder,
     )
 
 
-def get_bedrock_model_master():
-    """Haiku para triaje (sin tools)."""
+def _chat_model(model_id: str, region: str, **kwargs):
+    if LLM_BACKEND == "fake":
+        return _fake_model(f"{model_id}@{region}")
+    if BEDROCK_ENDPOINT_URL:
+        kwargs.setdefault("endpoint_url", BEDROCK_ENDPOINT_URL)
     return ChatBedrockConverse(
-        model=os.getenv("AWS_PRIMARY_LLM", "anthropic.claude-3-haiku-20240307-v1:0"),
-        region_name=os.getenv("AWS_REGION", "us-east-1"),
-    )
\ No newline at end of file
+        model=model_id,
+        region_name=region,
+        max_retries=BEDROCK_MAX_RETRIES,
+        **kwargs,
+    )
+
+
+def _chain(primary_id: str, primary_region: str, env_var: str) -> list[tuple[str, str]]:
+    """Primario + cadena de fallback "modelo@región,modelo@región" (región opcional)."""
+    chain = [(primary_id, primary_region)]
+    for raw in (os.getenv(env_var) or "").split(","):
+        raw = raw.strip()
+        if not raw:
+            continue
+        model_id, _, region = raw.partition("@")
+        chain.append((model_id.strip() or primary_id, region.strip() or primary_region))
+    return chain
+
+
+def _build(name: str, chain: list[tuple[str, str]], priority: str, **kwargs) -> HedgedChatModel:
+    candidates = [
+        LimitedChatModel(_chat_model(model_id, region, **kwargs), model_id, priority)
+        for model_id, region in chain
+    ]
+    return HedgedChatModel(candidates, name)
+
+
+def get_bedrock_model_brain(priority: str = INTERACTIVE):
+    """Modelo con Converse API: tool calling nativo y tool_choice respetado."""
+    chain = _chain(
+        os.getenv("AWS_SECOND_LLM", "us.anthropic.claude-sonnet-4-6"),
+        os.getenv("AWS_REGION", "us-east-2"),
+        "BEDROCK_FALLBACK_BRAIN",
+    )
+    return _build("brain", chain, priority, temperature=0)
+
+
+def get_bedrock_model_master(priority: str = ROUTING):
+    """Haiku para triaje (sin tools). Por defecto con prioridad de ruteo."""
+    chain = _chain(
+        os.getenv("AWS_PRIMARY_LLM", "anthropic.claude-3-haiku-20240307-v1:0"),
+        os.getenv("AWS_REGION", "us-east-1"),
+        "BEDROCK_FALLBACK_MASTER",
+    )
+    return _build("master", chain, priority)
\ No newline at end of file
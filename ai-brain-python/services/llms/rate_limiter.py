@@ -0,0 +1,307 @@
+"""
+Limitador distribuido de Bedrock (Redis, compartido por todos los procesos).
+
+- Presupuesto por model id: requests/min (RPM) y tokens/min (TPM) en ventanas de un minuto.
+- Concurrencia AIMD: el límite de llamadas en vuelo sube +1/límite por éxito y se
+  multiplica por BEDROCK_AIMD_BACKOFF ante ThrottlingException.
+- Prioridad: los turnos interactivos (workflows, master) usan el 100% del presupuesto;
+  el ruteo (clasificadores) solo hasta BEDROCK_ROUTING_SHARE, el resto queda reservado.
+
+Si Redis falla, el limitador deja pasar (fail-open): no debe tirar abajo las llamadas al LLM.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+from common.redis_config import get_redis, get_redis_sync
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+ROUTING = "routing"
+
+# Presupuesto por defecto; se pisa por modelo con BEDROCK_BUDGETS='{"model-id": {"rpm": 100, "tpm": 80000}}'.
+DEFAULT_RPM = int(os.getenv("BEDROCK_DEFAULT_RPM", "200"))
+DEFAULT_TPM = int(os.getenv("BEDROCK_DEFAULT_TPM", "200000"))
+_BUDGETS = json.loads(os.getenv("BEDROCK_BUDGETS", "{}") or "{}")
+
+ROUTING_SHARE = float(os.getenv("BEDROCK_ROUTING_SHARE", "0.7"))
+AIMD_MIN = float(os.getenv("BEDROCK_AIMD_MIN", "2"))
+AIMD_MAX = float(os.getenv("BEDROCK_AIMD_MAX", "64"))
+AIMD_INITIAL = float(os.getenv("BEDROCK_AIMD_INITIAL", "8"))
+AIMD_BACKOFF = float(os.getenv("BEDROCK_AIMD_BACKOFF", "0.5"))
+# Espera máxima por un lugar antes de rendirse (seg).
+MAX_WAIT_S = float(os.getenv("BEDROCK_RL_MAX_WAIT_S", "30"))
+# Una llamada que no liberó su lugar (proceso caído) deja de contar pasado este tiempo.
+LEASE_S = 120
+
+_THROTTLE_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+}
+
+# KEYS: rpm, tpm, inflight, limit. ARGV: rpm_max, tpm_max, est_tokens, now, lease, member, share, initial.
+# Retorna 0 si tomó lugar, o ms sugeridos de espera.
+_ACQUIRE_LUA = """
+local now = tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now - tonumber(ARGV[5]))
+local share = tonumber(ARGV[7])
+local limit = tonumber(redis.call('GET', KEYS[4]) or ARGV[8])
+if redis.call('ZCARD', KEYS[3]) >= math.max(1, math.floor(limit * share)) then
+  return 50
+end
+local to_next_min = 60000 - (math.floor(now * 1000) % 60000)
+local rpm = tonumber(redis.call('GET', KEYS[1]) or '0')
+if rpm + 1 > tonumber(ARGV[1]) * share then
+  return to_next_min
+end
+local tpm = tonumber(redis.call('GET', KEYS[2]) or '0')
+local est = tonumber(ARGV[3])
+if tpm > 0 and tpm + est > tonumber(ARGV[2]) * share then
+  return to_next_min
+end
+redis.call('INCR', KEYS[1])
+redis.call('INCRBY', KEYS[2], est)
+redis.call('EXPIRE', KEYS[1], 120)
+redis.call('EXPIRE', KEYS[2], 120)
+redis.call('ZADD', KEYS[3], now, ARGV[6])
+return 0
+"""
+
+# KEYS: tpm, inflight, limit. ARGV: member, throttled (0/1), token_delta, min, max, backoff, initial.
+_RELEASE_LUA = """
+redis.call('ZREM', KEYS[2], ARGV[1])
+local delta = tonumber(ARGV[3])
+if delta ~= 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('INCRBY', KEYS[1], delta)
+end
+local limit = tonumber(redis.call('GET', KEYS[3]) or ARGV[7])
+if ARGV[2] == '1' then
+  limit = math.max(tonumber(ARGV[4]), limit * tonumber(ARGV[6]))
+else
+  limit = math.min(tonumber(ARGV[5]), limit + 1.0 / limit)
+end
+redis.call('SET', KEYS[3], limit)
+return tostring(limit)
+"""
+
+
+class Lease(NamedTuple):
+    """Lugar tomado: `minute` es la ventana donde se reservó el TPM (la corrige el release)."""
+
+    member: str
+    minute: int
+
+
+class RateLimitExceeded(RuntimeError):
+    """No hubo lugar en el presupuesto de Bedrock dentro de BEDROCK_RL_MAX_WAIT_S."""
+
+
+def is_throttle(exc: BaseException) -> bool:
+    code = ""
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        code = (response.get("Error") or {}).get("Code", "")
+    if code in _THROTTLE_CODES:
+        return True
+    text = str(exc).lower()
+    return "throttl" in text or "too many requests" in text
+
+
+def estimate_tokens(value) -> int:
+    """Estimación barata (≈ 4 caracteres por token) para reservar TPM antes de la llamada."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return max(1, len(value) // 4)
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_tokens(v) for v in value)
+    if isinstance(value, dict):
+        return estimate_tokens(value.get("text") or value.get("content"))
+    return estimate_tokens(getattr(value, "content", None))
+
+
+def _usage_tokens(response) -> int | None:
+    usage = getattr(response, "usage_metadata", None) or {}
+    total = usage.get("total_tokens")
+    return int(total) if total is not None else None
+
+
+class BedrockRateLimiter:
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+        budget = _BUDGETS.get(model_id) or {}
+        self.rpm = int(budget.get("rpm", DEFAULT_RPM))
+        self.tpm = int(budget.get("tpm", DEFAULT_TPM))
+        self._prefix = f"llm_rl:{model_id}"
+        self._async_scripts = None
+        self._sync_scripts = None
+
+    def _keys(self, minute: int) -> list[str]:
+        return [
+            f"{self._prefix}:rpm:{minute}",
+            f"{self._prefix}:tpm:{minute}",
+            f"{self._prefix}:inflight",
+            f"{self._prefix}:limit",
+        ]
+
+    def _acquire_args(self, priority: str, est: int, now: float, member: str) -> list:
+        share = 1.0 if priority == INTERACTIVE else ROUTING_SHARE
+        return [self.rpm, self.tpm, est, now, LEASE_S, member, share, AIMD_INITIAL]
+
+    def _release_args(self, member: str, throttled: bool, delta: int) -> list:
+        return [member, "1" if throttled else "0", delta, AIMD_MIN, AIMD_MAX, AIMD_BACKOFF, AIMD_INITIAL]
+
+    def _scripts(self, client) -> tuple:
+        return client.register_script(_ACQUIRE_LUA), client.register_script(_RELEASE_LUA)
+
+    async def acquire(self, priority: str, est_tokens: int) -> Lease | None:
+        """Espera un lugar; retorna el lease (None si Redis no respondió)."""
+        member = uuid.uuid4().hex
+        deadline = time.monotonic() + MAX_WAIT_S
+        try:
+            if self._async_scripts is None:
+                self._async_scripts = self._scripts(get_redis())
+            acquire, _ = self._async_scripts
+            while True:
+                now = time.time()
+                minute = int(now // 60)
+                wait_ms = int(
+                    await acquire(
+                        keys=self._keys(minute),
+                        args=self._acquire_args(priority, est_tokens, now, member),
+                    )
+                )
+                if wait_ms == 0:
+                    return Lease(member, minute)
+                if time.monotonic() + wait_ms / 1000 > deadline:
+                    raise RateLimitExceeded(f"Bedrock {self.model_id}: sin cupo ({priority})")
+                await asyncio.sleep(min(wait_ms, 1000) / 1000)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.warning("[rate_limiter] Redis no disponible, sin limitar: %s", e)
+            return None
+
+    async def release(self, lease: Lease | None, *, throttled: bool, token_delta: int = 0) -> None:
+        if lease is None or self._async_scripts is None:
+            return
+        _, release = self._async_scripts
+        try:
+            limit = await release(
+                keys=self._keys(lease.minute)[1:],
+                args=self._release_args(lease.member, throttled, token_delta),
+            )
+            if throttled:
+                logger.warning("[rate_limiter] Throttle en %s → límite %s", self.model_id, limit)
+        except Exception as e:
+            logger.warning("[rate_limiter] release falló: %s", e)
+
+    def acquire_sync(self, priority: str, est_tokens: int) -> Lease | None:
+        member = uuid.uuid4().hex
+        deadline = time.monotonic() + MAX_WAIT_S
+        try:
+            if self._sync_scripts is None:
+                self._sync_scripts = self._scripts(get_redis_sync())
+            acquire, _ = self._sync_scripts
+            while True:
+                now = time.time()
+                minute = int(now // 60)
+                wait_ms = int(
+                    acquire(
+                        keys=self._keys(minute),
+                        args=self._acquire_args(priority, est_tokens, now, member),
+                    )
+                )
+                if wait_ms == 0:
+                    return Lease(member, minute)
+                if time.monotonic() + wait_ms / 1000 > deadline:
+                    raise RateLimitExceeded(f"Bedrock {self.model_id}: sin cupo ({priority})")
+                time.sleep(min(wait_ms, 1000) / 1000)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.warning("[rate_limiter] Redis no disponible, sin limitar: %s", e)
+            return None
+
+    def release_sync(self, lease: Lease | None, *, throttled: bool, token_delta: int = 0) -> None:
+        if lease is None or self._sync_scripts is None:
+            return
+        _, release = self._sync_scripts
+        try:
+            release(
+                keys=self._keys(lease.minute)[1:],
+                args=self._release_args(lease.member, throttled, token_delta),
+            )
+        except Exception as e:
+            logger.warning("[rate_limiter] release falló: %s", e)
+
+
+_limiters: dict[str, BedrockRateLimiter] = {}
+
+
+def get_limiter(model_id: str) -> BedrockRateLimiter:
+    if model_id not in _limiters:
+        _limiters[model_id] = BedrockRateLimiter(model_id)
+    return _limiters[model_id]
+
+
+class LimitedChatModel:
+    """
+    Envuelve un chat model (o su bind_tools) y pasa cada invoke/ainvoke por el limitador
+    del model id. Reserva TPM con una estimación y la corrige con usage_metadata.
+    """
+
+    def __init__(self, model, model_id: str, priority: str = INTERACTIVE):
+        self._model = model
+        self.model_id = model_id
+        self.priority = priority
+        self._limiter = get_limiter(model_id)
+
+    def bind_tools(self, tools, **kwargs) -> "LimitedChatModel":
+        return LimitedChatModel(self._model.bind_tools(tools, **kwargs), self.model_id, self.priority)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        est = estimate_tokens(input)
+        lease = await self._limiter.acquire(self.priority, est)
+        throttled = False
+        response = None
+        try:
+            response = await self._model.ainvoke(input, config, **kwargs)
+            return response
+        except Exception as e:
+            throttled = is_throttle(e)
+            raise
+        finally:
+            actual = _usage_tokens(response)
+            await self._limiter.release(
+                lease, throttled=throttled, token_delta=(actual - est) if actual is not None else 0
+            )
+
+    def invoke(self, input, config=None, **kwargs):
+        est = estimate_tokens(input)
+        lease = self._limiter.acquire_sync(self.priority, est)
+        throttled = False
+        response = None
+        try:
+            response = self._model.invoke(input, config, **kwargs)
+            return response
+        except Exception as e:
+            throttled = is_throttle(e)
+            raise
+        finally:
+            actual = _usage_tokens(response)
+            self._limiter.release_sync(
+                lease, throttled=throttled, token_delta=(actual - est) if actual is not None else 0
+            )
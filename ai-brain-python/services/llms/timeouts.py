@@ -0,0 +1,45 @@
+"""
+Política única de timeout y cancelación para las llamadas al LLM (todas async).
+
+- Routers (clasificadores): timeout corto; quien llama decide el fallback (ruta por defecto).
+- Turnos (nodos de los grafos): timeout largo; LLMTimeout sube al worker, que responde el
+  mensaje de error de siempre.
+- Al vencer, asyncio.wait_for cancela la llamada: el limitador libera su lugar y el hedging
+  cancela las coberturas en curso (sus finally). Un CancelledError del worker (apagado) no
+  se captura: se propaga tal cual.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Incluyen la espera por lugar en el limitador y las coberturas del hedging.
+LLM_ROUTER_TIMEOUT_S = float(os.getenv("LLM_ROUTER_TIMEOUT_S", "10"))
+LLM_TURN_TIMEOUT_S = float(os.getenv("LLM_TURN_TIMEOUT_S", "90"))
+
+
+class LLMTimeout(TimeoutError):
+    """La llamada al LLM superó su timeout y fue cancelada."""
+
+
+async def ainvoke(model, input, *, timeout_s: float, label: str):
+    try:
+        return await asyncio.wait_for(model.ainvoke(input), timeout_s)
+    except asyncio.TimeoutError:
+        logger.warning("[llm] %s: sin respuesta en %.0fs, cancelada", label, timeout_s)
+        raise LLMTimeout(f"{label}: timeout de {timeout_s:.0f}s") from None
+
+
+async def route(model, input, *, label: str):
+    return await ainvoke(model, input, timeout_s=LLM_ROUTER_TIMEOUT_S, label=label)
+
+
+async def turn(model, input, *, label: str):
+    return await ainvoke(model, input, timeout_s=LLM_TURN_TIMEOUT_S, label=label)
@@ -0,0 +1,305 @@
+"""
+Contabilidad de tokens y latencia por llamada LLM, agregada en Redis por día.
+
+Un `UsageRecorder` es un callback de LangChain que se activa por turno con `turn(...)`
+(context var registrada como configure hook: llega a los nodos del grafo y a los
+routers sin pasar `config`). Cada llamada queda etiquetada con servicio, nodo, modelo,
+cliente y prompt (primera línea del primer mensaje); al cerrar el turno se escribe todo
+en un solo pipeline.
+
+Claves (día UTC, TTL LLM_USAGE_TTL_DAYS):
+- llm_usage:{día}:groups              SET  "servicio|nodo|modelo"
+- llm_usage:{día}:g:{grupo}           HASH calls, input_tokens, output_tokens, latency_ms, prompt_chars
+- llm_usage:{día}:lat:{servicio|nodo} LIST últimas latencias (ms) → p50/p95
+- llm_usage:{día}:prompt_tokens       ZSET "servicio|nodo|prompt" → tokens de entrada
+- llm_usage:{día}:prompt_calls        ZSET ídem → llamadas
+- llm_usage:{día}:turn_tokens:{serv}  LIST tokens totales por turno
+- llm_usage:{día}:customers           ZSET cliente → tokens
+
+Reporte: python -m services.llms.usage [--day AAAAMMDD] [--top N]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_USAGE_ENABLED = os.getenv("LLM_USAGE_ENABLED", "1") == "1"
+LLM_USAGE_TTL_DAYS = int(os.getenv("LLM_USAGE_TTL_DAYS", "14"))
+LATENCY_SAMPLES = int(os.getenv("LLM_USAGE_LATENCY_SAMPLES", "2000"))
+
+# USD por millón de tokens (entrada, salida) por familia de modelo; se pisan por env.
+PRICING = {
+    "haiku": (
+        float(os.getenv("LLM_PRICE_HAIKU_IN", "0.25")),
+        float(os.getenv("LLM_PRICE_HAIKU_OUT", "1.25")),
+    ),
+    "sonnet": (
+        float(os.getenv("LLM_PRICE_SONNET_IN", "3.0")),
+        float(os.getenv("LLM_PRICE_SONNET_OUT", "15.0")),
+    ),
+}
+
+_PREFIX = "llm_usage"
+
+
+def model_family(model_id: str) -> str:
+    return "haiku" if "haiku" in (model_id or "").lower() else "sonnet"
+
+
+def estimate_cost(family: str, input_tokens: float, output_tokens: float) -> float:
+    price_in, price_out = PRICING.get(family, PRICING["sonnet"])
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+def _prompt_label(messages) -> tuple[str, int]:
+    """(primera línea del primer mensaje, largo total en caracteres)."""
+    flat = messages[0] if messages and isinstance(messages[0], list) else messages
+    chars = 0
+    label = ""
+    for m in flat or []:
+        content = getattr(m, "content", m)
+        text = content if isinstance(content, str) else str(content)
+        chars += len(text)
+        if not label:
+            label = next((ln.strip() for ln in text.splitlines() if ln.strip()), "")[:60]
+    return label.replace("|", "/"), chars
+
+
+def _day() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%d")
+
+
+class UsageRecorder(BaseCallbackHandler):
+    """Junta las llamadas de un turno; `flush`/`flush_sync` las escribe en Redis."""
+
+    run_inline = True
+    raise_error = False
+
+    def __init__(self, service: str, customer_id: str = "", node: str = ""):
+        self.service = service
+        self.customer_id = customer_id
+        self.node = node or service
+        self.calls: list[dict] = []
+        self._open: dict[UUID, dict] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        label, chars = _prompt_label(messages)
+        self._open[run_id] = {
+            "node": (metadata or {}).get("langgraph_node") or self.node,
+            "model": params.get("model_id") or params.get("model") or "",
+            "prompt": label,
+            "prompt_chars": chars,
+            "started": time.monotonic(),
+        }
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        call = self._open.pop(run_id, None)
+        if call is None:
+            return
+        usage, meta = {}, {}
+        try:
+            message = response.generations[0][0].message
+            usage = message.usage_metadata or {}
+            meta = message.response_metadata or {}
+        except (AttributeError, IndexError):
+            pass
+        call["model"] = call["model"] or meta.get("model_name") or meta.get("model_id") or "unknown"
+        call["latency_ms"] = int((time.monotonic() - call.pop("started")) * 1000)
+        call["input_tokens"] = int(usage.get("input_tokens") or 0)
+        call["output_tokens"] = int(usage.get("output_tokens") or 0)
+        with self._lock:
+            self.calls.append(call)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._open.pop(run_id, None)
+
+    def _write(self, pipe) -> None:
+        day = _day()
+        ttl = LLM_USAGE_TTL_DAYS * 86400
+        base = f"{_PREFIX}:{day}"
+        touched = {f"{base}:groups", f"{base}:prompt_tokens", f"{base}:prompt_calls", f"{base}:customers"}
+        turn_tokens = 0
+        for c in self.calls:
+            group = f"{self.service}|{c['node']}|{c['model']}"
+            node_key = f"{self.service}|{c['node']}"
+            prompt_key = f"{node_key}|{c['prompt']}"
+            tokens = c["input_tokens"] + c["output_tokens"]
+            turn_tokens += tokens
+            pipe.sadd(f"{base}:groups", group)
+            gkey = f"{base}:g:{group}"
+            pipe.hincrby(gkey, "calls", 1)
+            pipe.hincrby(gkey, "input_tokens", c["input_tokens"])
+            pipe.hincrby(gkey, "output_tokens", c["output_tokens"])
+            pipe.hincrby(gkey, "latency_ms", c["latency_ms"])
+            pipe.hincrby(gkey, "prompt_chars", c["prompt_chars"])
+            lkey = f"{base}:lat:{node_key}"
+            pipe.lpush(lkey, c["latency_ms"])
+            pipe.ltrim(lkey, 0, LATENCY_SAMPLES - 1)
+            pipe.zincrby(f"{base}:prompt_tokens", c["input_tokens"], prompt_key)
+            pipe.zincrby(f"{base}:prompt_calls", 1, prompt_key)
+            touched.update({gkey, lkey})
+        tkey = f"{base}:turn_tokens:{self.service}"
+        pipe.lpush(tkey, turn_tokens)
+        pipe.ltrim(tkey, 0, LATENCY_SAMPLES - 1)
+        touched.add(tkey)
+        if self.customer_id:
+            pipe.zincrby(f"{base}:customers", turn_tokens, self.customer_id)
+        for key in touched:
+            pipe.expire(key, ttl)
+
+    async def flush(self, redis) -> None:
+        if not self.calls:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            self._write(pipe)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning("[llm_usage] no se pudo registrar el turno: %s", e)
+
+    def flush_sync(self, redis) -> None:
+        if not self.calls:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            self._write(pipe)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("[llm_usage] no se pudo registrar el turno: %s", e)
+
+
+_active: ContextVar[Optional[UsageRecorder]] = ContextVar("moustro_llm_usage", default=None)
+register_configure_hook(_active, inheritable=True)
+
+
+@contextmanager
+def recording(service: str, customer_id: str = "", node: str = ""):
+    """Activa un recorder para las llamadas LLM del bloque (sin escribir en Redis)."""
+    recorder = UsageRecorder(service, customer_id, node)
+    token = _active.set(recorder if LLM_USAGE_ENABLED else None)
+    try:
+        yield recorder
+    finally:
+        _active.reset(token)
+
+
+@asynccontextmanager
+async def turn(redis, service: str, customer_id: str = "", node: str = ""):
+    """Registra las llamadas LLM del bloque y las agrega en Redis al salir."""
+    with recording(service, customer_id, node) as recorder:
+        try:
+            yield recorder
+        finally:
+            if LLM_USAGE_ENABLED:
+                await recorder.flush(redis)
+
+
+def _quantile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report(redis, day: Optional[str] = None, top: int = 10) -> dict:
+    """Rollup del día (cliente Redis sync): grupos por costo, prompts, tokens por turno, clientes."""
+    base = f"{_PREFIX}:{day or _day()}"
+    groups = []
+    for raw in redis.smembers(f"{base}:groups"):
+        group = raw.decode()
+        service, node, model = group.split("|", 2)
+        h = {k.decode(): int(v) for k, v in redis.hgetall(f"{base}:g:{group}").items()}
+        calls = h.get("calls", 0) or 1
+        lat = [float(x) for x in redis.lrange(f"{base}:lat:{service}|{node}", 0, -1)]
+        groups.append(
+            {
+                "service": service,
+                "node": node,
+                "model": model,
+                "calls": h.get("calls", 0),
+                "input_tokens": h.get("input_tokens", 0),
+                "output_tokens": h.get("output_tokens", 0),
+                "avg_input_tokens": h.get("input_tokens", 0) / calls,
+                "avg_prompt_chars": h.get("prompt_chars", 0) / calls,
+                "avg_latency_ms": h.get("latency_ms", 0) / calls,
+                "p50_ms": _quantile(lat, 0.5),
+                "p95_ms": _quantile(lat, 0.95),
+                "cost_usd": estimate_cost(
+                    model_family(model), h.get("input_tokens", 0), h.get("output_tokens", 0)
+                ),
+            }
+        )
+    groups.sort(key=lambda g: g["cost_usd"], reverse=True)
+
+    prompts = []
+    for member, tokens in redis.zrevrange(f"{base}:prompt_tokens", 0, top - 1, withscores=True):
+        calls = redis.zscore(f"{base}:prompt_calls", member) or 1
+        prompts.append(
+            {"prompt": member.decode(), "input_tokens": int(tokens), "avg_input_tokens": tokens / calls}
+        )
+
+    turns = {}
+    for g in {g["service"] for g in groups}:
+        values = [float(x) for x in redis.lrange(f"{base}:turn_tokens:{g}", 0, -1)]
+        turns[g] = {
+            "turns": len(values),
+            "p50": _quantile(values, 0.5),
+            "p95": _quantile(values, 0.95),
+        }
+
+    customers = [
+        (m.decode(), int(s))
+        for m, s in redis.zrevrange(f"{base}:customers", 0, top - 1, withscores=True)
+    ]
+    return {"groups": groups[:top], "prompts": prompts, "turn_tokens": turns, "customers": customers}
+
+
+def _print_report(data: dict) -> None:
+    print("== Nodos más caros ==")
+    print(f"{'servicio|nodo':34} {'modelo':44} {'calls':>6} {'in/call':>8} {'p50ms':>7} {'p95ms':>7} {'USD':>9}")
+    for g in data["groups"]:
+        print(
+            f"{g['service'] + '|' + g['node']:34} {g['model'][:44]:44} {g['calls']:>6} "
+            f"{g['avg_input_tokens']:>8.0f} {g['p50_ms']:>7.0f} {g['p95_ms']:>7.0f} {g['cost_usd']:>9.4f}"
+        )
+    print("\n== Prompts con más tokens de entrada ==")
+    for p in data["prompts"]:
+        print(f"{p['input_tokens']:>10} ({p['avg_input_tokens']:>7.0f}/call)  {p['prompt']}")
+    print("\n== Tokens por turno ==")
+    for service, t in sorted(data["turn_tokens"].items()):
+        print(f"{service:20} turnos={t['turns']:<6} p50={t['p50']:.0f} p95={t['p95']:.0f}")
+    print("\n== Clientes con más tokens ==")
+    for customer, tokens in data["customers"]:
+        print(f"{tokens:>10}  {customer}")
+
+
+def main() -> None:
+    from common.redis_config import get_redis_sync
+
+    parser = argparse.ArgumentParser(description="Reporte de tokens/latencia LLM por nodo")
+    parser.add_argument("--day", help="AAAAMMDD (UTC); default hoy")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    _print_report(report(get_redis_sync(), args.day, args.top))
+
+
+if __name__ == "__main__":
+    main()
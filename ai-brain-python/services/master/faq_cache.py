@@ -0,0 +1,192 @@
+"""
+Caché de respuestas del master para preguntas genéricas ("¿qué es la TNA?", "cómo se calcula
+la cuota") en turnos sin contexto previo: se sirven sin llamar a Haiku.
+
+- La pregunta se normaliza (minúsculas, sin tildes ni signos) y se compara por similitud de
+  texto: MinHash sobre shingles de 3 caracteres, con LSH por bandas en Redis para encontrar
+  candidatos. Se sirve el candidato con similitud estimada ≥ FAQ_CACHE_MIN_SIMILARITY, los
+  mismos números que la pregunta ("100 mil en 12 cuotas" ≠ "100 mil en 18 cuotas") y los
+  mismos términos: palabras sin las vacías, comparadas por sus primeras letras ("calcula" =
+  "calculo"), para que una sigla distinta no pase por parecido ("que es el cft" ≠ "que es el
+  cer").
+- La respuesta se guarda con `{nombre_corto}` en lugar del nombre del cliente y se completa
+  al servirla.
+- Las claves llevan la versión (hash de SYSTEM_PROMPT y del modelo): si cambia el prompt,
+  las entradas viejas dejan de consultarse y vencen solas por TTL.
+
+faq:e:{ver}:{id}        hash  q (pregunta normalizada), sig, nums, terms, a (plantilla), hits
+faq:b:{ver}:{banda}:{h} set   ids de entradas con esa banda de firma
+"""
+import hashlib
+import logging
+import os
+import random
+import re
+import zlib
+
+from dotenv import load_dotenv
+
+from common.lexicon import normalize
+from services.master.prompt import SYSTEM_PROMPT
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FAQ_CACHE = os.getenv("FAQ_CACHE", "1") == "1"
+FAQ_CACHE_TTL_S = int(os.getenv("FAQ_CACHE_TTL_S", str(7 * 24 * 3600)))
+FAQ_CACHE_MIN_SIMILARITY = float(os.getenv("FAQ_CACHE_MIN_SIMILARITY", "0.8"))
+# Mensajes largos casi nunca son genéricos: no se consultan ni se guardan.
+FAQ_CACHE_MAX_CHARS = int(os.getenv("FAQ_CACHE_MAX_CHARS", "160"))
+
+PLACEHOLDER = "{nombre_corto}"
+# Nombre por defecto cuando el customerId no da uno: no se puede volver plantilla.
+_NO_NAME = "cliente"
+# Respuestas que no se guardan: derivan a un flujo con datos del cliente.
+_NOT_CACHEABLE = ("[DERIVAR]",)
+
+_SHINGLE = 3
+_BANDS = 16
+_ROWS = 4
+_PERM = _BANDS * _ROWS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_COEFS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(_PERM)]
+
+_NUMBER = re.compile(r"\d+")
+# Letras con que se compara cada término: alcanza para siglas y tolera conjugaciones.
+_TERM_PREFIX = 5
+_STOPWORDS = frozenset(
+    "a al algo como con cual cuales cuando cuanto cuanta cuantos cuantas de del donde el en es "
+    "esta este esto hay la las lo los me mi mis para por que se si sirve son su sus te tu un una "
+    "uno unos unas y o hola buenas buen dia dias tardes noches gracias porfa favor".split()
+)
+
+VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + "\0" + os.getenv("AWS_PRIMARY_LLM", "")).encode()
+).hexdigest()[:12]
+
+
+def _shingles(norm: str) -> set[int]:
+    text = f" {norm} "
+    if len(text) <= _SHINGLE:
+        return {zlib.crc32(text.encode())}
+    return {zlib.crc32(text[i:i + _SHINGLE].encode()) for i in range(len(text) - _SHINGLE + 1)}
+
+
+def signature(norm: str) -> list[int]:
+    shingles = _shingles(norm)
+    return [min((a * s + b) % _PRIME for s in shingles) for a, b in _COEFS]
+
+
+def similarity(sig_a: list[int], sig_b: list[int]) -> float:
+    """Jaccard estimado entre los textos de las dos firmas."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+def _bands(sig: list[int]) -> list[str]:
+    return [
+        hashlib.blake2b(
+            ",".join(map(str, sig[i * _ROWS:(i + 1) * _ROWS])).encode(), digest_size=8
+        ).hexdigest()
+        for i in range(_BANDS)
+    ]
+
+
+def _numbers(norm: str) -> str:
+    return " ".join(sorted(_NUMBER.findall(norm)))
+
+
+def _terms(norm: str) -> str:
+    words = {w[:_TERM_PREFIX] for w in norm.split() if w not in _STOPWORDS and not _NUMBER.fullmatch(w)}
+    return " ".join(sorted(words))
+
+
+def _entry_id(norm: str) -> str:
+    return hashlib.sha1(norm.encode()).hexdigest()[:16]
+
+
+def _entry_key(entry_id: str) -> str:
+    return f"faq:e:{VERSION}:{entry_id}"
+
+
+def _band_key(band: int, h: str) -> str:
+    return f"faq:b:{VERSION}:{band}:{h}"
+
+
+def cacheable_question(text: str) -> str | None:
+    """Pregunta normalizada si puede ir a la caché; None si es demasiado larga o vacía."""
+    if not FAQ_CACHE or not text or len(text) > FAQ_CACHE_MAX_CHARS:
+        return None
+    return normalize(text) or None
+
+
+def to_template(answer: str, nombre: str) -> str | None:
+    if nombre.lower() == _NO_NAME or any(m in answer for m in _NOT_CACHEABLE):
+        return None
+    return re.sub(rf"\b{re.escape(nombre)}\b", PLACEHOLDER, answer)
+
+
+def fill(template: str, nombre: str) -> str:
+    # replace y no format: la respuesta puede traer llaves propias.
+    return template.replace(PLACEHOLDER, nombre)
+
+
+async def lookup(redis, norm: str) -> str | None:
+    """Plantilla de la entrada más parecida a `norm`, o None."""
+    exact = await redis.hget(_entry_key(_entry_id(norm)), "a")
+    if exact is not None:
+        await redis.hincrby(_entry_key(_entry_id(norm)), "hits", 1)
+        return exact.decode()
+
+    sig = signature(norm)
+    pipe = redis.pipeline()
+    for band, h in enumerate(_bands(sig)):
+        pipe.smembers(_band_key(band, h))
+    candidates = set().union(*await pipe.execute())
+    if not candidates:
+        return None
+
+    nums = _numbers(norm)
+    terms = _terms(norm)
+    pipe = redis.pipeline()
+    ordered = sorted(candidates)
+    for entry_id in ordered:
+        pipe.hmget(_entry_key(entry_id.decode()), "sig", "nums", "terms", "a")
+    best, best_sim = None, FAQ_CACHE_MIN_SIMILARITY
+    for entry_id, (raw_sig, raw_nums, raw_terms, answer) in zip(ordered, await pipe.execute()):
+        if raw_sig is None or answer is None or raw_nums.decode() != nums:
+            continue
+        if raw_terms is None or raw_terms.decode() != terms:
+            continue
+        sim = similarity(sig, [int(x) for x in raw_sig.decode().split(",")])
+        if sim >= best_sim:
+            best, best_sim = (entry_id.decode(), answer.decode()), sim
+    if best is None:
+        return None
+    await redis.hincrby(_entry_key(best[0]), "hits", 1)
+    logger.info("[faq] hit por similitud %.2f (%s)", best_sim, best[0])
+    return best[1]
+
+
+async def store(redis, norm: str, template: str) -> None:
+    sig = signature(norm)
+    entry_id = _entry_id(norm)
+    key = _entry_key(entry_id)
+    pipe = redis.pipeline()
+    pipe.hset(
+        key,
+        mapping={
+            "q": norm,
+            "sig": ",".join(map(str, sig)),
+            "nums": _numbers(norm),
+            "terms": _terms(norm),
+            "a": template,
+            "hits": 0,
+        },
+    )
+    pipe.expire(key, FAQ_CACHE_TTL_S)
+    for band, h in enumerate(_bands(sig)):
+        pipe.sadd(_band_key(band, h), entry_id)
+        pipe.expire(_band_key(band, h), FAQ_CACHE_TTL_S)
+    await pipe.execute()
@@ -1,13 +1,30 @@
 from __future__ import annotations
 
-from langchain_core.messages import SystemMessage
+import logging
+
+from langchain_core.messages import AIMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, MessagesState, StateGraph
 
+from common import tracing
+from common.redis_config import get_redis
+from services.llms import timeouts
 from services.llms.models import get_bedrock_model_master
+from services.llms.rate_limiter import INTERACTIVE
+from services.master import faq_cache
 from services.master.prompt import SYSTEM_PROMPT
 
-model = get_bedrock_model_master()
+logger = logging.getLogger(__name__)
+
+model = get_bedrock_model_master(INTERACTIVE)
+_redis = None
+
+
+def _faq_redis():
+    global _redis
+    if _redis is None:
+        _redis = get_redis()
+    return _redis
 
 
 def _nombre_corto_from_thread_id(thread_id: str) -> str:
@@ -26,9 +43,35 @@ async def agent_node(state: MessagesState, *, config: RunnableConfig) -> dict:
     conf = config.get("configurable") or {}
     thread_id = conf.get("thread_id", "cliente")
     nombre = _nombre_corto_from_thread_id(str(thread_id))
+
+    # Caché de FAQ solo sin contexto previo: primer mensaje del hilo o de una sesión nueva.
+    question = None
+    if conf.get("new_session") or len(state["messages"]) == 1:
+        last = state["messages"][-1].content
+        question = faq_cache.cacheable_question(last if isinstance(last, str) else "")
+    if question:
+        try:
+            with tracing.span("faq_cache.lookup") as span:
+                template = await faq_cache.lookup(_faq_redis(), question)
+                span.set(**{"faq.hit": template is not None})
+        except Exception:
+            logger.exception("[faq] lookup falló; se genera la respuesta")
+            template = None
+        if template is not None:
+            return {"messages": [AIMessage(content=faq_cache.fill(template, nombre))]}
+
     system = SystemMessage(content=SYSTEM_PROMPT.format(nombre_corto=nombre))
     messages = [system] + state["messages"]
-    response = await model.ainvoke(messages)
+    response = await timeouts.turn(model, messages, label="master.agent")
+    # Solo se guarda lo contestado sin historial: con new_session el hilo ya trae turnos viejos
+    # que la respuesta pudo usar.
+    if question and len(state["messages"]) == 1 and isinstance(response.content, str):
+        template = faq_cache.to_template(response.content, nombre)
+        if template:
+            try:
+                await faq_cache.store(_faq_redis(), question, template)
+            except Exception:
+                logger.exception("[faq] no se pudo guardar la respuesta")
     return {"messages": [response]}
 
 
@@ -1,15 +1,18 @@
 import asyncio
 import logging
-import os
 from langchain_core.messages import HumanMessage
-from langgraph.checkpoint.redis import AsyncRedisSaver
-from common.redis_config import get_redis
-from common.post_close_kafka import send_reply_set_post_close_if_marker
+from common import deadletter, idempotency, tracing, turns
+from common.redis_config import get_redis, get_checkpointer
+from common.admission import track_llm_turn
+from services.llms import usage
 from common.kafka_config import (
     get_producer,
     send_chat_response,
     ensure_redis_stream_group,
     xreadgroup_with_recovery,
+    STREAM_CONSUMER,
+    drain_on_sigterm,
+    draining,
 )
 from common.conversation_store import init_db, save_conversation
 from services.master.graph import build_graph
@@ -17,8 +20,6 @@ from services.master.graph import build_graph
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-
 
 def _text_from_message_content(content) -> str:
     """Converse (Bedrock) a veces devuelve str o lista de bloques; unificamos a str."""
@@ -38,24 +39,26 @@ def _text_from_message_content(content) -> str:
 
 
 async def run_master():
+    tracing.init_tracing("master")
     await init_db()
 
     redis = get_redis()
     await ensure_redis_stream_group(redis, "to-master", "master-group")
     producer = get_producer()
     await producer.start()
+    drain_on_sigterm()
 
-    async with AsyncRedisSaver.from_conn_string(REDIS_URL) as checkpointer:
+    async with get_checkpointer() as checkpointer:
         graph = build_graph().compile(checkpointer=checkpointer)
 
         logger.info("🧠 Master activo en stream:to-master...")
 
-        while True:
+        while not draining():
             results = await xreadgroup_with_recovery(
                 redis,
                 "to-master",
                 "master-group",
-                "worker-1",
+                STREAM_CONSUMER,
                 count=1,
                 block=1000,
             )
@@ -65,61 +68,124 @@ async def run_master():
 
             for _, messages in results:
                 for msg_id, data in messages:
-                    customer_id = "unknown"
-                    try:
-                        customer_id = data[b"customerId"].decode().strip()
-                        contenido = data[b"contenido"].decode()
-                        config = {"configurable": {"thread_id": customer_id}}
-
-                        result = await graph.ainvoke(
-                            {"messages": [HumanMessage(content=contenido)]},
-                            config=config,
-                        )
-                        raw = result["messages"][-1].content
-                        respuesta = _text_from_message_content(raw)
-
-                        if "[DERIVAR]" in respuesta:
-                            await redis.delete(f"brain_workflow:{customer_id}")
-                            await redis.set(
-                                f"session:{customer_id}", "to-brain", ex=1800
-                            )
-                            await redis.xadd(
-                                "to-brain",
+                    with tracing.stream_span("master.turn", "to-master", msg_id, data):
+                        customer_id = "unknown"
+                        retry = False
+                        started_at = None
+                        turn_lease = None
+                        try:
+                            customer_id = data[b"customerId"].decode().strip()
+                            if await idempotency.replay(redis, producer, "to-master", msg_id, customer_id):
+                                continue
+                            if not await deadletter.admit(redis, "to-master", msg_id, data):
+                                continue
+                            turn_lease = await turns.lease(redis, customer_id)
+                            if turn_lease is None:
+                                # Otro worker está con un turno de este cliente: vuelve en un rato.
+                                await deadletter.postpone(
+                                    redis, "to-master", msg_id, turns.TURN_LEASE_RETRY_S
+                                )
+                                retry = True
+                                continue
+                            contenido = data[b"contenido"].decode()
+                            turn_id = data.get(b"turnId", b"").decode()
+                            config = tracing.graph_config(
                                 {
-                                    "customerId": customer_id,
-                                    "contenido": contenido,
-                                    "contexto": respuesta.replace(
-                                        "[DERIVAR]", ""
-                                    ).strip(),
-                                },
-                            )
-                            logger.info("➡️ Derivando %s a brain", customer_id)
-                        else:
-                            await send_reply_set_post_close_if_marker(
-                                redis, producer, customer_id, respuesta
+                                    "configurable": {
+                                        "thread_id": customer_id,
+                                        "new_session": data.get(b"newSession") == b"1",
+                                    }
+                                }
                             )
+                            input_id = turns.input_id("to-master", msg_id)
+                            # Reintento con el mensaje ya en el hilo: se sigue desde el checkpoint.
+                            resuming = await deadletter.redelivered(
+                                redis, "to-master", msg_id
+                            ) and await turns.has_input(graph, config, input_id)
+                            if not await turns.begin(redis, customer_id, turn_id, cancellable=not resuming):
+                                raise turns.TurnCancelled(customer_id)
+
+                            async with track_llm_turn(redis, f"master:{msg_id.decode()}"), usage.turn(
+                                redis, "master", customer_id
+                            ):
+                                if resuming:
+                                    result = await graph.ainvoke(None, config=config)
+                                else:
+                                    started_at = turns.started()
+                                    result = await turns.run_cancellable(
+                                        redis,
+                                        customer_id,
+                                        turn_id,
+                                        graph.ainvoke(
+                                            {"messages": [HumanMessage(content=contenido, id=input_id)]},
+                                            config=config,
+                                        ),
+                                    )
+                            raw = result["messages"][-1].content
+                            respuesta = _text_from_message_content(raw)
+
+                            if "[DERIVAR]" in respuesta:
+                                await redis.delete(f"brain_workflow:{customer_id}")
+                                await redis.set(
+                                    f"session:{customer_id}", "to-brain", ex=1800
+                                )
+                                await redis.xadd(
+                                    "to-brain",
+                                    tracing.inject_fields(
+                                        {
+                                            "customerId": customer_id,
+                                            "contenido": contenido,
+                                            "contexto": respuesta.replace(
+                                                "[DERIVAR]", ""
+                                            ).strip(),
+                                            "turnId": turn_id,
+                                        }
+                                    ),
+                                )
+                                await idempotency.mark_done(redis, "to-master", msg_id)
+                                logger.info("➡️ Derivando %s a brain", customer_id)
+                            else:
+                                if not await turns.finish(redis, customer_id, turn_id) and not resuming:
+                                    raise turns.TurnCancelled(customer_id)
+                                await idempotency.publish_once(
+                                    redis, producer, "to-master", msg_id, customer_id, respuesta
+                                )
+                                try:
+                                    await save_conversation(
+                                        customer_id, "master", result["messages"]
+                                    )
+                                except Exception:
+                                    logger.exception(
+                                        "save_conversation falló (la respuesta ya se envió)"
+                                    )
+                        except turns.TurnCancelled:
+                            # El texto de este turno ya viaja junto con el mensaje nuevo.
+                            logger.info("✂️ Turno de %s reemplazado por un mensaje nuevo", customer_id)
+                            await turns.rollback(graph, config, started_at)
+                            await idempotency.mark_done(redis, "to-master", msg_id)
+                        except Exception as e:
+                            logger.exception("Error en master para %s", customer_id)
+                            # Si le quedan intentos queda pendiente (sin ack) y vuelve con backoff.
+                            retry = await deadletter.failed(redis, "to-master", msg_id, data, e)
+                            if retry:
+                                continue
                             try:
-                                await save_conversation(
-                                    customer_id, "master", result["messages"]
+                                await send_chat_response(
+                                    producer,
+                                    customer_id,
+                                    "Tuvimos un error al generar la respuesta. Probá de nuevo en un rato.",
                                 )
                             except Exception:
                                 logger.exception(
-                                    "save_conversation falló (la respuesta ya se envió)"
+                                    "No se pudo publicar error a chat-response"
                                 )
-                    except Exception:
-                        logger.exception("Error en master para %s", customer_id)
-                        try:
-                            await send_chat_response(
-                                producer,
-                                customer_id,
-                                "Tuvimos un error al generar la respuesta. Probá de nuevo en un rato.",
-                            )
-                        except Exception:
-                            logger.exception(
-                                "No se pudo publicar error a chat-response"
-                            )
-                    finally:
-                        await redis.xack("to-master", "master-group", msg_id)
+                        finally:
+                            if turn_lease is not None:
+                                await turn_lease.release()
+                            if not retry:
+                                await deadletter.ack(redis, "to-master", "master-group", msg_id)
+
+    await producer.stop()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,10 @@
 package com.bank.bank_ia.services.impl;
 
+import java.nio.charset.StandardCharsets;
 import java.util.Objects;
+import java.util.concurrent.ThreadLocalRandom;
 
+import org.apache.kafka.clients.producer.ProducerRecord;
 import org.springframework.kafka.core.KafkaTemplate;
 import org.springframework.stereotype.Service;
 
@@ -22,6 +25,16 @@ public class ChatProducerServiceImpl implements ChatProducerService {
     public void enviarMensaje(ChatRequestDTO request) {
         String customerId = Objects.requireNonNullElse(request.getCustomerId(), "anonymous");
         log.info("Publicando mensaje de {} en chat-queries", customerId);
-        kafkaTemplate.send("chat-queries", customerId, request);
+        ProducerRecord<String, ChatRequestDTO> record = new ProducerRecord<>("chat-queries", customerId, request);
+        String traceparent = nuevoTraceparent();
+        record.headers().add("traceparent", traceparent.getBytes(StandardCharsets.US_ASCII));
+        log.debug("traceparent {} para {}", traceparent, customerId);
+        kafkaTemplate.send(record);
+    }
+
+    /** Raíz de la traza W3C (00-traceId-spanId-01) que sigue los saltos en ai-brain-python. */
+    private static String nuevoTraceparent() {
+        ThreadLocalRandom rnd = ThreadLocalRandom.current();
+        return String.format("00-%016x%016x-%016x-01", rnd.nextLong(), rnd.nextLong(), rnd.nextLong());
     }
 }